@@ -0,0 +1,125 @@
+import json
+import os
+import threading
+import time
+
+AGENT_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "guest_agent.py")
+
+# Redeploy backoff after the stream breaks (seconds)
+MIN_BACKOFF = 2
+MAX_BACKOFF = 300
+# Streams nobody asked for in this long are shut down
+IDLE_TIMEOUT = 60
+
+class AgentStream:
+    """One long-lived channel streaming JSON samples from guest_agent.py."""
+
+    def __init__(self, ssh_pool, server_config, script, interval):
+        self.ssh_pool = ssh_pool
+        self.server_config = server_config
+        self.script = script
+        self.interval = interval
+        self.latest = None # {"stats": {...}, "timestamp": float}
+        self.last_request = time.time()
+        self.channel = None
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, name=f"agent-{server_config['id']}", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        backoff = MIN_BACKOFF
+        while not self.stop_event.is_set():
+            if time.time() - self.last_request > IDLE_TIMEOUT:
+                break
+            try:
+                if self._stream():
+                    backoff = MIN_BACKOFF # Got samples: the agent works, retry soon
+            except Exception as e:
+                print(f"Agent stream error on {self.server_config['id']}: {e}")
+            finally:
+                self._close_channel()
+            self.stop_event.wait(backoff)
+            backoff = min(backoff * 2, MAX_BACKOFF)
+
+    def _stream(self):
+        """Deploy the agent and consume its output until the channel ends.
+        Returns True if at least one sample was received."""
+        channel = self.ssh_pool.open_session(self.server_config)
+        self.channel = channel
+        # A stalled agent (frozen guest) must not block us forever
+        channel.settimeout(max(10, self.interval * 10))
+        channel.exec_command(f"python3 -u - {self.interval}")
+        channel.sendall(self.script)
+        channel.shutdown_write() # EOF ends the script; python3 then runs it
+
+        received = False
+        for line in channel.makefile('r'):
+            if self.stop_event.is_set() or time.time() - self.last_request > IDLE_TIMEOUT:
+                break
+            try:
+                sample = json.loads(line)
+            except ValueError:
+                continue
+            stats = {"cpu": sample.get("cpu", 0), "ram": sample.get("ram", 0), "disk": sample.get("disk", 0)}
+            self.latest = {"stats": stats, "timestamp": time.time()}
+            received = True
+        return received
+
+    def _close_channel(self):
+        if self.channel is not None:
+            try:
+                self.channel.close()
+            except Exception:
+                pass
+            self.channel = None
+
+    def get_latest(self, max_age):
+        self.last_request = time.time()
+        latest = self.latest
+        if latest is None or time.time() - latest["timestamp"] > max_age:
+            return None
+        return latest["stats"]
+
+    def is_alive(self):
+        return self.thread.is_alive()
+
+    def stop(self):
+        self.stop_event.set()
+        self._close_channel()
+
+
+class AgentManager:
+    """Keeps a streaming guest agent per server (optional stats mode).
+
+    The agent is (re)deployed on demand with exponential backoff; while it has
+    no fresh sample, get_stats returns None and callers fall back to the
+    exec-based sampler.
+    """
+
+    def __init__(self, ssh_pool, interval=1.0):
+        self.ssh_pool = ssh_pool
+        self.interval = interval
+        with open(AGENT_SCRIPT, 'rb') as f:
+            self.script = f.read()
+        self.streams = {} # {server_id: AgentStream}
+        self.lock = threading.Lock()
+
+    def get_stats(self, server_config):
+        server_id = server_config['id']
+        with self.lock:
+            stream = self.streams.get(server_id)
+            if stream is None or not stream.is_alive():
+                stream = AgentStream(self.ssh_pool, server_config, self.script, self.interval)
+                self.streams[server_id] = stream
+        # Anything older than a few agent ticks means the stream is stuck
+        return stream.get_latest(max_age=max(3 * self.interval, 5))
+
+    def stop(self, server_id):
+        with self.lock:
+            stream = self.streams.pop(server_id, None)
+        if stream is not None:
+            stream.stop()
+
+    def stop_all(self):
+        for server_id in list(self.streams):
+            self.stop(server_id)
@@ -2,7 +2,8 @@
 const API_BASE = 'http://127.0.0.1:5000'; // Define backend URL
 const state = {
     servers: [],
-    intervals: {} // Store intervals for cleanup if needed
+    intervals: {}, // Store intervals for cleanup if needed
+    eventsConnected: false // Server push active: no need to poll status/stats
 };
 
 // DOM Elements
@@ -11,9 +12,64 @@ const container = document.getElementById('dashboard-container');
 // Initial Load
 document.addEventListener('DOMContentLoaded', () => {
     loadConfig(); // Load UI immediately
-    setInterval(updateStatus, 5000); // Start polling
+    connectEvents(); // Status, stats, console and frame updates are pushed
+    setInterval(tick, 5000); // Thumbnails (and everything, if push is down)
 });
 
+function tick() {
+    if (!state.eventsConnected) {
+        updateStatus(); // Fallback polling
+        return;
+    }
+    state.servers.forEach(server => {
+        if (server.status === 'running') updateScreenshot(server.id, server.name);
+    });
+}
+
+function connectEvents() {
+    // EventSource reconnects by itself; while it's down tick() polls instead
+    const events = new EventSource(`${API_BASE}/api/events`);
+    events.onopen = () => { state.eventsConnected = true; };
+    events.onerror = () => { state.eventsConnected = false; };
+
+    events.addEventListener('status', (e) => {
+        const update = JSON.parse(e.data);
+        const server = state.servers.find(s => s.id === update.id);
+        if (!server) return;
+        server.status = update.status;
+        updateServers([server]);
+        if (server.status === 'running') updateScreenshot(server.id, server.name);
+    });
+
+    events.addEventListener('stats', (e) => {
+        const stats = JSON.parse(e.data);
+        if (document.getElementById(`cpu-${stats.id}`)) updateStatsUI(stats.id, stats);
+    });
+
+    events.addEventListener('frame', (e) => {
+        // Someone captured a changed frame (e.g. a fullscreen viewer): refresh the thumbnail
+        const frame = JSON.parse(e.data);
+        const server = state.servers.find(s => s.name === frame.name);
+        if (server) updateScreenshot(server.id, server.name);
+    });
+
+    events.addEventListener('console', (e) => {
+        const data = JSON.parse(e.data);
+        if (data.session !== 'default') return; // Named sessions belong to other clients
+        appendConsole(data.id, data.output);
+    });
+}
+
+function appendConsole(id, output) {
+    const consoleOut = document.getElementById(`console-${id}`);
+    if (consoleOut && output) {
+        // Simple cleaning
+        const safeOutput = output.replace(/</g, '&lt;').replace(/>/g, '&gt;');
+        consoleOut.innerHTML += safeOutput;
+        consoleOut.scrollTop = consoleOut.scrollHeight;
+    }
+}
+
 async function loadConfig() {
     try {
         const response = await fetch(`${API_BASE}/api/config`);
@@ -190,19 +246,36 @@ async function restartServer(name) {
 function updateScreenshot(id, name) {
     const img = document.getElementById(`live-img-${id}`);
     if (img) {
-        // Add timestamp to prevent caching
-        const timestamp = new Date().getTime();
-        // Use a background loader or just let it update
-        // We can check if image loads successfully
-        const newSrc = `${API_BASE}/api/server/${name}/screenshot?t=${timestamp}`;
+        // The grid only needs a small thumbnail; fullscreen pulls the full-size PNG
+        loadFrame(img, name, 'format=webp&width=480&quality=70').catch(() => { /* keep the last frame */ });
+    }
+}
+
+// Last frame id shown per <img>, so an unchanged console comes back as a 304
+const frameIds = {};
+
+// Fetch the latest frame into img; resolves true if a new frame is shown
+async function loadFrame(img, name, params = '') {
+    const query = new URLSearchParams(params);
+    if (frameIds[img.id]) query.set('since', frameIds[img.id]);
+    const response = await fetch(`${API_BASE}/api/server/${name}/screenshot?${query}`, { cache: 'no-cache' });
+    if (response.status === 304) return false;
+    if (!response.ok) throw new Error(`Screenshot not available (${response.status})`);
 
-        // Optional: Preload to avoid flickering
+    frameIds[img.id] = response.headers.get('X-Frame-Id');
+    const newSrc = URL.createObjectURL(await response.blob());
+
+    // Preload to avoid flickering, then release the previous blob
+    await new Promise((resolve, reject) => {
         const loader = new Image();
-        loader.onload = () => {
-            if (img) img.src = newSrc;
-        };
+        loader.onload = resolve;
+        loader.onerror = reject;
         loader.src = newSrc;
-    }
+    });
+    const oldSrc = img.src;
+    img.src = newSrc;
+    if (oldSrc.startsWith('blob:')) URL.revokeObjectURL(oldSrc);
+    return true;
 }
 
 async function fetchStats(id) {
@@ -284,34 +357,6 @@ async function sendSSHCommand(id) {
     }
 }
 
-// Poll for console output
-setInterval(updateConsoles, 1000);
-
-async function updateConsoles() {
-    state.servers.forEach(async (server) => {
-        if (server.status !== 'running') return;
-
-        try {
-            const response = await fetch(`${API_BASE}/api/server/${server.id}/console/output`);
-            const data = await response.json();
-
-            if (data.output) {
-                const consoleOut = document.getElementById(`console-${server.id}`);
-                if (consoleOut) {
-                    // Simple cleaning
-                    const safeOutput = data.output.replace(/</g, '&lt;').replace(/>/g, '&gt;');
-                    consoleOut.innerHTML += safeOutput;
-                    consoleOut.scrollTop = consoleOut.scrollHeight;
-                }
-            }
-        } catch (e) {
-            // silent fail
-        }
-    });
-}
-
-
-
 function handleEnter(event, id, name) {
     if (event.key === 'Enter') {
         sendCommand(id, name);
@@ -334,13 +379,12 @@ function openFullscreen(id, name) {
     currentFullscreenServerName = name;
 
     // Clear previous source
-    fsImg.src = '';
+    fsImg.removeAttribute('src');
     // Clear input
     if (input) input.value = '';
 
     // Set initial content
     label.textContent = name;
-    fsImg.src = `${API_BASE}/api/server/${name}/screenshot?t=${new Date().getTime()}`;
 
     // Show overlay
     overlay.classList.add('active');
@@ -348,33 +392,20 @@ function openFullscreen(id, name) {
     // Focus input automatically
     if (input) setTimeout(() => input.focus(), 100);
 
-    // Start "Live" loop using recursive timeout to avoid stacking if loading is slow
-    const updateLoop = () => {
-        if (!overlay.classList.contains('active')) return;
-
-        const timestamp = new Date().getTime();
-        const newSrc = `${API_BASE}/api/server/${name}/screenshot?t=${timestamp}`;
-
-        const loader = new Image();
-        loader.onload = () => {
-            if (overlay.classList.contains('active')) {
-                fsImg.src = newSrc;
-                // Schedule next update only after load is complete (approx 200ms delay for "live" feel)
-                fullScreenInterval = setTimeout(updateLoop, 200);
-            }
-        };
-        loader.onerror = () => {
-            // Retry even on error but slightly slower
-            if (overlay.classList.contains('active')) {
-                fullScreenInterval = setTimeout(updateLoop, 500);
-            }
-        };
-        loader.src = newSrc;
+    // Live view: one long-lived multipart response. The server paces frames and
+    // only pushes changed ones, so there is no client-side polling loop.
+    if (fullScreenInterval) clearTimeout(fullScreenInterval); // Clear any pending reconnect
+    fsImg.onerror = () => {
+        // Stream dropped (VM stopped, backend restarted): reconnect while still open
+        if (overlay.classList.contains('active')) {
+            fullScreenInterval = setTimeout(() => { fsImg.src = streamUrl(name); }, 1000);
+        }
     };
+    fsImg.src = streamUrl(name);
+}
 
-    // Start the loop
-    if (fullScreenInterval) clearTimeout(fullScreenInterval); // Clear any existing
-    updateLoop();
+function streamUrl(name) {
+    return `${API_BASE}/api/server/${name}/stream?fps=5&format=jpeg&quality=85&t=${new Date().getTime()}`;
 }
 
 function closeFullscreen() {
@@ -388,6 +419,11 @@ function closeFullscreen() {
         clearTimeout(fullScreenInterval); // Changed to clearTimeout
         fullScreenInterval = null;
     }
+
+    // Dropping the source closes the stream, which stops server-side capture
+    const fsImg = document.getElementById('fullscreen-img');
+    fsImg.onerror = null;
+    fsImg.removeAttribute('src');
 }
 
 // Fullscreen Command Handlers
@@ -409,8 +445,7 @@ async function sendFullscreenCommand() {
             body: JSON.stringify({ text: command })
         });
 
-        // Force refresh is handled by the interval basically, but we can try to force one
-        // Note: The loop runs every second.
+        // No refresh needed: the stream pushes the changed screen
     } catch (error) {
         console.error("Type error", error);
     }
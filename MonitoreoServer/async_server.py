@@ -0,0 +1,735 @@
+"""Asyncio entry point serving the same /api routes as server.py.
+
+    py async_server.py
+
+Needs aiohttp and asyncssh (pip install aiohttp asyncssh). VBoxManage runs as
+asyncio subprocesses and stats / fleet exec go over asyncssh, so waiting on
+VirtualBox or on a guest never holds a thread, and SSE, MJPEG streams and
+console long-polls are plain coroutines. Interactive shells and background
+jobs (ssh_exec included, as in server.py) reuse the thread-based ShellManager
+and JobManager (a thread per open session or running job, never per request). The guest agent stats
+mode is not available here; stats always use the /proc sampler.
+"""
+import asyncio
+import json
+import os
+import socket
+import tempfile
+import time
+from contextlib import nullcontext
+
+import asyncssh
+from aiohttp import web
+
+import vm_manager as vm_module
+from vm_manager import VMManager, VBOX_MAX_WORKERS, STATUS_TTL, SCREENSHOT_DIR, STATS_TIMEOUT
+from ssh_pool import KEEPALIVE_INTERVAL
+from proc_sampler import ProcSampler, STATS_COMMAND
+from frame_store import Frame, FRAME_MAX_AGE
+from image_codec import can_transcode, image_params
+from event_hub import EventHub
+from jobs import DEFAULT_JOB_TIMEOUT, MAX_JOB_OUTPUT, FANOUT_MAX_PARALLELISM, select_servers
+from shell_manager import DEFAULT_SESSION
+import metrics
+from metrics import (HTTP_REQUEST_SECONDS, CACHE_REQUESTS, VBOX_COMMAND_SECONDS, VBOX_COMMAND_ERRORS,
+                     SSH_SECONDS, SSH_ERRORS)
+# Shared configuration and thread-safe state of the Flask app
+from server import (vm_manager, shell_manager, metric_history, event_hub, job_manager, tile_encoder,
+                    STATS_INTERVAL, STREAM_MAX_FPS, STREAM_KEEPALIVE, EVENTS_KEEPALIVE,
+                    CONSOLE_MAX_WAIT_MS, SSH_EXEC_WAIT, ssh_exec_reply)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class AsyncVBox:
+    """VBoxManage as asyncio subprocesses: FIFO per VM, globally capped."""
+
+    def __init__(self, max_workers=VBOX_MAX_WORKERS):
+        self.semaphore = asyncio.Semaphore(max_workers)
+        self.vm_locks = {} # {vm: asyncio.Lock}, which wakes waiters in order
+
+    async def run(self, args, check=False):
+        """Returns (returncode, stdout, stderr); with check, raises on failure."""
+        vm = VMManager._vbox_target(args)
+        subcommand = VMManager._vbox_subcommand(args)
+        lock = self.vm_locks.setdefault(vm, asyncio.Lock()) if vm else nullcontext()
+        submitted = time.perf_counter()
+        async with lock:
+            async with self.semaphore:
+                started = time.perf_counter()
+                try:
+                    proc = await asyncio.create_subprocess_exec(
+                        vm_module.VBOX_MANAGE_CMD, *args,
+                        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+                    out, err = await proc.communicate()
+                except Exception as e:
+                    # Same trace ring and metrics as the threaded executor (/api/vbox/trace, /metrics)
+                    VBOX_COMMAND_SECONDS.observe(time.perf_counter() - started, subcommand=subcommand)
+                    VBOX_COMMAND_ERRORS.inc(subcommand=subcommand)
+                    vm_manager.vbox_trace.record(VMManager._traced_args(args), vm, subcommand,
+                                                 started - submitted, time.perf_counter() - started, error=str(e))
+                    raise
+        VBOX_COMMAND_SECONDS.observe(time.perf_counter() - started, subcommand=subcommand)
+        out, err = out.decode(errors='replace'), err.decode(errors='replace')
+        vm_manager.vbox_trace.record(VMManager._traced_args(args), vm, subcommand, started - submitted,
+                                     time.perf_counter() - started, proc.returncode, err)
+        if proc.returncode != 0:
+            VBOX_COMMAND_ERRORS.inc(subcommand=subcommand)
+        if check and proc.returncode != 0:
+            raise RuntimeError(err.strip() or f"VBoxManage exited with {proc.returncode}")
+        return proc.returncode, out, err
+
+
+class AsyncSSHPool:
+    """One asyncssh connection per server with keepalives and reconnect."""
+
+    def __init__(self, connect_timeout=3, keepalive=KEEPALIVE_INTERVAL):
+        self.connect_timeout = connect_timeout
+        self.keepalive = keepalive
+        self.conns = {} # {server_id: SSHClientConnection}
+        self.locks = {} # {server_id: asyncio.Lock} serializes (re)connects
+
+    async def get(self, server):
+        async with self.locks.setdefault(server['id'], asyncio.Lock()):
+            conn = self.conns.get(server['id'])
+            if conn is not None and not conn.is_closed():
+                return conn
+            address = (server['ip'], server.get('ssh_port', 22))
+            options = dict(port=address[1], username=server['ssh_user'],
+                           known_hosts=None, keepalive_interval=self.keepalive,
+                           connect_timeout=self.connect_timeout)
+            # Prioritize key auth if path provided
+            if server.get('ssh_key_path'):
+                options['client_keys'] = [server['ssh_key_path']]
+            else:
+                options['password'] = server['ssh_password']
+            # TCP connect first, on its own, so /metrics has the same phases as SSHPool
+            started = time.perf_counter()
+            try:
+                sock = await in_thread(socket.create_connection, address, self.connect_timeout)
+            except OSError:
+                SSH_ERRORS.inc(server=server['id'], phase="connect")
+                raise
+            connected = time.perf_counter()
+            SSH_SECONDS.observe(connected - started, server=server['id'], phase="connect")
+            try:
+                conn = await asyncssh.connect(address[0], sock=sock, **options)
+            except Exception:
+                SSH_ERRORS.inc(server=server['id'], phase="auth")
+                sock.close()
+                raise
+            SSH_SECONDS.observe(time.perf_counter() - connected, server=server['id'], phase="auth")
+            self.conns[server['id']] = conn
+            return conn
+
+    def invalidate(self, server_id):
+        conn = self.conns.pop(server_id, None)
+        if conn is not None:
+            conn.close()
+
+    async def run(self, server, command, timeout=None, max_output=None):
+        """Same result shape as VMManager.run_command."""
+        result = {"exit_code": None, "stdout": "", "stderr": "", "duration": 0, "error": None, "truncated": False}
+        started = time.time()
+        for attempt in range(2):
+            try:
+                conn = await self.get(server)
+            except Exception as e:
+                result["error"] = f"Could not connect via SSH: {e}"
+                break
+            exec_started = time.perf_counter()
+            try:
+                completed = await asyncio.wait_for(conn.run(command, check=False), timeout)
+                SSH_SECONDS.observe(time.perf_counter() - exec_started, server=server['id'], phase="exec")
+                result["exit_code"] = completed.exit_status
+                result["stdout"], result["stderr"] = completed.stdout or "", completed.stderr or ""
+                result["error"] = None
+                break
+            except asyncio.TimeoutError:
+                SSH_ERRORS.inc(server=server['id'], phase="exec")
+                result["error"] = "timeout"
+                break
+            except (asyncssh.Error, OSError) as e:
+                # Pooled connection died under us: reconnect once
+                SSH_ERRORS.inc(server=server['id'], phase="exec")
+                self.invalidate(server['id'])
+                result["error"] = f"Error executing command: {e}"
+        if max_output:
+            for key in ("stdout", "stderr"):
+                if len(result[key]) > max_output:
+                    result[key] = result[key][-max_output:]
+                    result["truncated"] = True
+        result["duration"] = round(time.time() - started, 3)
+        return result
+
+    def close_all(self):
+        for server_id in list(self.conns):
+            self.invalidate(server_id)
+
+
+class AsyncBackend:
+    """Status cache, stats sampler and frame store driven by the event loop."""
+
+    def __init__(self):
+        self.vbox = AsyncVBox()
+        self.ssh = AsyncSSHPool()
+        self.proc_sampler = ProcSampler()
+        self.status_lock = asyncio.Lock()
+        self.status_cache = None
+        self.status_cache_time = 0
+        self.statuses = {} # {server_id: last published status}
+        self.samples = {}  # {server_id: {"stats": {...}, "timestamp": float}}
+        self.frames = {}   # {vm_name: Frame}
+        self.inflight = {} # {vm_name: asyncio.Future}
+        self.loop = None # Set on startup; config reloads happen on the watcher thread
+        vm_manager.reload_listeners.append(self._on_config_change)
+
+    def find_server(self, server_id):
+        return vm_manager.find_server(server_id)
+
+    def _on_config_change(self, server_ids, old_entries):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._forget_servers, server_ids, old_entries)
+
+    def _forget_servers(self, server_ids, old_entries):
+        self.status_cache = None
+        for server_id in server_ids:
+            self.ssh.invalidate(server_id)
+            self.proc_sampler.forget(server_id)
+            self.samples.pop(server_id, None)
+            self.statuses.pop(server_id, None)
+        for server in old_entries.values():
+            self.frames.pop(server.get('name'), None)
+
+    # -- VM state -----------------------------------------------------------
+
+    async def get_servers(self):
+        try:
+            states = await self._get_states()
+        except FileNotFoundError:
+            states, fallback = None, "error_vbox_missing"
+        except Exception as e:
+            print(f"Error listing VM states: {e}")
+            states, fallback = None, "error"
+        for server in vm_manager.servers:
+            if states is None:
+                server['status'] = fallback
+            else:
+                server['status'] = states.get(server.get('name')) or states.get(server.get('vbox_uuid')) or "unknown"
+        return vm_manager.servers
+
+    async def _get_states(self):
+        async with self.status_lock:
+            if self.status_cache is not None and time.time() - self.status_cache_time < STATUS_TTL:
+                CACHE_REQUESTS.inc(cache="status", result="hit")
+                return self.status_cache
+            CACHE_REQUESTS.inc(cache="status", result="miss")
+            code, out, err = await self.vbox.run(["list", "--long", "vms"])
+            if code != 0:
+                raise RuntimeError(err.strip())
+            self.status_cache = VMManager._parse_vm_states(out)
+            self.status_cache_time = time.time()
+            return self.status_cache
+
+    async def power(self, args, message):
+        try:
+            await self.vbox.run(args, check=True)
+            self.status_cache = None
+            return True, message
+        except Exception as e:
+            return False, str(e)
+
+    # -- Stats --------------------------------------------------------------
+
+    async def collect_loop(self):
+        while True:
+            started = time.time()
+            try:
+                await self.collect_once()
+            except Exception as e:
+                print(f"Error collecting stats: {e}")
+            await asyncio.sleep(max(0, STATS_INTERVAL - (time.time() - started)))
+
+    async def collect_once(self):
+        servers = await self.get_servers()
+        for server in servers:
+            status = server.get('status')
+            if self.statuses.get(server['id']) != status:
+                self.statuses[server['id']] = status
+                event_hub.publish("status", {"id": server['id'], "name": server.get('name'), "status": status},
+                                  key=server['id'])
+                if status != 'running':
+                    event_hub.forget("stats", server['id'])
+
+        running = [s for s in servers if s.get('status') == 'running']
+        results = await asyncio.gather(*(self.ssh.run(s, STATS_COMMAND, timeout=STATS_TIMEOUT) for s in running))
+        for server, result in zip(running, results):
+            if result["error"]:
+                stats = {"cpu": 0, "ram": 0, "disk": 0, "error": result["error"]}
+            else:
+                stats = self.proc_sampler.parse(server['id'], result["stdout"])
+            timestamp = time.time()
+            self.samples[server['id']] = {"stats": stats, "timestamp": timestamp}
+            metric_history.record(server['id'], timestamp, stats)
+            event_hub.publish("stats", dict(stats, id=server['id'], timestamp=timestamp), key=server['id'])
+
+        running_ids = {s['id'] for s in running}
+        for server_id in list(self.samples):
+            if server_id not in running_ids:
+                del self.samples[server_id]
+
+    # -- Frames -------------------------------------------------------------
+
+    async def get_frame(self, vm_name, max_age=FRAME_MAX_AGE):
+        """Async twin of FrameStore.get: fresh frames are shared, captures are single-flight."""
+        frame = self.frames.get(vm_name)
+        if frame is not None and time.time() - frame.timestamp <= max_age:
+            return frame
+        future = self.inflight.get(vm_name)
+        if future is not None:
+            return await asyncio.shield(future)
+
+        future = self.inflight[vm_name] = asyncio.get_running_loop().create_future()
+        frame = None
+        try:
+            data = await self._capture(vm_name)
+            if data:
+                frame = Frame(data, time.time())
+                previous = self.frames.get(vm_name)
+                if previous is not None and previous.digest == frame.digest:
+                    frame.frame_id = previous.frame_id
+                    frame.inherit_variants(previous)
+                else:
+                    event_hub.publish("frame", {"name": vm_name, "frame_id": frame.frame_id})
+                self.frames[vm_name] = frame
+        finally:
+            del self.inflight[vm_name]
+            future.set_result(frame)
+        return frame
+
+    async def _capture(self, vm_name):
+        fd, path = tempfile.mkstemp(prefix=f"screenshot_{vm_name}_", suffix=".png", dir=SCREENSHOT_DIR)
+        os.close(fd)
+        try:
+            await self.vbox.run(["controlvm", vm_name, "screenshotpng", path], check=True)
+            with open(path, 'rb') as f:
+                return f.read()
+        except Exception:
+            # It might fail if VM is not running
+            return None
+        finally:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+# -- Helpers -----------------------------------------------------------------
+
+def backend_of(request):
+    return request.app['backend']
+
+def bad_request(message):
+    return web.json_response({"error": message}, status=400)
+
+async def in_thread(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+async def wait_for_session(session, predicate, timeout):
+    """Wait until predicate() holds or timeout, woken by the session's reader thread."""
+    if predicate() or not timeout:
+        return
+    loop = asyncio.get_running_loop()
+    event = asyncio.Event()
+    wake = lambda: loop.call_soon_threadsafe(event.set)
+    session.add_watcher(wake)
+    try:
+        deadline = loop.time() + timeout
+        while not predicate():
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return
+            try:
+                await asyncio.wait_for(event.wait(), remaining)
+            except asyncio.TimeoutError:
+                return
+            event.clear()
+    finally:
+        session.remove_watcher(wake)
+
+@web.middleware
+async def cors(request, handler):
+    # Same open CORS policy as flask_cors in server.py
+    if request.method == 'OPTIONS':
+        response = web.Response()
+        response.headers['Access-Control-Allow-Methods'] = 'GET, POST, DELETE, OPTIONS'
+        response.headers['Access-Control-Allow-Headers'] = request.headers.get('Access-Control-Request-Headers', '*')
+    else:
+        response = await handler(request)
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    response.headers['Access-Control-Expose-Headers'] = 'ETag, X-Frame-Id'
+    return response
+
+
+@web.middleware
+async def timing(request, handler):
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await handler(request)
+        status = response.status
+        return response
+    except web.HTTPException as e:
+        status = e.status
+        raise
+    finally:
+        resource = request.match_info.route.resource
+        route = resource.canonical if resource is not None else "unmatched"
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, method=request.method,
+                                     route=route, status=status)
+
+
+# -- Routes ------------------------------------------------------------------
+
+routes = web.RouteTableDef()
+
+@routes.get('/metrics')
+async def get_metrics(request):
+    # Prometheus text exposition format
+    return web.Response(body=metrics.render().encode(), headers={'Content-Type': 'text/plain; version=0.0.4'})
+
+@routes.get('/api/vbox/trace')
+async def get_vbox_trace(request):
+    try:
+        limit = min(max(int(request.query.get('limit', 100)), 1), 1000)
+        since = int(request.query.get('since', 0))
+    except ValueError:
+        return bad_request("limit and since must be integers")
+    calls = vm_manager.vbox_trace.recent(limit, request.query.get('vm'), since)
+    return web.json_response({"calls": calls, "summary": vm_manager.vbox_trace.summary(calls)})
+
+@routes.get('/api/servers')
+async def get_servers(request):
+    return web.json_response(await backend_of(request).get_servers())
+
+@routes.get('/api/config')
+async def get_config(request):
+    return web.json_response(vm_manager.get_server_config())
+
+@routes.post('/api/config/reload')
+async def reload_config(request):
+    return web.json_response(await in_thread(vm_manager.reload_config, True))
+
+@routes.post('/api/server/{name}/start')
+async def start_server(request):
+    success, message = await backend_of(request).power(
+        ["startvm", request.match_info['name'], "--type", "headless"], "VM started")
+    return web.json_response({"success": success, "message": message})
+
+@routes.post('/api/server/{name}/stop')
+async def stop_server(request):
+    backend, name = backend_of(request), request.match_info['name']
+    # Try ACPI shutdown first for graceful exit, force poweroff if needed
+    success, message = await backend.power(["controlvm", name, "acpipowerbutton"], "ACPI Shutdown signal sent")
+    if not success:
+        success, message = await backend.power(["controlvm", name, "poweroff"], "VM Forced Poweroff")
+    return web.json_response({"success": success, "message": message})
+
+@routes.post('/api/server/{name}/restart')
+async def restart_server(request):
+    success, message = await backend_of(request).power(
+        ["controlvm", request.match_info['name'], "reset"], "VM Restarted (Reset)")
+    return web.json_response({"success": success, "message": message})
+
+@routes.get('/api/server/{name}/screenshot')
+async def get_screenshot(request):
+    try:
+        fmt, width, quality = image_params(request.query, 'png')
+    except ValueError as e:
+        return bad_request(str(e))
+    frame = await backend_of(request).get_frame(request.match_info['name'])
+    if frame is None:
+        return web.Response(text="Screenshot not available", status=404)
+    data, mimetype, etag = await in_thread(frame.variant, fmt, width, quality)
+
+    headers = {'ETag': f'"{etag}"', 'X-Frame-Id': str(frame.frame_id), 'Cache-Control': 'no-cache'}
+    since = request.query.get('since')
+    if_none_match = request.headers.get('If-None-Match', '')
+    if (since and since == str(frame.frame_id)) or f'"{etag}"' in if_none_match or if_none_match.strip() == '*':
+        return web.Response(status=304, headers=headers)
+    return web.Response(body=data, content_type=mimetype, headers=headers)
+
+@routes.get('/api/server/{name}/stream')
+async def stream_screen(request):
+    try:
+        fmt, width, quality = image_params(request.query, 'jpeg')
+        fps = min(max(float(request.query.get('fps', 5)), 0.2), STREAM_MAX_FPS)
+    except ValueError as e:
+        return bad_request(str(e))
+    backend, name = backend_of(request), request.match_info['name']
+
+    response = web.StreamResponse(headers={'Content-Type': 'multipart/x-mixed-replace; boundary=frame',
+                                           'Cache-Control': 'no-cache'})
+    await response.prepare(request)
+    interval = 1.0 / fps
+    last_id = None
+    last_sent = last_ok = time.time()
+    try:
+        while True:
+            started = time.time()
+            frame = await backend.get_frame(name, max_age=interval)
+            if frame is None:
+                if started - last_ok > 5 * STREAM_KEEPALIVE:
+                    break
+            else:
+                last_ok = started
+            if frame is not None and (frame.frame_id != last_id or started - last_sent >= STREAM_KEEPALIVE):
+                data, mimetype, etag = await in_thread(frame.variant, fmt, width, quality)
+                last_id, last_sent = frame.frame_id, started
+                await response.write((f"--frame\r\nContent-Type: {mimetype}\r\nContent-Length: {len(data)}\r\n"
+                                      f"X-Frame-Id: {frame.frame_id}\r\n\r\n").encode() + data + b"\r\n")
+            await asyncio.sleep(max(0, interval - (time.time() - started)))
+    except (ConnectionResetError, asyncio.CancelledError):
+        pass # Client went away: stop capturing
+    return response
+
+@routes.get('/api/server/{name}/tiles')
+async def get_tiles(request):
+    if not can_transcode():
+        return web.json_response({"error": "Tile updates require Pillow"}, status=501)
+    try:
+        fmt, _, quality = image_params(request.query, 'png')
+        since = int(request.query['since']) if request.query.get('since') else None
+    except ValueError as e:
+        return bad_request(str(e))
+    name = request.match_info['name']
+    frame = await backend_of(request).get_frame(name)
+    if frame is None:
+        return web.Response(text="Screenshot not available", status=404)
+    if since == frame.frame_id:
+        return web.Response(status=304, headers={'X-Frame-Id': str(frame.frame_id)})
+    return web.json_response(await in_thread(tile_encoder.delta, name, frame, since, fmt, quality))
+
+@routes.get('/api/events')
+async def events(request):
+    sub = event_hub.subscribe(asyncio.get_running_loop())
+    shell_manager.touch_all() # Someone is watching the consoles again
+    response = web.StreamResponse(headers={'Content-Type': 'text/event-stream', 'Cache-Control': 'no-cache',
+                                           'X-Accel-Buffering': 'no'})
+    try:
+        await response.prepare(request)
+        await response.write(b"retry: 3000\n\n")
+        while True:
+            item = await sub.get(timeout=EVENTS_KEEPALIVE)
+            chunk = ": keepalive\n\n" if item is None else EventHub.format_sse(*item)
+            await response.write(chunk.encode())
+    except (ConnectionResetError, asyncio.CancelledError):
+        pass
+    finally:
+        event_hub.unsubscribe(sub)
+    return response
+
+@routes.get('/api/server/{id}/stats')
+async def get_stats(request):
+    backend, server_id = backend_of(request), request.match_info['id']
+    sample = backend.samples.get(server_id)
+    CACHE_REQUESTS.inc(cache="stats", result="miss" if sample is None else "hit")
+    if sample is None:
+        if backend.find_server(server_id) is None:
+            return web.json_response(None)
+        return web.json_response({"cpu": 0, "ram": 0, "disk": 0, "error": "No sample yet", "age": None})
+    stats = dict(sample["stats"], timestamp=sample["timestamp"], age=round(time.time() - sample["timestamp"], 3))
+    return web.json_response(stats)
+
+@routes.get('/api/server/{id}/stats/history')
+async def get_stats_history(request):
+    try:
+        end = float(request.query.get('to', time.time()))
+        start = float(request.query.get('from', end - 3600))
+        points = min(int(request.query.get('points', 300)), 2000)
+    except ValueError:
+        return bad_request("from, to and points must be numbers")
+    series = metric_history.query(request.match_info['id'], start, end, points)
+    return web.json_response({"from": start, "to": end, "series": series})
+
+@routes.post('/api/server/{id}/command')
+async def run_command(request):
+    data = await request.json()
+    success = await in_thread(shell_manager.send_input, request.match_info['id'], data.get('command'),
+                              data.get('session', DEFAULT_SESSION))
+    return web.json_response({"success": success})
+
+@routes.get('/api/server/{id}/console/output')
+async def get_console_output(request):
+    server_id, name = request.match_info['id'], request.query.get('session', DEFAULT_SESSION)
+    if request.query.get('since') is None:
+        output = await in_thread(shell_manager.get_output, server_id, None, 0, name)
+        return web.json_response({"output": output})
+    try:
+        since = int(request.query['since'])
+        wait = min(max(int(request.query.get('wait', 0)), 0), CONSOLE_MAX_WAIT_MS) / 1000
+    except ValueError:
+        return bad_request("since and wait must be integers")
+    session = await in_thread(shell_manager.get_session, server_id, name)
+    if session is None:
+        return web.json_response({"output": "", "offset": 0})
+    await wait_for_session(session, lambda: session.buffer.end != since or session.buffer.closed, wait)
+    output, offset = session.read(since)
+    return web.json_response({"output": output, "offset": offset})
+
+@routes.get('/api/server/{id}/console/screen')
+async def get_console_screen(request):
+    try:
+        since = int(request.query.get('since', 0))
+        wait = min(max(int(request.query.get('wait', 0)), 0), CONSOLE_MAX_WAIT_MS) / 1000
+    except ValueError:
+        return bad_request("since and wait must be integers")
+    session = await in_thread(shell_manager.get_session, request.match_info['id'],
+                              request.query.get('session', DEFAULT_SESSION))
+    if session is None:
+        return web.json_response({"error": "Console not available"}, status=404)
+    session.touch()
+    await wait_for_session(session, lambda: session.screen.version != since or not session.is_alive(), wait)
+    return web.json_response(session.screen.changes(since))
+
+@routes.get('/api/console/sessions')
+async def get_console_sessions(request):
+    return web.json_response(shell_manager.stats())
+
+@routes.post('/api/server/{name}/type')
+async def type_text(request):
+    data = await request.json()
+    name = request.match_info['name']
+    # Same ES-ES keyboard layout fix as VMManager.type_text
+    safe_text = data.get('text', '').replace("-", "/")
+    try:
+        await backend_of(request).vbox.run(["controlvm", name, "keyboardputstring", safe_text], check=True)
+        await backend_of(request).vbox.run(["controlvm", name, "keyboardputscancode", "1c", "9c"], check=True)
+        success, message = True, "Typed text + Enter"
+    except Exception as e:
+        success, message = False, str(e)
+    return web.json_response({"success": success, "message": message})
+
+@routes.post('/api/server/{id}/ssh_exec')
+async def ssh_exec(request):
+    data = await request.json()
+    try:
+        timeout = float(data.get('timeout', DEFAULT_JOB_TIMEOUT))
+    except (TypeError, ValueError):
+        return bad_request("timeout must be a number")
+    # Same job-backed behaviour as server.py: long commands answer with the job id
+    job = job_manager.submit(request.match_info['id'], data.get('command'), timeout=timeout)
+    done, _ = await asyncio.wait({asyncio.wrap_future(job.future)}, timeout=SSH_EXEC_WAIT)
+    return web.json_response(ssh_exec_reply(job, bool(done)))
+
+@routes.post('/api/servers/exec')
+async def fleet_exec(request):
+    backend = backend_of(request)
+    data = await request.json()
+    command = data.get('command')
+    if not command:
+        return bad_request("command is required")
+    target = data.get('target', 'running')
+    if target == 'running':
+        await backend.get_servers() # Refresh statuses without blocking the loop
+        server_ids = [s['id'] for s in vm_manager.servers if s.get('status') == 'running']
+    else:
+        server_ids = select_servers(vm_manager, target)
+    if server_ids is None:
+        return bad_request('target must be all, running, a list of ids or {"tag": ...}')
+    try:
+        parallelism = max(1, min(int(data.get('parallelism', 8)), FANOUT_MAX_PARALLELISM))
+        timeout = float(data.get('timeout', DEFAULT_JOB_TIMEOUT))
+    except (TypeError, ValueError):
+        return bad_request("parallelism and timeout must be numbers")
+
+    semaphore = asyncio.Semaphore(parallelism)
+    async def run_one(server_id):
+        async with semaphore:
+            result = await backend.ssh.run(backend.find_server(server_id), command,
+                                           timeout=timeout, max_output=MAX_JOB_OUTPUT)
+        return dict(result, server_id=server_id)
+
+    response = web.StreamResponse(headers={'Content-Type': 'application/x-ndjson', 'Cache-Control': 'no-cache'})
+    await response.prepare(request)
+    started = time.time()
+    ok = failed = 0
+    tasks = [asyncio.ensure_future(run_one(server_id)) for server_id in server_ids]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            result = await next_done
+            if result["error"] is None and result["exit_code"] == 0:
+                ok += 1
+            else:
+                failed += 1
+            await response.write((json.dumps(result) + "\n").encode())
+    finally:
+        # Client gone (or done): don't leave the remaining commands running
+        for task in tasks:
+            task.cancel()
+    await response.write((json.dumps({"summary": {"targets": len(server_ids), "succeeded": ok, "failed": failed,
+                                                  "duration": round(time.time() - started, 3)}}) + "\n").encode())
+    return response
+
+@routes.post('/api/server/{id}/jobs')
+async def submit_job(request):
+    data = await request.json()
+    command = data.get('command')
+    if not command:
+        return bad_request("command is required")
+    try:
+        timeout = float(data.get('timeout', DEFAULT_JOB_TIMEOUT))
+    except (TypeError, ValueError):
+        return bad_request("timeout must be a number")
+    job = job_manager.submit(request.match_info['id'], command, timeout=timeout)
+    return web.json_response(job.to_dict(), status=202)
+
+@routes.get('/api/jobs')
+async def list_jobs(request):
+    return web.json_response([job.to_dict(include_output=False) for job in job_manager.list()])
+
+@routes.get('/api/jobs/{job_id}')
+async def get_job(request):
+    job = job_manager.get(request.match_info['job_id'])
+    if job is None:
+        return web.json_response({"error": "Job not found"}, status=404)
+    return web.json_response(job.to_dict())
+
+@routes.delete('/api/jobs/{job_id}')
+async def cancel_job(request):
+    job = job_manager.cancel(request.match_info['job_id'])
+    if job is None:
+        return web.json_response({"error": "Job not found"}, status=404)
+    return web.json_response(job.to_dict(include_output=False))
+
+@routes.get('/')
+async def index(request):
+    return web.FileResponse(os.path.join(BASE_DIR, 'index.html'))
+
+@routes.get('/{path:.*}')
+async def static_files(request):
+    path = os.path.normpath(os.path.join(BASE_DIR, request.match_info['path']))
+    if not path.startswith(BASE_DIR + os.sep) or not os.path.isfile(path):
+        raise web.HTTPNotFound()
+    return web.FileResponse(path)
+
+
+async def start_background(app):
+    app['backend'].loop = asyncio.get_running_loop()
+    app['collector'] = asyncio.create_task(app['backend'].collect_loop())
+    vm_manager.start_config_watcher()
+
+async def stop_background(app):
+    app['collector'].cancel()
+    app['backend'].ssh.close_all()
+
+def create_app():
+    app = web.Application(middlewares=[cors, timing])
+    app['backend'] = AsyncBackend()
+    app.add_routes(routes)
+    app.on_startup.append(start_background)
+    app.on_cleanup.append(stop_background)
+    return app
+
+if __name__ == '__main__':
+    web.run_app(create_app(), host='0.0.0.0', port=5000)
@@ -0,0 +1,178 @@
+"""In-process SSH server emulating a fleet of guests for the benchmarks.
+
+    python fake_guest.py --base-port 22000 --count 200 [--latency 0.01]
+
+Listens on 127.0.0.1:<base-port> .. <base-port + count - 1>, one port per
+emulated VM, accepting any user/password. It answers what the dashboard runs:
+
+- the /proc stats command (STATS_COMMAND) with synthetic, advancing counters;
+- interactive pty shells that echo input and answer `echo ...` lines;
+- other exec requests: `echo ...`, `sleep N`, `exit N`, anything else prints
+  a one-line acknowledgement. The guest agent (python3 -u -) is reported as
+  missing, so agent stats mode falls back to exec sampling.
+
+No command is ever run on the host. Needs paramiko.
+"""
+import argparse
+import random
+import shlex
+import socket
+import threading
+import time
+
+import paramiko
+
+PROMPT = "bench@guest:~$ "
+
+class Guest:
+    """Synthetic machine state behind one port."""
+
+    def __init__(self, index):
+        self.index = index
+        self.lock = threading.Lock()
+        self.cpu = [1000, 0, 500, 100000, 100, 0, 10, 0]
+        self.mem_total = 2048 * 1024
+        self.rng = random.Random(index)
+
+    def stats_output(self):
+        with self.lock:
+            # Advance counters as if the guest had run for a second at 5-40% CPU
+            busy = self.rng.randint(5, 40)
+            self.cpu[0] += busy
+            self.cpu[3] += 100 - busy
+            cpu = " ".join(str(c) for c in self.cpu)
+        available = int(self.mem_total * self.rng.uniform(0.3, 0.9))
+        return (f"cpu  {cpu} 0 0\n"
+                f"MemTotal: {self.mem_total}\n"
+                f"MemAvailable: {available}\n"
+                f"4096 5000000 {3000000 - self.index} 2800000\n")
+
+    def run(self, command):
+        """(exit status, stdout, stderr) for an exec request."""
+        if "/proc/stat" in command:
+            return 0, self.stats_output(), ""
+        if command.startswith("python3"):
+            return 127, "", "bash: python3: command not found\n"
+        try:
+            words = shlex.split(command)
+        except ValueError:
+            words = command.split()
+        if not words:
+            return 0, "", ""
+        if words[0] == "echo":
+            return 0, " ".join(words[1:]) + "\n", ""
+        if words[0] == "sleep" and len(words) > 1:
+            time.sleep(float(words[1]))
+            return 0, "", ""
+        if words[0] == "exit":
+            return int(words[1]) if len(words) > 1 else 0, "", ""
+        if words[0] == "hostname":
+            return 0, f"bench-vm-{self.index:03d}\n", ""
+        return 0, f"ok: {command}\n", ""
+
+
+class GuestServer(paramiko.ServerInterface):
+    def __init__(self, guest, latency):
+        self.guest = guest
+        self.latency = latency
+
+    def get_allowed_auths(self, username):
+        return "password,publickey"
+
+    def check_auth_password(self, username, password):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def check_auth_publickey(self, username, key):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def check_channel_request(self, kind, chanid):
+        if kind == "session":
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_pty_request(self, channel, term, width, height, pixelwidth, pixelheight, modes):
+        return True
+
+    def check_channel_exec_request(self, channel, command):
+        threading.Thread(target=self._exec, args=(channel, command.decode(errors="replace")), daemon=True).start()
+        return True
+
+    def check_channel_shell_request(self, channel):
+        threading.Thread(target=self._shell, args=(channel,), daemon=True).start()
+        return True
+
+    def _exec(self, channel, command):
+        try:
+            if self.latency:
+                time.sleep(self.latency)
+            status, out, err = self.guest.run(command)
+            if out:
+                channel.sendall(out.encode())
+            if err:
+                channel.sendall_stderr(err.encode())
+            channel.send_exit_status(status)
+        except Exception:
+            pass
+        finally:
+            channel.close()
+
+    def _shell(self, channel):
+        try:
+            channel.sendall(f"Welcome to bench-vm-{self.guest.index:03d}\r\n{PROMPT}".encode())
+            line = ""
+            while True:
+                data = channel.recv(1024)
+                if not data:
+                    break
+                for ch in data.decode(errors="replace"):
+                    if ch in "\r\n":
+                        if self.latency:
+                            time.sleep(self.latency)
+                        status, out, err = self.guest.run(line.strip())
+                        reply = (out + err).replace("\n", "\r\n")
+                        channel.sendall(f"\r\n{reply}{PROMPT}".encode())
+                        line = ""
+                    elif ch in "\x7f\b":
+                        line = line[:-1]
+                        channel.sendall(b"\b \b")
+                    else:
+                        line += ch
+                        channel.sendall(ch.encode())
+        except Exception:
+            pass
+        finally:
+            channel.close()
+
+
+def serve_port(port, guest, host_key, latency):
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind(("127.0.0.1", port))
+    listener.listen(64)
+    while True:
+        sock, _ = listener.accept()
+        try:
+            transport = paramiko.Transport(sock)
+            transport.add_server_key(host_key)
+            transport.start_server(server=GuestServer(guest, latency))
+        except Exception as e:
+            print(f"Guest {guest.index}: handshake failed: {e}")
+            sock.close()
+
+def start(base_port, count, latency=0.0):
+    """Start `count` emulated guests on consecutive ports in background threads."""
+    host_key = paramiko.RSAKey.generate(2048)
+    for i in range(count):
+        threading.Thread(target=serve_port, args=(base_port + i, Guest(i), host_key, latency),
+                         name=f"guest-{i}", daemon=True).start()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Emulated SSH guests for benchmarks")
+    parser.add_argument("--base-port", type=int, default=22000)
+    parser.add_argument("--count", type=int, default=2)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every command")
+    args = parser.parse_args()
+    start(args.base_port, args.count, args.latency)
+    print(f"Emulating {args.count} guests on ports {args.base_port}-{args.base_port + args.count - 1}", flush=True)
+    while True:
+        time.sleep(3600)
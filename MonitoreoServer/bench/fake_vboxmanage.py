@@ -0,0 +1,116 @@
+"""Stand-in for VBoxManage used by the benchmarks (no VirtualBox needed).
+
+    python fake_vboxmanage.py <VBoxManage arguments>
+
+The fleet comes from the JSON file named by BENCH_VBOX_STATE:
+
+    {"latency": 0.05, "jitter": 0.02, "screen": "static" | "changing",
+     "vms": [{"name": "bench-vm-000", "uuid": "...", "state": "running"}, ...]}
+
+Every call sleeps latency +- jitter seconds (VBoxManage itself takes tens of
+milliseconds to talk to VBoxSVC), then answers the subcommands the dashboard
+uses. Power operations succeed without changing the state file.
+"""
+import json
+import os
+import random
+import struct
+import sys
+import time
+import zlib
+
+SCREEN_WIDTH = 640
+SCREEN_HEIGHT = 480
+
+# `VBoxManage list --long vms` prints these VMState values as e.g. "powered off"
+STATE_LABELS = {
+    "running": "running",
+    "poweroff": "powered off",
+    "saved": "saved",
+    "paused": "paused",
+}
+
+def load_state():
+    path = os.environ.get("BENCH_VBOX_STATE")
+    if not path:
+        return {"vms": []}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def find_vm(state, key):
+    return next((vm for vm in state["vms"] if key in (vm["name"], vm.get("uuid"))), None)
+
+def png(width, height, rows):
+    """Minimal RGB PNG writer, so screenshots don't need Pillow."""
+    def chunk(kind, data):
+        return (struct.pack(">I", len(data)) + kind + data
+                + struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff))
+    raw = b"".join(b"\x00" + row for row in rows)
+    return (b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(raw, 1))
+            + chunk(b"IEND", b""))
+
+def screenshot(state, vm, path):
+    background = bytes([16, 16, 16]) * SCREEN_WIDTH
+    band = bytes([200, 200, 200]) * SCREEN_WIDTH
+    # A stable per-VM "prompt" line, plus a moving band when the screen is changing
+    seed = zlib.crc32(vm["name"].encode())
+    prompt_row = 16 + seed % (SCREEN_HEIGHT - 32)
+    moving_row = int(time.time() * 4) % SCREEN_HEIGHT if state.get("screen") == "changing" else -1
+    rows = [band if y in (prompt_row, moving_row) else background for y in range(SCREEN_HEIGHT)]
+    with open(path, 'wb') as f:
+        f.write(png(SCREEN_WIDTH, SCREEN_HEIGHT, rows))
+
+def list_vms(state, args):
+    vms = state["vms"]
+    if args[:1] == ["runningvms"]:
+        vms = [vm for vm in vms if vm["state"] == "running"]
+        args = ["vms"]
+    if "--long" in args:
+        for vm in vms:
+            print(f"Name:                        {vm['name']}")
+            print("Groups:                      /bench")
+            print(f"UUID:                        {vm.get('uuid', '')}")
+            print(f"State:                       {STATE_LABELS.get(vm['state'], vm['state'])} (since 2024-01-01T00:00:00.000000000)")
+            print()
+    else:
+        for vm in vms:
+            print(f"\"{vm['name']}\" {{{vm.get('uuid', '')}}}")
+    return 0
+
+def main(args):
+    state = load_state()
+    latency = state.get("latency", 0.05)
+    jitter = state.get("jitter", 0.0)
+    time.sleep(max(0.0, latency + random.uniform(-jitter, jitter)))
+
+    if not args:
+        print("Oracle VM VirtualBox Command Line Management Interface (bench stand-in)")
+        return 0
+    command = args[0]
+    if command == "list":
+        return list_vms(state, args[1:])
+
+    # Everything else names a VM: showvminfo <vm>, controlvm <vm> ..., startvm <vm> ...
+    vm = find_vm(state, args[1]) if len(args) > 1 else None
+    if vm is None:
+        print(f"VBoxManage: error: Could not find a registered machine named '{args[1] if len(args) > 1 else ''}'",
+              file=sys.stderr)
+        return 1
+    if command == "showvminfo":
+        print(f"name=\"{vm['name']}\"")
+        print(f"UUID=\"{vm.get('uuid', '')}\"")
+        print(f"VMState=\"{vm['state']}\"")
+        return 0
+    if command == "controlvm" and len(args) > 3 and args[2] == "screenshotpng":
+        if vm["state"] != "running":
+            print(f"VBoxManage: error: Machine '{vm['name']}' is not currently running", file=sys.stderr)
+            return 1
+        screenshot(state, vm, args[3])
+        return 0
+    # startvm, controlvm poweroff/acpipowerbutton/reset/keyboardput*, modifyvm, ...
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
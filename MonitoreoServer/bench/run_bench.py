@@ -0,0 +1,216 @@
+"""Endpoint latency/throughput of the dashboard as the fleet grows.
+
+    python run_bench.py --sizes 2,20,200 --requests 300 --concurrency 16
+
+For every fleet size this generates a config.json, starts the emulated guests
+(fake_guest.py) and the dashboard server in child processes, pointing
+VBOX_MANAGE_CMD at fake_vboxmanage.py, lets the stats collector run for
+--warmup seconds and then fires --requests requests per endpoint with
+--concurrency client threads, spread round-robin over the VMs. Reports
+p50/p95/p99 latency and requests per second per endpoint (--json saves the
+raw numbers). Runs on Linux without VirtualBox; needs paramiko plus the
+server's own dependencies (flask, or aiohttp/asyncssh with --server async).
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVER_DIR = os.path.dirname(BENCH_DIR)
+
+# name -> (method, path); {id} and {name} are filled per request
+ENDPOINTS = {
+    "servers": ("GET", "/api/servers"),
+    "stats": ("GET", "/api/server/{id}/stats"),
+    "screenshot": ("GET", "/api/server/{name}/screenshot"),
+    "screenshot_webp": ("GET", "/api/server/{name}/screenshot?format=webp&width=480&quality=70"),
+    "console_output": ("GET", "/api/server/{id}/console/output?since=0"),
+    "console_screen": ("GET", "/api/server/{id}/console/screen?since=0"),
+}
+DEFAULT_ENDPOINTS = "servers,stats,screenshot,console_output"
+
+def percentile(sorted_values, p):
+    # Nearest-rank percentile
+    if not sorted_values:
+        return None
+    rank = max(1, int(round(p / 100 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+def write_fleet(workdir, size, base_port, vbox_latency, vbox_jitter, screen):
+    servers, vms = [], []
+    for i in range(size):
+        name = f"bench-vm-{i:03d}"
+        uuid = f"00000000-0000-4000-8000-{i:012d}"
+        servers.append({
+            "id": f"bench_vm_{i:03d}",
+            "name": name,
+            "display_name": name,
+            "ip": "127.0.0.1",
+            "ssh_port": base_port + i,
+            "ssh_user": "bench",
+            "ssh_password": "bench",
+            "ssh_key_path": "",
+            "vbox_uuid": uuid,
+        })
+        vms.append({"name": name, "uuid": uuid, "state": "running"})
+    with open(os.path.join(workdir, "config.json"), 'w') as f:
+        json.dump(servers, f, indent=4)
+    state_path = os.path.join(workdir, "vbox_state.json")
+    with open(state_path, 'w') as f:
+        json.dump({"latency": vbox_latency, "jitter": vbox_jitter, "screen": screen, "vms": vms}, f)
+
+    # VBOX_MANAGE_CMD is exec'd directly, so wrap the script in an executable
+    wrapper = os.path.join(workdir, "VBoxManage")
+    with open(wrapper, 'w') as f:
+        f.write(f"#!/bin/sh\nexec \"{sys.executable}\" \"{os.path.join(BENCH_DIR, 'fake_vboxmanage.py')}\" \"$@\"\n")
+    os.chmod(wrapper, 0o755)
+    return servers, state_path, wrapper
+
+def wait_for_http(url, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=2) as response:
+                response.read()
+                return True
+        except (urllib.error.URLError, ConnectionError, OSError):
+            time.sleep(0.2)
+    return False
+
+def timed_request(method, url):
+    started = time.perf_counter()
+    try:
+        request = urllib.request.Request(url, method=method)
+        with urllib.request.urlopen(request, timeout=60) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except Exception:
+        status = None
+    return time.perf_counter() - started, status
+
+def run_endpoint(base_url, endpoint, servers, requests, concurrency):
+    method, path = ENDPOINTS[endpoint]
+    urls = [base_url + path.format(id=s["id"], name=s["name"])
+            for s in (servers[i % len(servers)] for i in range(requests))]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(lambda url: timed_request(method, url), urls))
+    wall = time.perf_counter() - started
+
+    latencies = sorted(latency for latency, status in results)
+    # 304s are a successful answer for conditional screenshot requests
+    errors = sum(1 for _, status in results if status is None or status >= 400)
+    return {
+        "endpoint": endpoint,
+        "requests": len(results),
+        "errors": errors,
+        "rps": round(len(results) / wall, 1) if wall else None,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+    }
+
+def bench_fleet(size, args):
+    workdir = tempfile.mkdtemp(prefix=f"monitoreo_bench_{size}_")
+    servers, state_path, wrapper = write_fleet(workdir, size, args.base_port, args.vbox_latency,
+                                               args.vbox_jitter, args.screen)
+    env = dict(os.environ, VBOX_MANAGE_CMD=wrapper, BENCH_VBOX_STATE=state_path, PYTHONUNBUFFERED="1")
+    guests = subprocess.Popen([sys.executable, os.path.join(BENCH_DIR, "fake_guest.py"),
+                               "--base-port", str(args.base_port), "--count", str(size),
+                               "--latency", str(args.ssh_latency)],
+                              stdout=subprocess.PIPE, stderr=None if args.verbose else subprocess.DEVNULL,
+                              text=True)
+    server = None
+    try:
+        guests.stdout.readline() # "Emulating N guests ..." once every port listens
+        server = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--serve",
+                                   "--server", args.server, "--port", str(args.port)],
+                                  cwd=workdir, env=env,
+                                  stdout=None if args.verbose else subprocess.DEVNULL,
+                                  stderr=None if args.verbose else subprocess.DEVNULL)
+        base_url = f"http://127.0.0.1:{args.port}"
+        if not wait_for_http(base_url + "/api/config"):
+            raise RuntimeError("dashboard server did not start (use --verbose to see its output)")
+        time.sleep(args.warmup)
+
+        results = []
+        for endpoint in args.endpoints:
+            result = run_endpoint(base_url, endpoint, servers, args.requests, args.concurrency)
+            result["fleet"] = size
+            results.append(result)
+            print(f"{size:>6} {endpoint:<16} {result['requests']:>6} {result['errors']:>6} {result['rps']:>8} "
+                  f"{result['p50_ms']:>9} {result['p95_ms']:>9} {result['p99_ms']:>9}", flush=True)
+        return results
+    finally:
+        for proc in (server, guests):
+            if proc is not None:
+                proc.terminate()
+                try:
+                    proc.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    proc.kill()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def serve(server_kind, port):
+    # Child process: the dashboard against the generated config.json in the cwd
+    sys.path.insert(0, SERVER_DIR)
+    if server_kind == "async":
+        from aiohttp import web
+        import async_server
+        web.run_app(async_server.create_app(), host="127.0.0.1", port=port)
+    else:
+        import server
+        server.stats_collector.start()
+        server.app.run(host="127.0.0.1", port=port, threaded=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the dashboard API against an emulated fleet")
+    parser.add_argument("--sizes", default="2,20,200", help="comma separated fleet sizes")
+    parser.add_argument("--endpoints", default=DEFAULT_ENDPOINTS,
+                        help=f"comma separated, from: {', '.join(ENDPOINTS)}")
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint and fleet size")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--warmup", type=float, default=6.0, help="seconds for the stats collector to sample")
+    parser.add_argument("--vbox-latency", type=float, default=0.05, help="seconds per VBoxManage call")
+    parser.add_argument("--vbox-jitter", type=float, default=0.02)
+    parser.add_argument("--ssh-latency", type=float, default=0.0, help="seconds added to every guest command")
+    parser.add_argument("--screen", choices=("static", "changing"), default="static")
+    parser.add_argument("--server", choices=("flask", "async"), default="flask")
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--base-port", type=int, default=22000, help="first emulated guest SSH port")
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--verbose", action="store_true", help="show the dashboard server's output")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.server, args.port)
+        return
+
+    args.endpoints = [e.strip() for e in args.endpoints.split(",") if e.strip()]
+    unknown = [e for e in args.endpoints if e not in ENDPOINTS]
+    if unknown:
+        parser.error(f"unknown endpoints: {', '.join(unknown)}")
+
+    print(f"{'fleet':>6} {'endpoint':<16} {'reqs':>6} {'errors':>6} {'req/s':>8} "
+          f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    results = []
+    for size in [int(s) for s in args.sizes.split(",")]:
+        results += bench_fleet(size, args)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({"settings": {k: v for k, v in vars(args).items() if k not in ("json", "serve")},
+                       "results": results}, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+class StatsCollector:
+    """Samples every running server in the background and caches the latest stats.
+
+    HTTP handlers read from the cache, so dashboard requests never wait on guest
+    SSH latency and the number of open dashboards doesn't change upstream load.
+    """
+
+    def __init__(self, vm_manager, interval=5, max_workers=8, history=None, events=None):
+        self.vm_manager = vm_manager
+        self.interval = interval
+        self.history = history # Optional MetricHistory fed with every sample
+        self.events = events   # Optional EventHub for "status" and "stats" pushes
+        self.samples = {} # {server_id: {"stats": {...}, "timestamp": float}}
+        self.statuses = {} # {server_id: last published status}
+        self.pending = {} # {server_id: Future} samples that outlived their sweep
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="stats")
+        self.thread = None
+        vm_manager.reload_listeners.append(self._on_config_change)
+
+    def start(self):
+        if self.thread and self.thread.is_alive():
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, name="stats-collector", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join()
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            started = time.time()
+            try:
+                self.collect_once()
+            except Exception as e:
+                print(f"Error collecting stats: {e}")
+            # Keep a steady cadence regardless of how long the sweep took
+            self.stop_event.wait(max(0, self.interval - (time.time() - started)))
+
+    def collect_once(self):
+        servers = self.vm_manager.get_servers()
+        running = [s['id'] for s in servers if s.get('status') == 'running']
+        self._publish_statuses(servers)
+
+        # Sample servers in parallel so one slow guest doesn't delay the rest.
+        # A server whose previous sample is still running isn't sampled again
+        # (that would pile its calls up in the executor); it reports the timeout.
+        futures = {}
+        for server_id in running:
+            future = self.pending.get(server_id)
+            if future is None or future.done():
+                future = self.executor.submit(self.vm_manager.get_stats, server_id)
+            futures[server_id] = future
+        late = wait(futures.values(), timeout=self.interval).not_done
+        self.pending = {server_id: f for server_id, f in futures.items() if f in late}
+        for server_id, future in futures.items():
+            if future in late:
+                stats = {"cpu": 0, "ram": 0, "disk": 0, "error": f"Stats took longer than {self.interval}s"}
+            else:
+                try:
+                    stats = future.result()
+                except Exception as e:
+                    stats = {"cpu": 0, "ram": 0, "disk": 0, "error": str(e)}
+            if stats is None:
+                continue
+            timestamp = time.time()
+            with self.lock:
+                self.samples[server_id] = {"stats": stats, "timestamp": timestamp}
+            if self.history is not None:
+                self.history.record(server_id, timestamp, stats)
+            if self.events is not None:
+                self.events.publish("stats", dict(stats, id=server_id, timestamp=timestamp), key=server_id)
+
+        # Forget samples of servers that are no longer running
+        with self.lock:
+            for server_id in list(self.samples):
+                if server_id not in futures:
+                    del self.samples[server_id]
+
+    def _publish_statuses(self, servers):
+        if self.events is None:
+            return
+        for server in servers:
+            status = server.get('status')
+            if self.statuses.get(server['id']) != status:
+                self.statuses[server['id']] = status
+                self.events.publish("status", {"id": server['id'], "name": server.get('name'), "status": status},
+                                    key=server['id'])
+                if status != 'running':
+                    self.events.forget("stats", server['id'])
+
+    def _on_config_change(self, server_ids, old_entries):
+        # Drop what was sampled with the old entry; the next sweep starts afresh
+        with self.lock:
+            for server_id in server_ids:
+                self.samples.pop(server_id, None)
+        for server_id in server_ids:
+            self.statuses.pop(server_id, None)
+            if self.events is not None:
+                self.events.forget("stats", server_id)
+                if self.vm_manager.registry.get(server_id) is None:
+                    self.events.forget("status", server_id)
+
+    def get_latest(self, server_id):
+        """Latest cached sample with its age in seconds, or None if not sampled yet."""
+        with self.lock:
+            sample = self.samples.get(server_id)
+        if sample is None:
+            return None
+        result = dict(sample["stats"])
+        result["timestamp"] = sample["timestamp"]
+        result["age"] = round(time.time() - sample["timestamp"], 3)
+        return result
@@ -0,0 +1,64 @@
+import threading
+
+# Bytes of console output kept per session
+DEFAULT_CAPACITY = 256 * 1024
+
+class ConsoleBuffer:
+    """Fixed-size byte ring addressed by absolute offsets.
+
+    The writer appends; every reader keeps its own offset, so several viewers
+    of one session each get all of the output instead of stealing it from each
+    other. Readers that fall more than `capacity` bytes behind skip ahead to
+    the oldest byte still buffered.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.buf = bytearray(capacity)
+        self.end = 0 # Total bytes ever written = offset of the next byte
+        self.closed = False
+        self.cond = threading.Condition()
+
+    def write(self, data):
+        if not data:
+            return
+        with self.cond:
+            if len(data) >= self.capacity:
+                # Only the tail fits
+                self.end += len(data) - self.capacity
+                data = data[-self.capacity:]
+            pos = self.end % self.capacity
+            first = min(len(data), self.capacity - pos)
+            self.buf[pos:pos + first] = data[:first]
+            self.buf[:len(data) - first] = data[first:]
+            self.end += len(data)
+            self.cond.notify_all()
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+    @property
+    def start(self):
+        # Offset of the oldest byte still buffered
+        return max(0, self.end - self.capacity)
+
+    def read(self, since=0, wait=0):
+        """Bytes from offset `since` to the current end, and the next offset.
+
+        Blocks up to `wait` seconds for new data when there is none yet.
+        An offset beyond the end (e.g. from a previous session) restarts from
+        the oldest buffered byte.
+        """
+        with self.cond:
+            if since > self.end:
+                since = self.start
+            if wait and since == self.end and not self.closed:
+                self.cond.wait_for(lambda: self.end > since or self.closed, timeout=wait)
+            since = max(since, self.start)
+            length = self.end - since
+            pos = since % self.capacity
+            first = min(length, self.capacity - pos)
+            data = bytes(self.buf[pos:pos + first]) + bytes(self.buf[:length - first])
+            return data, self.end
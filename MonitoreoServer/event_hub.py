@@ -0,0 +1,99 @@
+import asyncio
+import json
+import queue
+import threading
+
+# Events buffered per subscriber; a slow client loses the oldest ones
+MAX_QUEUE = 256
+
+class Subscription:
+    def __init__(self, max_queue=MAX_QUEUE):
+        self.queue = queue.Queue(maxsize=max_queue)
+
+    def put(self, item):
+        while True:
+            try:
+                self.queue.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait() # Drop the oldest, never block the publisher
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout=None):
+        """Next (event, data) pair, or None if nothing arrived within timeout."""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class AsyncSubscription:
+    """Subscription consumed from an asyncio event loop (see async_server.py).
+
+    Publishers may run in any thread; items are handed to the loop with
+    call_soon_threadsafe, so waiting for events doesn't hold a thread.
+    """
+
+    def __init__(self, loop, max_queue=MAX_QUEUE):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=max_queue)
+
+    def put(self, item):
+        self.loop.call_soon_threadsafe(self._put, item)
+
+    def _put(self, item):
+        if self.queue.full():
+            self.queue.get_nowait() # Drop the oldest
+        self.queue.put_nowait(item)
+
+    async def get(self, timeout=None):
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class EventHub:
+    """In-process pub/sub for dashboard updates.
+
+    Producers (stats collector, frame store, shell sessions) publish each
+    update once; every subscriber (one per open SSE connection) gets it from
+    its own bounded queue. Keyed events also keep their latest value, which
+    is replayed to new subscribers so they start with the current state.
+    """
+
+    def __init__(self):
+        self.subscribers = set()
+        self.latest = {} # {(event, key): data}
+        self.lock = threading.Lock()
+
+    def subscribe(self, loop=None):
+        """New subscription; pass an asyncio loop to get an AsyncSubscription."""
+        sub = Subscription() if loop is None else AsyncSubscription(loop)
+        with self.lock:
+            for (event, _), data in self.latest.items():
+                sub.put((event, data))
+            self.subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self.lock:
+            self.subscribers.discard(sub)
+
+    def publish(self, event, data, key=None):
+        with self.lock:
+            if key is not None:
+                self.latest[(event, key)] = data
+            subscribers = list(self.subscribers)
+        for sub in subscribers:
+            sub.put((event, data))
+
+    def forget(self, event, key):
+        with self.lock:
+            self.latest.pop((event, key), None)
+
+    @staticmethod
+    def format_sse(event, data):
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
@@ -0,0 +1,129 @@
+import hashlib
+import struct
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+import image_codec
+import profiler
+from metrics import CACHE_REQUESTS
+
+# Frames younger than this are served to every viewer without a new capture
+FRAME_MAX_AGE = 0.5
+# Encoded variants (format/size/quality) kept per frame
+MAX_VARIANTS = 8
+
+class Frame:
+    def __init__(self, data, timestamp, frame_id=None):
+        self.data = data # PNG bytes
+        self.timestamp = timestamp
+        self.digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+        # Changes only when the picture does: ms timestamp of the first capture
+        # with this content, so ids stay unique across server restarts
+        self.frame_id = frame_id if frame_id is not None else int(timestamp * 1000)
+        # PNG IHDR: width and height are the first fields after the 16-byte header
+        self.width, self.height = struct.unpack(">II", data[16:24]) if len(data) >= 24 else (0, 0)
+        self.variants = OrderedDict() # {(fmt, width, quality): bytes}
+        self.variants_lock = threading.Lock()
+
+    @property
+    def etag(self):
+        return self.digest
+
+    def variant(self, fmt="png", width=None, quality=image_codec.DEFAULT_QUALITY):
+        """Return (data, mimetype, etag) for this frame encoded as requested.
+
+        Encodings are cached per frame. Without Pillow, or when the request
+        amounts to the original, the captured PNG is returned as is.
+        """
+        if width is not None and not 0 < width < self.width:
+            width = None # Never upscale (and nothing to scale to below 1 px)
+        if fmt == "png":
+            quality = None # Lossless: quality doesn't apply
+        if (fmt == "png" and not width) or not image_codec.can_transcode():
+            return self.data, "image/png", self.etag
+
+        key = (fmt, width, quality)
+        with self.variants_lock:
+            data = self.variants.get(key)
+            CACHE_REQUESTS.inc(cache="screenshot_variant", result="miss" if data is None else "hit")
+            if data is None:
+                with profiler.span("encoding"):
+                    data = image_codec.encode(self.data, fmt, width, quality)
+                self.variants[key] = data
+                if len(self.variants) > MAX_VARIANTS:
+                    self.variants.popitem(last=False)
+        etag = f"{self.digest}-{fmt}-{width or 'full'}-{quality or 0}"
+        return data, image_codec.FORMATS[fmt][1], etag
+
+    def inherit_variants(self, previous):
+        # Same picture as the previous frame: its encodings are still valid
+        with previous.variants_lock:
+            self.variants = OrderedDict(previous.variants)
+
+
+class FrameStore:
+    """Latest screenshot per VM, kept in memory.
+
+    Requests arriving while a frame is fresh reuse it; requests arriving while
+    a capture is running wait for that capture instead of starting their own
+    (single-flight), so N viewers of a VM cost one VBoxManage call per window.
+    """
+
+    def __init__(self, vm_manager, max_age=FRAME_MAX_AGE, events=None):
+        self.vm_manager = vm_manager
+        self.max_age = max_age
+        self.events = events # Optional EventHub notified when a VM's picture changes
+        self.frames = {}   # {vm_name: Frame}
+        self.inflight = {} # {vm_name: Future resolving to Frame or None}
+        self.lock = threading.Lock()
+        vm_manager.reload_listeners.append(self._on_config_change)
+
+    def get(self, vm_name, max_age=None):
+        """Return a Frame no older than max_age, capturing one if needed (None on failure)."""
+        max_age = self.max_age if max_age is None else max_age
+        with self.lock:
+            frame = self.frames.get(vm_name)
+            if frame is not None and time.time() - frame.timestamp <= max_age:
+                CACHE_REQUESTS.inc(cache="screenshot", result="hit")
+                return frame
+            future = self.inflight.get(vm_name)
+            leader = future is None
+            if leader:
+                future = self.inflight[vm_name] = Future()
+
+        if not leader:
+            CACHE_REQUESTS.inc(cache="screenshot", result="shared")
+            with profiler.span("lock_wait"):
+                return future.result()
+        CACHE_REQUESTS.inc(cache="screenshot", result="miss")
+
+        frame = None
+        try:
+            data = self.vm_manager.get_screenshot(vm_name)
+            if data:
+                frame = Frame(data, time.time())
+                previous = self.frames.get(vm_name)
+                if previous is not None and previous.digest == frame.digest:
+                    # Unchanged console: keep the id so clients can skip it
+                    frame.frame_id = previous.frame_id
+                    frame.inherit_variants(previous)
+                elif self.events is not None:
+                    self.events.publish("frame", {"name": vm_name, "frame_id": frame.frame_id})
+        finally:
+            with self.lock:
+                if frame is not None:
+                    self.frames[vm_name] = frame
+                del self.inflight[vm_name]
+            future.set_result(frame)
+        return frame
+
+    def forget(self, vm_name):
+        with self.lock:
+            self.frames.pop(vm_name, None)
+
+    def _on_config_change(self, server_ids, old_entries):
+        # Renamed or removed VMs: their last picture is no longer reachable
+        for server in old_entries.values():
+            if server.get('name'):
+                self.forget(server['name'])
@@ -0,0 +1,56 @@
+"""Stats collector that runs on the guest.
+
+AgentManager pipes this file into `python3 -u - <interval>` over SSH, so it
+must stay self-contained (standard library only, Python 3.5+). It prints one
+JSON object per line and exits when the channel closes.
+"""
+import json
+import os
+import sys
+import time
+
+def read_cpu():
+    with open("/proc/stat") as f:
+        fields = [int(x) for x in f.readline().split()[1:9]]
+    fields += [0] * (8 - len(fields))
+    # user nice system idle iowait irq softirq steal
+    return sum(fields), fields[3] + fields[4]
+
+def read_ram():
+    mem = {}
+    with open("/proc/meminfo") as f:
+        for line in f:
+            key, value = line.split(":", 1)
+            if key in ("MemTotal", "MemAvailable"):
+                mem[key] = int(value.split()[0])
+    total = mem.get("MemTotal", 0)
+    if not total:
+        return 0.0
+    return (total - mem.get("MemAvailable", total)) * 100.0 / total
+
+def read_disk():
+    st = os.statvfs("/")
+    used = st.f_blocks - st.f_bfree
+    if used + st.f_bavail <= 0:
+        return 0.0
+    return used * 100.0 / (used + st.f_bavail)
+
+def main():
+    interval = float(sys.argv[1]) if len(sys.argv) > 1 else 1.0
+    prev_total, prev_idle = read_cpu()
+    while True:
+        time.sleep(interval)
+        total, idle = read_cpu()
+        d_total = total - prev_total
+        cpu = (d_total - (idle - prev_idle)) * 100.0 / d_total if d_total > 0 else 0.0
+        prev_total, prev_idle = total, idle
+        sample = {"cpu": round(cpu, 2), "ram": round(read_ram(), 2),
+                  "disk": round(read_disk(), 2), "ts": time.time()}
+        try:
+            sys.stdout.write(json.dumps(sample) + "\n")
+            sys.stdout.flush()
+        except (BrokenPipeError, IOError):
+            return # Host went away
+
+if __name__ == "__main__":
+    main()
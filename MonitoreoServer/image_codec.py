@@ -0,0 +1,50 @@
+from io import BytesIO
+
+try:
+    from PIL import Image
+except ImportError: # Pillow is optional; without it only the original PNG is served
+    Image = None
+
+# format query value -> (Pillow format, mimetype)
+FORMATS = {
+    "png": ("PNG", "image/png"),
+    "jpeg": ("JPEG", "image/jpeg"),
+    "webp": ("WEBP", "image/webp"),
+}
+
+DEFAULT_QUALITY = 75
+
+def can_transcode():
+    return Image is not None
+
+def image_params(args, default_format="png"):
+    """(fmt, width, quality) from ?format=&width=&quality= query args; ValueError if invalid."""
+    fmt = args.get('format', default_format)
+    if fmt not in FORMATS:
+        raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+    try:
+        width = int(args['width']) if args.get('width') else None
+        quality = min(max(int(args.get('quality', DEFAULT_QUALITY)), 1), 95)
+    except ValueError:
+        raise ValueError("width and quality must be integers")
+    if width is not None and width < 1:
+        raise ValueError("width must be a positive number of pixels")
+    return fmt, width, quality
+
+def encode(png_data, fmt, width=None, quality=DEFAULT_QUALITY):
+    """Re-encode a PNG screenshot as fmt, scaled down to width (never up)."""
+    image = Image.open(BytesIO(png_data))
+    if width and width < image.width:
+        height = max(1, round(image.height * width / image.width))
+        image = image.resize((width, height), Image.BILINEAR)
+
+    pil_format = FORMATS[fmt][0]
+    if pil_format == "JPEG" and image.mode != "RGB":
+        image = image.convert("RGB")
+
+    out = BytesIO()
+    if pil_format == "PNG":
+        image.save(out, "PNG", optimize=False)
+    else:
+        image.save(out, pil_format, quality=quality)
+    return out.getvalue()
@@ -0,0 +1,173 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Commands running at once across all servers
+JOB_WORKERS = 8
+# Default per-job timeout (seconds)
+DEFAULT_JOB_TIMEOUT = 300
+# Retention of finished jobs: count, age (seconds) and output per stream (bytes)
+MAX_FINISHED_JOBS = 200
+JOB_TTL = 3600
+MAX_JOB_OUTPUT = 1024 * 1024
+
+FINISHED = ("succeeded", "failed", "timeout", "cancelled")
+
+class Job:
+    def __init__(self, server_id, command, timeout):
+        self.id = uuid.uuid4().hex[:12]
+        self.server_id = server_id
+        self.command = command
+        self.timeout = timeout
+        self.status = "queued"
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.result = None
+        self.cancel_event = threading.Event()
+        self.done = threading.Event()
+        self.future = None
+
+    def to_dict(self, include_output=True):
+        data = {
+            "id": self.id,
+            "server_id": self.server_id,
+            "command": self.command,
+            "status": self.status,
+            "timeout": self.timeout,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+        }
+        if self.result is not None:
+            data["exit_code"] = self.result["exit_code"]
+            data["duration"] = self.result["duration"]
+            data["error"] = self.result["error"]
+            data["truncated"] = self.result["truncated"]
+            if include_output:
+                data["stdout"] = self.result["stdout"]
+                data["stderr"] = self.result["stderr"]
+        return data
+
+
+class JobManager:
+    """Runs SSH commands as background jobs on a bounded executor.
+
+    submit() returns immediately; callers poll get() by id, can cancel(), and
+    finished jobs are kept for JOB_TTL seconds (at most MAX_FINISHED_JOBS).
+    """
+
+    def __init__(self, vm_manager, max_workers=JOB_WORKERS):
+        self.vm_manager = vm_manager
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self.jobs = {} # {job_id: Job}, insertion ordered
+        self.lock = threading.Lock()
+
+    def submit(self, server_id, command, timeout=DEFAULT_JOB_TIMEOUT):
+        job = Job(server_id, command, timeout)
+        with self.lock:
+            self._prune()
+            self.jobs[job.id] = job
+        job.future = self.executor.submit(self._run, job)
+        return job
+
+    def _run(self, job):
+        if job.cancel_event.is_set():
+            job.status = "cancelled"
+            job.finished = time.time()
+            job.done.set()
+            return
+        job.status = "running"
+        job.started = time.time()
+        result = self.vm_manager.run_command(job.server_id, job.command, timeout=job.timeout,
+                                             cancel_event=job.cancel_event, max_output=MAX_JOB_OUTPUT)
+        job.result = result
+        if result["error"] in ("timeout", "cancelled"):
+            job.status = result["error"]
+        elif result["error"] or result["exit_code"] != 0:
+            job.status = "failed"
+        else:
+            job.status = "succeeded"
+        job.finished = time.time()
+        job.done.set()
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def list(self):
+        with self.lock:
+            self._prune()
+            return list(self.jobs.values())
+
+    def queued(self):
+        """Jobs waiting for a free worker."""
+        with self.lock:
+            return sum(1 for job in self.jobs.values() if job.status == "queued")
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is None:
+            return None
+        job.cancel_event.set()
+        if job.future is not None and job.future.cancel():
+            # Never started
+            job.status = "cancelled"
+            job.finished = time.time()
+            job.done.set()
+        return job
+
+    def _prune(self):
+        # Called with self.lock held
+        now = time.time()
+        finished = [j for j in self.jobs.values() if j.status in FINISHED]
+        excess = len(finished) - MAX_FINISHED_JOBS
+        for job in finished:
+            if excess > 0 or now - job.finished > JOB_TTL:
+                del self.jobs[job.id]
+                excess -= 1
+
+
+# Upper bound for the per-request parallelism of fan-out executions
+FANOUT_MAX_PARALLELISM = 32
+
+def select_servers(vm_manager, target):
+    """Resolve a fan-out target to server ids.
+
+    target is "all", "running", a list of server ids (or names/uuids), or {"tag": "<tag>"}
+    (matched against the optional "tags" list of each config entry).
+    Returns None for an unrecognised target.
+    """
+    if target == "all":
+        return [s['id'] for s in vm_manager.servers]
+    if target == "running":
+        return [s['id'] for s in vm_manager.get_servers() if s.get('status') == 'running']
+    if isinstance(target, list):
+        servers = (vm_manager.find_server(key) for key in target)
+        return [server['id'] for server in servers if server is not None]
+    if isinstance(target, dict) and 'tag' in target:
+        return [s['id'] for s in vm_manager.servers if target['tag'] in s.get('tags', [])]
+    return None
+
+def fan_out(vm_manager, server_ids, command, parallelism=8, timeout=DEFAULT_JOB_TIMEOUT):
+    """Run command on every server concurrently, yielding each result as it finishes.
+
+    Closing the generator (the client went away) cancels the commands not yet
+    started and stops the running ones.
+    """
+    if not server_ids:
+        return
+    workers = max(1, min(parallelism, FANOUT_MAX_PARALLELISM, len(server_ids)))
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="fanout")
+    cancel_event = threading.Event()
+    try:
+        futures = {executor.submit(vm_manager.run_command, server_id, command, timeout=timeout,
+                                   cancel_event=cancel_event, max_output=MAX_JOB_OUTPUT): server_id
+                   for server_id in server_ids}
+        for future in as_completed(futures):
+            yield dict(future.result(), server_id=futures[future])
+    finally:
+        # Not a `with` block: its shutdown would wait for every queued command
+        cancel_event.set()
+        executor.shutdown(wait=False, cancel_futures=True)
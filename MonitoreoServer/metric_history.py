@@ -0,0 +1,100 @@
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+
+METRICS = ("cpu", "ram", "disk")
+
+# 12 hours of history at the default 5 s sampling interval
+DEFAULT_CAPACITY = 8640
+
+class RingBuffer:
+    """Fixed-size, array-backed time series: one double for the timestamp and
+    one per metric for each sample, overwriting the oldest sample when full."""
+
+    def __init__(self, capacity, metrics=METRICS):
+        self.capacity = capacity
+        self.metrics = metrics
+        self.times = array('d', bytes(8 * capacity))
+        self.values = {m: array('d', bytes(8 * capacity)) for m in metrics}
+        self.head = 0  # next slot to write
+        self.size = 0
+
+    def append(self, timestamp, sample):
+        self.times[self.head] = timestamp
+        for m in self.metrics:
+            self.values[m][self.head] = float(sample.get(m) or 0)
+        self.head = (self.head + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def _ordered(self, arr):
+        # Oldest-to-newest view of a backing array
+        if self.size < self.capacity:
+            return arr[:self.size]
+        return arr[self.head:] + arr[:self.head]
+
+    def range(self, start, end):
+        """Timestamps and per-metric values with start <= t <= end."""
+        times = self._ordered(self.times)
+        lo = bisect_left(times, start)
+        hi = bisect_right(times, end)
+        return times[lo:hi], {m: self._ordered(self.values[m])[lo:hi] for m in self.metrics}
+
+
+def lttb(times, values, threshold):
+    """Largest-Triangle-Three-Buckets downsampling; returns [[t, v], ...]."""
+    n = len(times)
+    # Both end points plus at least one bucket; ?points=1 or 2 gets the smallest series
+    threshold = max(threshold, 3)
+    if threshold >= n:
+        return [[times[i], values[i]] for i in range(n)]
+
+    sampled = [[times[0], values[0]]]
+    bucket_size = (n - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        # Average point of the next bucket is the third triangle vertex
+        next_start = int((i + 1) * bucket_size) + 1
+        next_end = min(int((i + 2) * bucket_size) + 1, n)
+        count = next_end - next_start
+        avg_t = sum(times[next_start:next_end]) / count
+        avg_v = sum(values[next_start:next_end]) / count
+
+        start = int(i * bucket_size) + 1
+        end = int((i + 1) * bucket_size) + 1
+        ta, va = times[a], values[a]
+        best_area, best = -1.0, start
+        for j in range(start, end):
+            area = abs((ta - avg_t) * (values[j] - va) - (ta - times[j]) * (avg_v - va))
+            if area > best_area:
+                best_area, best = area, j
+        sampled.append([times[best], values[best]])
+        a = best
+    sampled.append([times[-1], values[-1]])
+    return sampled
+
+
+class MetricHistory:
+    """Per-server ring buffers of cpu/ram/disk samples with a fixed memory footprint."""
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.buffers = {} # {server_id: RingBuffer}
+        self.lock = threading.Lock()
+
+    def record(self, server_id, timestamp, stats):
+        if stats.get("error"):
+            return # Failed samples would show up as false zeros
+        with self.lock:
+            buf = self.buffers.get(server_id)
+            if buf is None:
+                buf = self.buffers[server_id] = RingBuffer(self.capacity)
+            buf.append(timestamp, stats)
+
+    def query(self, server_id, start, end, points):
+        """Downsampled series per metric between start and end (unix seconds)."""
+        with self.lock:
+            buf = self.buffers.get(server_id)
+            if buf is None:
+                return {m: [] for m in METRICS}
+            times, values = buf.range(start, end)
+        return {m: lttb(times, values[m], points) for m in METRICS}
@@ -0,0 +1,177 @@
+import threading
+
+# Latency buckets (seconds) used by every histogram below
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+REGISTRY = [] # Every metric created, in exposition order
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_number(value):
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """Base of the Prometheus text-format metrics (no client library needed).
+
+    Values are kept per tuple of label values; `labels` names them in order.
+    """
+    kind = "untyped"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self.values = {} # {label values: value}
+        self.lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        """Yields (suffix, label values, extra label, value)."""
+        with self.lock:
+            items = list(self.values.items())
+        for key, value in items:
+            yield "", key, None, value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, key, extra, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(self.labelnames, key, extra)} {_format_number(value)}")
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """Set directly, or computed at scrape time by `function`.
+
+    The function returns a number (unlabelled gauge) or {label values: number}.
+    """
+    kind = "gauge"
+
+    def __init__(self, name, help, labels=(), function=None):
+        super().__init__(name, help, labels)
+        self.function = function
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+    def set_function(self, function):
+        self.function = function
+
+    def samples(self):
+        if self.function is None:
+            yield from super().samples()
+            return
+        try:
+            value = self.function()
+        except Exception as e:
+            print(f"Error computing metric {self.name}: {e}")
+            return
+        if isinstance(value, dict):
+            for key, v in value.items():
+                yield "", key if isinstance(key, tuple) else (key,), None, v
+        else:
+            yield "", (), None, value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            data = self.values.get(key)
+            if data is None:
+                data = self.values[key] = [[0] * len(self.buckets), 0, 0.0] # bucket counts, count, sum
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    data[0][i] += 1
+            data[1] += 1
+            data[2] += value
+
+    def samples(self):
+        with self.lock:
+            items = [(key, (list(counts), count, total)) for key, (counts, count, total) in self.values.items()]
+        for key, (counts, count, total) in items:
+            for bound, bucket_count in zip(self.buckets, counts):
+                yield "_bucket", key, ("le", _format_number(float(bound))), bucket_count
+            yield "_bucket", key, ("le", "+Inf"), count
+            yield "_count", key, None, count
+            yield "_sum", key, None, total
+
+
+def render():
+    """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+
+# -- Metrics of the monitoring server ----------------------------------------
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "monitoreo_http_request_duration_seconds",
+    "HTTP request latency by route (streaming responses: until headers are sent)",
+    ["method", "route", "status"])
+
+VBOX_COMMAND_SECONDS = Histogram(
+    "monitoreo_vbox_command_duration_seconds",
+    "VBoxManage process runtime by subcommand",
+    ["subcommand"])
+VBOX_COMMAND_ERRORS = Counter(
+    "monitoreo_vbox_command_errors_total",
+    "VBoxManage calls that failed to start or exited non-zero",
+    ["subcommand"])
+
+SSH_SECONDS = Histogram(
+    "monitoreo_ssh_duration_seconds",
+    "SSH timings per server: connect (TCP), auth (key exchange + authentication), exec (command run)",
+    ["server", "phase"])
+SSH_ERRORS = Counter(
+    "monitoreo_ssh_errors_total",
+    "Failed SSH connects, authentications and command runs",
+    ["server", "phase"])
+
+SHELL_SESSIONS = Gauge(
+    "monitoreo_shell_sessions",
+    "Interactive shell sessions currently open")
+SHELL_SESSIONS_OPENED = Counter(
+    "monitoreo_shell_sessions_opened_total",
+    "Interactive shell sessions opened")
+SHELL_SESSIONS_CLOSED = Counter(
+    "monitoreo_shell_sessions_closed_total",
+    "Interactive shell sessions closed, by reason",
+    ["reason"])
+
+CACHE_REQUESTS = Counter(
+    "monitoreo_cache_requests_total",
+    "Cache lookups by cache and result (hit, shared = waited for an in-flight refresh, miss)",
+    ["cache", "result"])
+
+QUEUE_DEPTH = Gauge(
+    "monitoreo_queue_depth",
+    "Work waiting for a worker, by queue",
+    ["queue"])
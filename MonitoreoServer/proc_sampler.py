@@ -0,0 +1,74 @@
+import threading
+
+# Single exec on the guest: shell builtins read /proc, only `stat -f` forks.
+# Output lines:
+#   cpu  <user> <nice> <system> <idle> <iowait> <irq> <softirq> <steal> ...
+#   MemTotal: <kB>
+#   MemAvailable: <kB>
+#   <block size> <total blocks> <free blocks> <available blocks>   (for /)
+STATS_COMMAND = (
+    "read -r l < /proc/stat; echo \"$l\"; "
+    "while read -r k v u; do case $k in MemTotal:|MemAvailable:) echo \"$k $v\";; esac; done < /proc/meminfo; "
+    "stat -f -c '%S %b %f %a' /"
+)
+
+class ProcSampler:
+    """Turns STATS_COMMAND output into cpu/ram/disk percentages.
+
+    CPU usage is computed from the /proc/stat counter deltas between two
+    consecutive samples of the same server, so it reflects the sampling
+    interval rather than a snapshot. The first sample of a server (or one
+    taken after its counters reset, e.g. on reboot) falls back to the
+    since-boot average.
+    """
+
+    def __init__(self):
+        self.prev_cpu = {} # {server_id: (total, idle)}
+        self.lock = threading.Lock()
+
+    def parse(self, server_id, output):
+        cpu = ram = disk = 0.0
+        mem = {}
+        for line in output.splitlines():
+            fields = line.split()
+            if not fields:
+                continue
+            if fields[0] == "cpu":
+                cpu = self._cpu_percent(server_id, [int(x) for x in fields[1:]])
+            elif fields[0] in ("MemTotal:", "MemAvailable:"):
+                mem[fields[0]] = int(fields[1])
+            elif len(fields) == 4 and all(f.isdigit() for f in fields):
+                disk = self._disk_percent(*[int(f) for f in fields])
+
+        total = mem.get("MemTotal:")
+        if total:
+            ram = (total - mem.get("MemAvailable:", total)) * 100 / total
+
+        return {"cpu": round(cpu, 2), "ram": round(ram, 2), "disk": round(disk, 2)}
+
+    def _cpu_percent(self, server_id, counters):
+        # user nice system idle iowait irq softirq steal (guest time is already in user)
+        counters = (counters + [0] * 8)[:8]
+        total = sum(counters)
+        idle = counters[3] + counters[4]
+
+        with self.lock:
+            prev = self.prev_cpu.get(server_id)
+            self.prev_cpu[server_id] = (total, idle)
+
+        if prev and total > prev[0] and idle >= prev[1]:
+            d_total = total - prev[0]
+            return (d_total - (idle - prev[1])) * 100 / d_total
+        return (total - idle) * 100 / total if total else 0.0
+
+    @staticmethod
+    def _disk_percent(block_size, blocks, free, available):
+        # Same definition as df's Use%: used / (used + available to users)
+        used = blocks - free
+        if used + available <= 0:
+            return 0.0
+        return used * 100 / (used + available)
+
+    def forget(self, server_id):
+        with self.lock:
+            self.prev_cpu.pop(server_id, None)
@@ -0,0 +1,296 @@
+import contextvars
+import cProfile
+import io
+import marshal
+import pstats
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+
+# Requests slower than this (seconds) are logged with their span breakdown
+SLOW_REQUEST_SECONDS = 1.0
+# Slow requests and finished captures kept for the admin endpoints
+MAX_SLOW_REQUESTS = 100
+MAX_CAPTURES = 10
+# Seconds between stack samples in "sample" captures
+SAMPLE_INTERVAL = 0.005
+# Seconds an armed capture waits for its requests before it is stopped
+CAPTURE_TIMEOUT = 600
+
+# Trace of the request being served; also carried into VBoxExecutor workers
+_current = contextvars.ContextVar("trace", default=None)
+
+class Trace:
+    """Time spent in each kind of span during one request."""
+
+    def __init__(self, method, path):
+        self.method = method
+        self.path = path
+        self.started = time.perf_counter()
+        self.spans = {} # {name: [seconds, count]}
+        self.lock = threading.Lock() # Spans may be added from worker threads
+        self.token = None
+        self.capture = None # Capture this request is part of, if any
+        self.profile = None # Its cProfile.Profile in "cprofile" captures
+
+    def add(self, name, seconds):
+        with self.lock:
+            entry = self.spans.setdefault(name, [0.0, 0])
+            entry[0] += seconds
+            entry[1] += 1
+
+    def summary(self, total):
+        with self.lock:
+            spans = {name: {"ms": round(seconds * 1000, 1), "count": count}
+                     for name, (seconds, count) in self.spans.items()}
+        accounted = sum(s["ms"] for s in spans.values())
+        # Parallel spans (e.g. concurrent SSH execs) can add up to more than the request
+        spans["other"] = {"ms": round(max(0.0, total * 1000 - accounted), 1), "count": 1}
+        return spans
+
+
+def current():
+    return _current.get()
+
+@contextmanager
+def activate(trace):
+    """Make `trace` current in this thread (worker threads running a request's call)."""
+    token = _current.set(trace)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+@contextmanager
+def span(name):
+    """Time a block under `name` in the current request's trace (no-op outside requests)."""
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, time.perf_counter() - started)
+
+def record(name, seconds):
+    # For durations measured elsewhere, e.g. queue wait
+    trace = _current.get()
+    if trace is not None:
+        trace.add(name, seconds)
+
+
+class Capture:
+    """cProfile or stack-sampling profile of the next `count` requests to a route."""
+
+    def __init__(self, route, count, mode, timeout=CAPTURE_TIMEOUT):
+        self.id = uuid.uuid4().hex[:12]
+        self.route = route
+        self.mode = mode # "cprofile" or "sample"
+        self.remaining = count
+        self.requests = 0
+        self.active = 0 # Requests being profiled right now
+        self.created = time.time()
+        self.expires = self.created + timeout
+        self.finished = None
+        self.stopped = None # "timeout" or "cancelled" when ended before `count` requests
+        self.stats = None # pstats.Stats merged over requests (cprofile)
+        self.stacks = {}  # {collapsed stack: samples} (sample)
+        self.threads = set() # Idents of threads serving a sampled request right now
+        self.lock = threading.Lock()
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "route": self.route,
+            "mode": self.mode,
+            "requests": self.requests,
+            "remaining": self.remaining,
+            "created": self.created,
+            "expires": self.expires,
+            "finished": self.finished,
+            "stopped": self.stopped,
+        }
+
+    def claim(self):
+        """Take one of the remaining request slots; False once none are left or expired."""
+        with self.lock:
+            if self.remaining <= 0 or self.finished is not None:
+                return False
+            if time.time() >= self.expires:
+                self._stop("timeout")
+                return False
+            self.remaining -= 1
+            self.active += 1
+            return True
+
+    def release(self, profiled=True):
+        """A claimed request finished (or couldn't be profiled after all)."""
+        with self.lock:
+            self.active -= 1
+            if profiled:
+                self.requests += 1
+            else:
+                self.remaining += 1
+            if self.remaining == 0 and self.active == 0 and self.finished is None:
+                self.finished = time.time()
+
+    def stop(self, reason):
+        with self.lock:
+            self._stop(reason)
+
+    def _stop(self, reason):
+        # Called with self.lock held; requests already being profiled still finish into it
+        if self.finished is not None or self.remaining == 0:
+            return
+        self.remaining = 0
+        self.stopped = reason
+        if self.active == 0:
+            self.finished = time.time()
+
+    def _sample_loop(self):
+        while self.finished is None:
+            time.sleep(SAMPLE_INTERVAL)
+            if time.time() >= self.expires:
+                self.stop("timeout") # Route never fired often enough: don't sample forever
+            if not self.threads:
+                continue
+            frames = sys._current_frames()
+            with self.lock:
+                for ident in self.threads:
+                    frame = frames.get(ident)
+                    stack = []
+                    while frame is not None:
+                        code = frame.f_code
+                        stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+                        frame = frame.f_back
+                    if stack:
+                        key = ";".join(reversed(stack))
+                        self.stacks[key] = self.stacks.get(key, 0) + 1
+
+    def export(self, fmt=None):
+        """(data, mimetype, filename) of the capture."""
+        if self.mode == "sample":
+            # Collapsed stacks, as read by flamegraph.pl and speedscope
+            text = "".join(f"{stack} {count}\n" for stack, count in sorted(self.stacks.items()))
+            return text.encode(), "text/plain", f"profile-{self.id}.folded"
+        if self.stats is None:
+            return b"", "text/plain", f"profile-{self.id}.txt"
+        if fmt == "text":
+            out = io.StringIO()
+            stats = pstats.Stats(stream=out)
+            stats.add(self.stats)
+            stats.sort_stats("cumulative").print_stats(50)
+            return out.getvalue().encode(), "text/plain", f"profile-{self.id}.txt"
+        # Same bytes as Stats.dump_stats: load with pstats.Stats(path) or snakeviz
+        return marshal.dumps(self.stats.stats), "application/octet-stream", f"profile-{self.id}.prof"
+
+
+class RequestProfiler:
+    """Opt-in request timing with span breakdowns and on-demand profiles.
+
+    begin()/end() wrap every request: slow ones are logged and kept with the
+    time spent per span (lock wait, subprocess, ssh connect/exec, encoding).
+    arm() schedules a cProfile or sampling capture of the next requests to a
+    route, downloadable once finished; captures still armed after their
+    timeout, or cancel()led, end with the requests they got.
+    """
+
+    def __init__(self, slow_threshold=SLOW_REQUEST_SECONDS):
+        self.slow_threshold = slow_threshold
+        self.slow = deque(maxlen=MAX_SLOW_REQUESTS)
+        self.captures = {} # {capture_id: Capture}, insertion ordered
+        self.cprofile_lock = threading.Lock() # One cProfile may be active per process
+        self.lock = threading.Lock()
+
+    def begin(self, method, path, route):
+        trace = Trace(method, path)
+        trace.token = _current.set(trace)
+        with self.lock:
+            candidates = [c for c in self.captures.values() if c.route == route and c.remaining > 0]
+        capture = next((c for c in candidates if c.claim()), None)
+        if capture is not None:
+            trace.capture = capture
+            if capture.mode == "sample":
+                with capture.lock:
+                    capture.threads.add(threading.get_ident())
+            elif self.cprofile_lock.acquire(blocking=False):
+                trace.profile = cProfile.Profile()
+                trace.profile.enable()
+            else:
+                # Another request is being profiled: give the slot back
+                capture.release(profiled=False)
+                trace.capture = None
+        return trace
+
+    def end(self, trace, status):
+        total = time.perf_counter() - trace.started
+        _current.reset(trace.token)
+        capture = trace.capture
+        if capture is not None:
+            if trace.profile is not None:
+                trace.profile.disable()
+                self.cprofile_lock.release()
+                with capture.lock:
+                    if capture.stats is None:
+                        capture.stats = pstats.Stats(trace.profile)
+                    else:
+                        capture.stats.add(trace.profile)
+            else:
+                with capture.lock:
+                    capture.threads.discard(threading.get_ident())
+            capture.release()
+
+        if total >= self.slow_threshold:
+            entry = {
+                "method": trace.method,
+                "path": trace.path,
+                "status": status,
+                "ms": round(total * 1000, 1),
+                "time": time.time(),
+                "spans": trace.summary(total),
+            }
+            self.slow.append(entry)
+            breakdown = ", ".join(f"{name} {s['ms']}ms" for name, s in entry["spans"].items())
+            print(f"Slow request: {trace.method} {trace.path} {status} took {entry['ms']}ms ({breakdown})")
+
+    def arm(self, route, count=1, mode="cprofile", timeout=CAPTURE_TIMEOUT):
+        capture = Capture(route, count, mode, timeout)
+        self._expire() # So armed-but-abandoned captures can be pruned too
+        with self.lock:
+            self.captures[capture.id] = capture
+            # Drop the oldest finished captures
+            finished = [c for c in self.captures.values() if c.finished is not None]
+            for old in finished[:max(0, len(self.captures) - MAX_CAPTURES)]:
+                del self.captures[old.id]
+        if mode == "sample":
+            threading.Thread(target=capture._sample_loop, name=f"sampler-{capture.id}", daemon=True).start()
+        return capture
+
+    def cancel(self, capture_id):
+        capture = self.get(capture_id)
+        if capture is not None:
+            capture.stop("cancelled")
+        return capture
+
+    def _expire(self):
+        # cProfile captures have no thread of their own: time them out on access
+        now = time.time()
+        with self.lock:
+            captures = list(self.captures.values())
+        for capture in captures:
+            if capture.finished is None and now >= capture.expires:
+                capture.stop("timeout")
+        return captures
+
+    def get(self, capture_id):
+        self._expire()
+        with self.lock:
+            return self.captures.get(capture_id)
+
+    def list(self):
+        return self._expire()
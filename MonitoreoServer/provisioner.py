@@ -0,0 +1,539 @@
+"""Declarative, parallel provisioning of VirtualBox VMs for the dashboard.
+
+    python provisioner.py fleet.json [--config config.json] [--workers 4] [--dry-run]
+
+The spec (see provision.example.json) describes groups of VMs: a name
+pattern and count, CPUs/memory/disk, an SSH port or port range, credentials,
+and either an install ISO (unattended install) or a template VM to clone.
+Every VM gets a small dependency graph of steps (create -> disk -> storage,
+hardware, network -> unattended -> start [-> ssh_ready]) run through
+VMManager, so the calls share the VBoxExecutor, vbox_trace and /metrics.
+
+Many VMs are provisioned at once, as far as the host budget (CPUs and
+memory of the VMs in flight) allows. Completed steps are recorded in a state
+file next to the spec: after a failure, running the same command again only
+redoes what is missing or whose settings changed (a VM that was already
+installed and booted is never reinstalled). Each finished VM is merged
+into config.json, which a running dashboard picks up without a restart.
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from vm_manager import VMManager
+
+# VMs provisioned at once, on top of the CPU/memory budget
+PROVISION_WORKERS = 4
+# Seconds to wait for an installed guest to answer on its SSH port (wait_ssh)
+SSH_READY_TIMEOUT = 1800
+SSH_READY_POLL = 10
+# NAT rule forwarding the SSH port (same name as setup_vms.py)
+SSH_RULE = "ssh-rule"
+
+# Settings of a VM when neither its group nor the spec's "defaults" set them
+DEFAULTS = {
+    "ostype": "Ubuntu_64",
+    "cpus": 2,
+    "memory": 2048, # MB
+    "vram": 32,
+    "graphics": "vmsvga",
+    "disk_mb": 20000,
+    "iso": None, # Unattended install from this ISO...
+    "template": None, # ...or clone this VM
+    "snapshot": None, # Linked clone from this snapshot of the template
+    "ip": "127.0.0.1",
+    "ssh_user": "usuario",
+    "ssh_password": "password",
+    "ssh_key_path": "",
+    "country": "US",
+    "time_zone": "UTC",
+    "post_install_command": "sudo apt-get update && sudo apt-get install -y openssh-server",
+    "start_type": "headless",
+    "wait_ssh": False,
+}
+
+def _digest(value):
+    return hashlib.sha256(json.dumps(value, sort_keys=True).encode()).hexdigest()[:16]
+
+def _write_json(path, data):
+    # Write next to the target and rename, so readers never see half a file
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(data, f, indent=4)
+    os.replace(tmp, path)
+
+def _port_range(value, count):
+    """Candidate ports: "2230-2299", or an int meaning `count` ports from there."""
+    if isinstance(value, str) and "-" in value:
+        low, high = (int(p) for p in value.split("-", 1))
+        return list(range(low, high + 1))
+    return list(range(int(value), int(value) + count))
+
+def expand_spec(spec):
+    """One settings dict per VM, in spec order; raises ValueError on a bad spec."""
+    defaults = dict(DEFAULTS, **spec.get("defaults", {}))
+    vms, names = [], set()
+    for group in spec.get("vms", []):
+        settings = dict(defaults, **group)
+        count = int(settings.pop("count", 1))
+        first = int(settings.pop("first", 1))
+        pattern = settings.pop("name", None)
+        if not pattern:
+            raise ValueError("every VM group needs a name")
+        if "ssh_port" not in settings:
+            raise ValueError(f"{pattern}: ssh_port is required (a port or a range like 2230-2299)")
+        if bool(settings["iso"]) == bool(settings["template"]):
+            raise ValueError(f"{pattern}: set exactly one of iso or template")
+        ports = _port_range(settings.pop("ssh_port"), count)
+        for n in range(first, first + count):
+            name = pattern.format(n=n)
+            if name in names:
+                raise ValueError(f"duplicate VM name {name}")
+            names.add(name)
+            vm = dict(settings, name=name, ports=ports)
+            if "display_name" in vm:
+                vm["display_name"] = vm["display_name"].format(n=n)
+            vms.append(vm)
+    return vms
+
+def assign_ports(vms, servers, state):
+    """Pick each VM's SSH port from its candidates, stable across runs.
+
+    A port kept from the state file or the VM's existing config.json entry
+    wins; the others take the lowest free candidate. Ports of config.json
+    servers not in the spec are never reused.
+    """
+    names = {vm["name"] for vm in vms}
+    by_name = {s.get("name"): s for s in servers}
+    used = {s.get("ssh_port") for s in servers if s.get("name") not in names}
+    unassigned = []
+    for vm in vms:
+        for port in (state.vm(vm["name"]).get("ssh_port"), by_name.get(vm["name"], {}).get("ssh_port")):
+            if port in vm["ports"] and port not in used:
+                vm["ssh_port"] = port
+                used.add(port)
+                break
+        else:
+            unassigned.append(vm)
+    for vm in unassigned:
+        port = next((p for p in vm["ports"] if p not in used), None)
+        if port is None:
+            raise ValueError(f"{vm['name']}: no free SSH port left in {vm['ports'][0]}-{vm['ports'][-1]}")
+        vm["ssh_port"] = port
+        used.add(port)
+
+def server_id(name):
+    # "Web 01" -> "web_01", like the ids in config.json
+    return re.sub(r"[^a-z0-9]+", "_", name.lower()).strip("_")
+
+def parse_machinereadable(text):
+    info = {}
+    for line in text.splitlines():
+        key, sep, value = line.partition("=")
+        if sep:
+            info[key.strip('"')] = value.strip('"')
+    return info
+
+
+class ProvisionState:
+    """Completed steps per VM, persisted after every change for resuming."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.data = {"vms": {}}
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                self.data = json.load(f)
+
+    def vm(self, name):
+        with self.lock:
+            return self.data["vms"].setdefault(name, {"ssh_port": None, "steps": {}, "error": None})
+
+    def update(self, name, **fields):
+        with self.lock:
+            self.data["vms"][name].update(fields)
+            _write_json(self.path, self.data)
+
+    def step_done(self, name, step, digest):
+        with self.lock:
+            record = self.data["vms"][name]
+            record["steps"][step] = digest
+            record["error"] = None
+            _write_json(self.path, self.data)
+
+
+class ResourceBudget:
+    """Host CPUs and memory handed out to the VMs being provisioned.
+
+    A VM waits until its CPUs and memory fit next to the ones in flight; a VM
+    bigger than the whole budget runs alone instead of never.
+    """
+
+    def __init__(self, cpus=None, memory=None):
+        self.cpus = cpus
+        self.memory = memory
+        self.cpus_used = 0
+        self.memory_used = 0
+        self.active = 0
+        self.cond = threading.Condition()
+
+    def _fits(self, cpus, memory):
+        if self.active == 0:
+            return True
+        return ((self.cpus is None or self.cpus_used + cpus <= self.cpus)
+                and (self.memory is None or self.memory_used + memory <= self.memory))
+
+    @contextmanager
+    def reserve(self, cpus, memory):
+        with self.cond:
+            while not self._fits(cpus, memory):
+                self.cond.wait()
+            self.active += 1
+            self.cpus_used += cpus
+            self.memory_used += memory
+        try:
+            yield
+        finally:
+            with self.cond:
+                self.active -= 1
+                self.cpus_used -= cpus
+                self.memory_used -= memory
+                self.cond.notify_all()
+
+def host_budget():
+    """(cpus, memory MB) of this host; memory is None where it can't be read."""
+    try:
+        memory = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // (1024 * 1024)
+    except (AttributeError, ValueError, OSError):
+        memory = None
+    return os.cpu_count() or 1, memory
+
+
+class Step:
+    def __init__(self, name, requires, run, settings):
+        self.name = name
+        self.requires = requires
+        self.run = run
+        self.digest = _digest(settings) # Re-run the step when its settings change
+
+class VMProvision:
+    """Step graph of one VM. Steps check VirtualBox first and skip work already done."""
+
+    def __init__(self, manager, vm):
+        self.manager = manager
+        self.vm = vm
+        self.name = vm["name"]
+
+    def vbox(self, args, check=True):
+        result = self.manager._run_vbox(args)
+        if check and result.returncode != 0:
+            raise RuntimeError(result.stderr.strip() or f"VBoxManage {args[0]} exited with {result.returncode}")
+        return result
+
+    def info(self):
+        """showvminfo --machinereadable as a dict, or None if the VM isn't registered."""
+        result = self.vbox(["showvminfo", self.name, "--machinereadable"], check=False)
+        return parse_machinereadable(result.stdout) if result.returncode == 0 else None
+
+    def steps(self):
+        vm = self.vm
+        if vm["template"]:
+            created = "clone"
+            steps = [Step("clone", (), self.clone, [vm["template"], vm["snapshot"]])]
+        else:
+            created = "create"
+            steps = [Step("create", (), self.create, [vm["ostype"]]),
+                     Step("disk", ("create",), self.disk, [vm["disk_mb"]]),
+                     Step("storage", ("disk",), self.storage, [])]
+        steps += [Step("hardware", (created,), self.hardware, [vm["cpus"], vm["memory"], vm["vram"], vm["graphics"]]),
+                  Step("network", (created,), self.network, [vm["ssh_port"]])]
+        if vm["template"]:
+            steps.append(Step("start", ("hardware", "network"), self.start, [vm["start_type"]]))
+        else:
+            steps.append(Step("unattended", ("storage", "hardware"), self.unattended,
+                              [vm["iso"], vm["ssh_user"], _digest(vm["ssh_password"]), vm["country"],
+                               vm["time_zone"], vm["post_install_command"]]))
+            steps.append(Step("start", ("unattended", "network"), self.start, [vm["start_type"]]))
+        if vm["wait_ssh"]:
+            steps.append(Step("ssh_ready", ("start",), self.ssh_ready, []))
+        return steps
+
+    # -- Steps -----------------------------------------------------------
+
+    def create(self):
+        if self.info() is None:
+            self.vbox(["createvm", "--name", self.name, "--ostype", self.vm["ostype"], "--register"])
+
+    def clone(self):
+        if self.info() is not None:
+            return
+        args = ["clonevm", self.vm["template"], "--name", self.name, "--register"]
+        if self.vm["snapshot"]:
+            args += ["--snapshot", self.vm["snapshot"], "--options", "link"]
+        self.vbox(args)
+
+    def disk_path(self):
+        info = self.info() or {}
+        folder = os.path.dirname(info.get("CfgFile", "")) or os.path.join(
+            os.path.expanduser("~"), "VirtualBox VMs", self.name)
+        return os.path.join(folder, f"{self.name}.vdi")
+
+    def disk(self):
+        path = self.disk_path()
+        if not os.path.exists(path):
+            self.vbox(["createmedium", "disk", "--filename", path, "--size", str(self.vm["disk_mb"])])
+
+    def storage(self):
+        info = self.info() or {}
+        controllers = {v for k, v in info.items() if k.startswith("storagecontrollername")}
+        if "SATA" not in controllers:
+            self.vbox(["storagectl", self.name, "--name", "SATA", "--add", "sata", "--controller", "IntelAhci"])
+        if info.get("SATA-0-0", "none") == "none":
+            self.vbox(["storageattach", self.name, "--storagectl", "SATA", "--port", "0", "--device", "0",
+                       "--type", "hdd", "--medium", self.disk_path()])
+
+    def hardware(self):
+        wanted = {"cpus": str(self.vm["cpus"]), "memory": str(self.vm["memory"]),
+                  "vram": str(self.vm["vram"]), "graphicscontroller": self.vm["graphics"].lower()}
+        info = self.info() or {}
+        if all(info.get(key) == value for key, value in wanted.items()):
+            return
+        self.vbox(["modifyvm", self.name, "--cpus", str(self.vm["cpus"]), "--memory", str(self.vm["memory"]),
+                   "--vram", str(self.vm["vram"]), "--graphicscontroller", self.vm["graphics"], "--audio", "none"])
+
+    def network(self):
+        rule = f"{SSH_RULE},tcp,,{self.vm['ssh_port']},,22"
+        info = self.info() or {}
+        rules = {v for k, v in info.items() if k.startswith("Forwarding(")}
+        if rule in rules:
+            return
+        if info.get("VMState") == "running":
+            # Port changed after the VM was started: NAT rules can be edited live
+            command, option = "controlvm", "natpf1"
+        else:
+            command, option = "modifyvm", "--natpf1"
+            self.vbox(["modifyvm", self.name, "--nic1", "nat"])
+        if any(r.startswith(f"{SSH_RULE},") for r in rules):
+            # Cloned from a template, or the port changed since the last run
+            self.vbox([command, self.name, option, "delete", SSH_RULE])
+        self.vbox([command, self.name, option, rule])
+
+    def installed(self):
+        """True if the VM is running, or has a disk attached and has been booted before."""
+        info = self.info() or {}
+        if info.get("VMState") == "running":
+            return True
+        if info.get("SATA-0-0", "none") == "none" or not info.get("CfgFile"):
+            return False
+        # VirtualBox writes Logs/VBox.log next to the .vbox file on every start
+        return os.path.exists(os.path.join(os.path.dirname(info["CfgFile"]), "Logs", "VBox.log"))
+
+    def unattended(self):
+        # Never reinstalls: with the state file lost, or install settings changed
+        # after the VM was booted, the step is only recorded as done. To reinstall,
+        # delete the VM (VBoxManage unregistervm <name> --delete) and run again.
+        if self.installed():
+            print(f"[{self.name}] already installed, skipping unattended install")
+            return
+        hostname = re.sub(r"[^A-Za-z0-9-]+", "-", self.name)
+        self.vbox([
+            "unattended", "install", self.name,
+            f"--iso={self.vm['iso']}",
+            f"--user={self.vm['ssh_user']}",
+            f"--password={self.vm['ssh_password']}",
+            f"--full-user-name={self.vm['ssh_user']}",
+            f"--country={self.vm['country']}",
+            f"--time-zone={self.vm['time_zone']}",
+            f"--hostname={hostname}.local",
+            f"--post-install-command={self.vm['post_install_command']}",
+        ])
+
+    def start(self):
+        if (self.info() or {}).get("VMState") != "running":
+            self.vbox(["startvm", self.name, "--type", self.vm["start_type"]])
+
+    def ssh_ready(self):
+        # The NAT forward accepts connections before the guest listens: wait for the banner
+        deadline = time.time() + SSH_READY_TIMEOUT
+        while True:
+            try:
+                with socket.create_connection((self.vm["ip"], self.vm["ssh_port"]), timeout=5) as sock:
+                    if sock.recv(4).startswith(b"SSH-"):
+                        return
+            except OSError:
+                pass
+            if time.time() >= deadline:
+                raise RuntimeError(f"no SSH on port {self.vm['ssh_port']} after {SSH_READY_TIMEOUT}s")
+            time.sleep(SSH_READY_POLL)
+
+    def config_entry(self):
+        info = self.info() or {}
+        return {
+            "id": server_id(self.name),
+            "name": self.name,
+            "display_name": self.vm.get("display_name", self.name),
+            "ip": self.vm["ip"],
+            "ssh_port": self.vm["ssh_port"],
+            "ssh_user": self.vm["ssh_user"],
+            "ssh_password": self.vm["ssh_password"],
+            "ssh_key_path": self.vm["ssh_key_path"],
+            "vbox_uuid": info.get("UUID", ""),
+        }
+
+
+def ordered(steps):
+    """Steps in dependency order (stable for independent steps)."""
+    done, result, remaining = set(), [], list(steps)
+    while remaining:
+        ready = [s for s in remaining if all(r in done for r in s.requires)]
+        if not ready:
+            raise ValueError(f"unsatisfiable step requirements: {[s.name for s in remaining]}")
+        for s in ready:
+            remaining.remove(s)
+            done.add(s.name)
+            result.append(s)
+    return result
+
+
+class Provisioner:
+    """Provisions the VMs of a spec concurrently and registers them in config.json."""
+
+    def __init__(self, spec, config_path="config.json", state_path=None, workers=None, manager=None):
+        self.config_path = config_path
+        self.manager = manager or VMManager(config_path)
+        self.state = ProvisionState(state_path)
+        budget = spec.get("budget", {})
+        host_cpus, host_memory = host_budget()
+        self.budget = ResourceBudget(budget.get("cpus", host_cpus), budget.get("memory", host_memory))
+        # --workers, then the spec's budget, then the default
+        self.workers = workers or budget.get("workers") or PROVISION_WORKERS
+        self.vms = expand_spec(spec)
+        assign_ports(self.vms, self.manager.servers, self.state)
+        self.config_lock = threading.Lock()
+
+    def plan(self):
+        """[(vm, [pending step names])] without touching VirtualBox."""
+        plan = []
+        for vm in self.vms:
+            done = self.state.vm(vm["name"])["steps"]
+            steps = VMProvision(self.manager, vm).steps()
+            plan.append((vm, [s.name for s in ordered(steps) if done.get(s.name) != s.digest]))
+        return plan
+
+    def run(self):
+        """Provision every VM; returns {name: None on success, else the error}."""
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="provision") as pool:
+            futures = {vm["name"]: pool.submit(self.provision, vm) for vm in self.vms}
+        return {name: future.result() for name, future in futures.items()}
+
+    def provision(self, vm):
+        name = vm["name"]
+        record = self.state.vm(name)
+        self.state.update(name, ssh_port=vm["ssh_port"])
+        provision = VMProvision(self.manager, vm)
+        pending = [s for s in ordered(provision.steps()) if record["steps"].get(s.name) != s.digest]
+        if pending:
+            failed = {}
+            with self.budget.reserve(vm["cpus"], vm["memory"]):
+                for step in pending:
+                    blocked = [r for r in step.requires if r in failed]
+                    if blocked:
+                        failed[step.name] = f"blocked by {blocked[0]}"
+                        continue
+                    started = time.time()
+                    try:
+                        step.run()
+                    except Exception as e:
+                        failed[step.name] = str(e)
+                        self.state.update(name, error=f"{step.name}: {e}")
+                        print(f"[{name}] {step.name} failed: {e}")
+                        continue
+                    self.state.step_done(name, step.name, step.digest)
+                    print(f"[{name}] {step.name} done ({time.time() - started:.1f}s)")
+            if failed:
+                return "; ".join(f"{step}: {error}" for step, error in failed.items())
+        try:
+            self.register(provision.config_entry())
+        except Exception as e:
+            return f"writing {self.config_path}: {e}"
+        return None
+
+    def register(self, entry):
+        """Add or update the VM's entry in config.json (matched by name, then id)."""
+        with self.config_lock:
+            with open(self.config_path, 'r') as f:
+                servers = json.load(f)
+            existing = next((s for s in servers if s.get("name") == entry["name"]), None) \
+                or next((s for s in servers if s.get("id") == entry["id"]), None)
+            if existing is None:
+                servers.append(entry)
+            else:
+                # Keep the id the dashboard already knows, and any extra fields
+                updated = dict(existing, **entry)
+                updated["id"] = existing["id"]
+                if not entry["vbox_uuid"]:
+                    updated["vbox_uuid"] = existing.get("vbox_uuid", "")
+                if updated == existing:
+                    return
+                servers[servers.index(existing)] = updated
+            _write_json(self.config_path, servers)
+            print(f"[{entry['name']}] registered in {self.config_path} (SSH port {entry['ssh_port']})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Provision VirtualBox VMs from a declarative spec")
+    parser.add_argument("spec", help="JSON spec, see provision.example.json")
+    parser.add_argument("--config", default="config.json", help="dashboard config to add the VMs to")
+    parser.add_argument("--state", help="resume state file (default: <spec>.state.json)")
+    parser.add_argument("--workers", type=int,
+                        help=f"VMs provisioned at once (default: the spec's budget.workers, else {PROVISION_WORKERS})")
+    parser.add_argument("--dry-run", action="store_true", help="print the pending steps and exit")
+    args = parser.parse_args()
+
+    with open(args.spec, 'r') as f:
+        spec = json.load(f)
+    try:
+        provisioner = Provisioner(spec, args.config, args.state or f"{os.path.splitext(args.spec)[0]}.state.json",
+                                  args.workers)
+    except ValueError as e:
+        print(f"Invalid spec: {e}")
+        return 2
+
+    for vm, pending in provisioner.plan():
+        source = f"clone of {vm['template']}" if vm["template"] else os.path.basename(vm["iso"])
+        print(f"{vm['name']}: port {vm['ssh_port']}, {vm['cpus']} CPUs, {vm['memory']} MB, {source}; "
+              f"{', '.join(pending) if pending else 'up to date'}")
+    if args.dry_run:
+        return 0
+
+    missing = {vm["iso"] for vm, pending in provisioner.plan()
+               if "unattended" in pending and not os.path.exists(vm["iso"])}
+    if missing:
+        print(f"ISO not found: {', '.join(sorted(missing))}")
+        return 1
+    try:
+        provisioner.manager._run_vbox(["--version"])
+    except FileNotFoundError:
+        print("Cannot find VBoxManage. Please check VBOX_MANAGE_CMD.")
+        return 1
+
+    started = time.time()
+    results = provisioner.run()
+    failed = {name: error for name, error in results.items() if error}
+    print(f"\n{len(results) - len(failed)}/{len(results)} VMs provisioned in {time.time() - started:.0f}s")
+    for name, error in failed.items():
+        print(f"  {name}: {error}")
+    if failed:
+        print("Fix the errors and run the same command again to resume.")
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -1,13 +1,100 @@
-from flask import Flask, jsonify, request, send_from_directory, send_file
+from flask import Flask, Response, g, jsonify, request, send_from_directory, send_file
 from flask_cors import CORS
 from vm_manager import VMManager
-from shell_manager import ShellManager
+from shell_manager import ShellManager, DEFAULT_SESSION
+from collector import StatsCollector
+from metric_history import MetricHistory
+from frame_store import FrameStore
+from image_codec import can_transcode, image_params
+from tile_codec import TileEncoder
+from event_hub import EventHub
+from jobs import JobManager, DEFAULT_JOB_TIMEOUT, select_servers, fan_out
+import metrics
+import profiler
+from profiler import RequestProfiler, SLOW_REQUEST_SECONDS, CAPTURE_TIMEOUT
+from metrics import HTTP_REQUEST_SECONDS, CACHE_REQUESTS
+import json
+from contextlib import closing
+from io import BytesIO
 import os
+import time
+
+# Live stream pacing: frames per second allowed, and how often an unchanged
+# frame is re-sent so a closed connection is noticed
+STREAM_MAX_FPS = 10
+STREAM_KEEPALIVE = 2.0
+
+# Longest a console long-poll may block (milliseconds)
+CONSOLE_MAX_WAIT_MS = 30000
+
+# Seconds /ssh_exec waits for its job before answering with the job id instead
+SSH_EXEC_WAIT = 30
+
+# Seconds between SSE keepalive comments (also how fast a gone client is noticed)
+EVENTS_KEEPALIVE = 15
+
+# Seconds between background stats samples of each running server
+STATS_INTERVAL = 5
+# "exec" runs the /proc sampler per tick; "agent" streams from a collector pushed to each guest
+STATS_MODE = "exec"
+# Seconds between samples streamed by the guest agent (sub-second is fine)
+AGENT_INTERVAL = 1.0
+
+# Per-request span timing, slow-request log and /api/admin/profile (opt-in)
+PROFILING = os.environ.get("MONITOREO_PROFILING") == "1"
 
 app = Flask(__name__, static_folder='.')
-CORS(app) # Enable CORS for all routes
-vm_manager = VMManager()
-shell_manager = ShellManager(vm_manager)
+CORS(app, expose_headers=["ETag", "X-Frame-Id"]) # Enable CORS for all routes
+vm_manager = VMManager(stats_mode=STATS_MODE, agent_interval=AGENT_INTERVAL)
+event_hub = EventHub()
+job_manager = JobManager(vm_manager)
+shell_manager = ShellManager(vm_manager, events=event_hub)
+frame_store = FrameStore(vm_manager, events=event_hub)
+tile_encoder = TileEncoder()
+metric_history = MetricHistory()
+# In agent mode reading a sample is a memory lookup, so sample at the agent's rate
+stats_collector = StatsCollector(vm_manager, interval=AGENT_INTERVAL if STATS_MODE == "agent" else STATS_INTERVAL,
+                                 history=metric_history, events=event_hub)
+request_profiler = RequestProfiler(slow_threshold=SLOW_REQUEST_SECONDS) if PROFILING else None
+
+# Gauges read at scrape time
+metrics.SHELL_SESSIONS.set_function(lambda: len(shell_manager.sessions))
+metrics.QUEUE_DEPTH.set_function(lambda: {
+    ("vbox",): vm_manager.vbox.waiting,
+    ("jobs",): job_manager.queued(),
+})
+
+@app.before_request
+def start_timer():
+    g.request_started = time.perf_counter()
+    if request_profiler is not None:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        g.trace = request_profiler.begin(request.method, request.full_path.rstrip('?'), route)
+
+@app.after_request
+def record_status(response):
+    g.response_status = response.status_code
+    return response
+
+@app.teardown_request
+def record_request(exc):
+    # Teardown also runs when a view raised, so failed requests are counted (as 500s)
+    started = g.pop('request_started', None)
+    status = 500 if exc is not None else g.pop('response_status', 500)
+    trace = g.pop('trace', None)
+    if trace is not None:
+        # Always ends the trace, or a raising view would keep its cProfile running
+        request_profiler.end(trace, status)
+    if started is not None:
+        # Route template, not the path, to keep one series per endpoint
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, method=request.method,
+                                     route=route, status=status)
+
+@app.route('/metrics')
+def get_metrics():
+    # Prometheus text exposition format
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/')
 def index():
@@ -25,6 +112,22 @@ def get_servers():
 def get_config():
     return jsonify(vm_manager.get_server_config())
 
+@app.route('/api/vbox/trace')
+def get_vbox_trace():
+    # ?limit=&vm=&since=<seq>: recent VBoxManage calls, newest last, and a per-subcommand summary
+    try:
+        limit = min(max(int(request.args.get('limit', 100)), 1), 1000)
+        since = int(request.args.get('since', 0))
+    except ValueError:
+        return jsonify({"error": "limit and since must be integers"}), 400
+    calls = vm_manager.vbox_trace.recent(limit, request.args.get('vm'), since)
+    return jsonify({"calls": calls, "summary": vm_manager.vbox_trace.summary(calls)})
+
+@app.route('/api/config/reload', methods=['POST'])
+def reload_config():
+    # config.json is also re-read automatically when it changes (see VMManager.start_config_watcher)
+    return jsonify(vm_manager.reload_config(force=True))
+
 @app.route('/api/server/<name>/start', methods=['POST'])
 def start_server(name):
     success, message = vm_manager.start_vm(name)
@@ -43,45 +146,178 @@ def restart_server(name):
 @app.route('/api/server/<name>/screenshot')
 def get_screenshot(name):
     timestamp = request.args.get('t')
-    path = vm_manager.get_screenshot(name)
-    if path and os.path.exists(path):
-        try:
-            # send_file(path) keeps file open?
-            # We can use a trick: delete it after response is sent?
-            # Or read into bytesIO and send?
-            
-            # Read to memory
-            with open(path, 'rb') as f:
-                data = f.read()
-            
-            # Now delete file
-            os.remove(path)
-            
-            from io import BytesIO
-            return send_file(BytesIO(data), mimetype='image/png')
-        except Exception as e:
-            print(f"Error serving screenshot: {e}")
-            return "Error", 500
+    # ?format=webp|jpeg|png&width=&quality= select a cached encoding of the frame
+    try:
+        fmt, width, quality = image_params(request.args, 'png')
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Served from memory; concurrent viewers share one capture (see FrameStore)
+    frame = frame_store.get(name)
+    if frame is None:
+        return "Screenshot not available", 404
+    data, mimetype, etag = frame.variant(fmt, width, quality)
+
+    # Idle consoles cost a 304: either the client's frame id or its ETag still matches
+    since = request.args.get('since')
+    if (since and since == str(frame.frame_id)) or request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
     else:
+        response = send_file(BytesIO(data), mimetype=mimetype)
+    response.set_etag(etag)
+    response.headers['X-Frame-Id'] = str(frame.frame_id)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/api/server/<name>/stream')
+def stream_screen(name):
+    # Same encoding parameters as /screenshot; JPEG is what every browser
+    # renders inside multipart/x-mixed-replace
+    try:
+        fmt, width, quality = image_params(request.args, 'jpeg')
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        fps = min(max(float(request.args.get('fps', 5)), 0.2), STREAM_MAX_FPS)
+    except ValueError:
+        return jsonify({"error": "fps must be a number"}), 400
+
+    def generate():
+        interval = 1.0 / fps
+        last_id = None
+        last_sent = last_ok = time.time()
+        # The generator is closed when a write fails, i.e. once the client is
+        # gone; unchanged frames are re-sent every STREAM_KEEPALIVE seconds so
+        # that happens even on an idle console.
+        while True:
+            started = time.time()
+            frame = frame_store.get(name, max_age=interval)
+            if frame is None:
+                # Nothing to send means no way to notice a disconnect: give up
+                # on VMs that stay unavailable and let the client reconnect
+                if started - last_ok > 5 * STREAM_KEEPALIVE:
+                    return
+            else:
+                last_ok = started
+            if frame is not None and (frame.frame_id != last_id or started - last_sent >= STREAM_KEEPALIVE):
+                data, mimetype, etag = frame.variant(fmt, width, quality)
+                last_id, last_sent = frame.frame_id, started
+                yield (f"--frame\r\nContent-Type: {mimetype}\r\nContent-Length: {len(data)}\r\n"
+                       f"X-Frame-Id: {frame.frame_id}\r\n\r\n").encode() + data + b"\r\n"
+            time.sleep(max(0, interval - (time.time() - started)))
+
+    return Response(generate(), mimetype='multipart/x-mixed-replace; boundary=frame',
+                    headers={'Cache-Control': 'no-cache'})
+
+@app.route('/api/server/<name>/tiles')
+def get_tiles(name):
+    # ?since=<frame id the client has> -> only the tiles that changed since then
+    if not can_transcode():
+        return jsonify({"error": "Tile updates require Pillow"}), 501
+    try:
+        fmt, _, quality = image_params(request.args, 'png')
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        since = int(request.args['since']) if request.args.get('since') else None
+    except ValueError:
+        return jsonify({"error": "since must be an integer"}), 400
+
+    frame = frame_store.get(name)
+    if frame is None:
         return "Screenshot not available", 404
+    if since == frame.frame_id:
+        return app.response_class(status=304, headers={'X-Frame-Id': str(frame.frame_id)})
+    with profiler.span("encoding"):
+        delta = tile_encoder.delta(name, frame, since, fmt, quality)
+    return jsonify(delta)
+
+@app.route('/api/events')
+def events():
+    # Server-Sent Events: status, stats, console and frame updates are published
+    # once by the background producers and fanned out to every open dashboard
+    sub = event_hub.subscribe()
+    shell_manager.touch_all() # Someone is watching the consoles again
+
+    def generate():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                item = sub.get(timeout=EVENTS_KEEPALIVE)
+                if item is None:
+                    yield ": keepalive\n\n"
+                else:
+                    yield EventHub.format_sse(*item)
+        finally:
+            event_hub.unsubscribe(sub)
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @app.route('/api/server/<id>/stats')
 def get_stats(id):
-    stats = vm_manager.get_stats(id)
+    # Served from the background collector's cache, never from a live SSH call
+    stats = stats_collector.get_latest(id)
+    CACHE_REQUESTS.inc(cache="stats", result="miss" if stats is None else "hit")
+    if stats is None:
+        if vm_manager.find_server(id) is None:
+            return jsonify(None)
+        stats = {"cpu": 0, "ram": 0, "disk": 0, "error": "No sample yet", "age": None}
     return jsonify(stats)
 
+@app.route('/api/server/<id>/stats/history')
+def get_stats_history(id):
+    # ?from=&to= are unix timestamps (default: last hour), ?points= caps the series length
+    try:
+        end = float(request.args.get('to', time.time()))
+        start = float(request.args.get('from', end - 3600))
+        points = min(int(request.args.get('points', 300)), 2000)
+    except ValueError:
+        return jsonify({"error": "from, to and points must be numbers"}), 400
+    series = metric_history.query(id, start, end, points)
+    return jsonify({"from": start, "to": end, "series": series})
+
 @app.route('/api/server/<id>/command', methods=['POST'])
 def run_command(id):
     data = request.json
     command = data.get('command')
     # Use ShellManager for persistent session
-    success = shell_manager.send_input(id, command)
+    success = shell_manager.send_input(id, command, data.get('session', DEFAULT_SESSION))
     return jsonify({"success": success})
 
 @app.route('/api/server/<id>/console/output')
 def get_console_output(id):
-    output = shell_manager.get_output(id)
-    return jsonify({"output": output})
+    # ?since=<offset from the previous reply>&wait=<ms> long-polls for new output;
+    # without since, returns what arrived since the last such call
+    if request.args.get('since') is None:
+        output = shell_manager.get_output(id, name=request.args.get('session', DEFAULT_SESSION))
+        return jsonify({"output": output})
+    try:
+        since = int(request.args['since'])
+        wait = min(max(int(request.args.get('wait', 0)), 0), CONSOLE_MAX_WAIT_MS) / 1000
+    except ValueError:
+        return jsonify({"error": "since and wait must be integers"}), 400
+    output, offset = shell_manager.get_output(id, since, wait, request.args.get('session', DEFAULT_SESSION))
+    return jsonify({"output": output, "offset": offset})
+
+@app.route('/api/server/<id>/console/screen')
+def get_console_screen(id):
+    # Rendered terminal rows changed since ?since=<version> (0 = whole screen),
+    # long-polling up to ?wait=<ms>; the same diffs are pushed as "screen" events
+    try:
+        since = int(request.args.get('since', 0))
+        wait = min(max(int(request.args.get('wait', 0)), 0), CONSOLE_MAX_WAIT_MS) / 1000
+    except ValueError:
+        return jsonify({"error": "since and wait must be integers"}), 400
+    screen = shell_manager.get_screen(id, since, wait, request.args.get('session', DEFAULT_SESSION))
+    if screen is None:
+        return jsonify({"error": "Console not available"}), 404
+    return jsonify(screen)
+
+@app.route('/api/console/sessions')
+def get_console_sessions():
+    # Open shell sessions (optionally named per server with ?session=) and their footprint
+    return jsonify(shell_manager.stats())
 
 @app.route('/api/server/<name>/type', methods=['POST'])
 def type_text(name):
@@ -94,9 +330,148 @@ def type_text(name):
 def ssh_exec(id):
     data = request.json
     command = data.get('command')
-    # Synchronous execution
-    output = vm_manager.execute_command(id, command)
-    return jsonify({"output": output})
+    # Runs as a job: short commands answer inline as before, long ones hand
+    # back a job id instead of pinning this worker
+    try:
+        timeout = float(data.get('timeout', DEFAULT_JOB_TIMEOUT))
+    except (TypeError, ValueError):
+        return jsonify({"error": "timeout must be a number"}), 400
+    job = job_manager.submit(id, command, timeout=timeout)
+    with profiler.span("ssh_exec"): # Runs on a job worker: time the wait for it
+        finished = job.done.wait(SSH_EXEC_WAIT)
+    return jsonify(ssh_exec_reply(job, finished))
+
+def ssh_exec_reply(job, finished):
+    # /ssh_exec body, shared with async_server.py
+    if not finished:
+        return {"output": f"Command still running in background (job {job.id})", "job_id": job.id}
+    result = job.result
+    if result is None:
+        return {"output": f"Job {job.status}", "job_id": job.id}
+    output = result["stdout"] + result["stderr"]
+    if result["error"] and result["exit_code"] is None:
+        output = f"{output}[{result['error']}]" if output else result["error"]
+    return {"output": output, "job_id": job.id}
+
+@app.route('/api/servers/exec', methods=['POST'])
+def fleet_exec():
+    # {"command": ..., "target": "all" | "running" | [ids] | {"tag": ...},
+    #  "parallelism": n, "timeout": s} -> NDJSON, one line per server as it
+    # finishes, then a summary line
+    data = request.json or {}
+    command = data.get('command')
+    if not command:
+        return jsonify({"error": "command is required"}), 400
+    server_ids = select_servers(vm_manager, data.get('target', 'running'))
+    if server_ids is None:
+        return jsonify({"error": "target must be all, running, a list of ids or {\"tag\": ...}"}), 400
+    try:
+        parallelism = int(data.get('parallelism', 8))
+        timeout = float(data.get('timeout', DEFAULT_JOB_TIMEOUT))
+    except (TypeError, ValueError):
+        return jsonify({"error": "parallelism and timeout must be numbers"}), 400
+
+    def generate():
+        started = time.time()
+        ok = failed = 0
+        # closing(): a disconnect closes fan_out right away, which stops its commands
+        with closing(fan_out(vm_manager, server_ids, command, parallelism, timeout)) as results:
+            for result in results:
+                if result["error"] is None and result["exit_code"] == 0:
+                    ok += 1
+                else:
+                    failed += 1
+                yield json.dumps(result) + "\n"
+        yield json.dumps({"summary": {"targets": len(server_ids), "succeeded": ok, "failed": failed,
+                                      "duration": round(time.time() - started, 3)}}) + "\n"
+
+    return Response(generate(), mimetype='application/x-ndjson', headers={'Cache-Control': 'no-cache'})
+
+@app.route('/api/server/<id>/jobs', methods=['POST'])
+def submit_job(id):
+    data = request.json or {}
+    command = data.get('command')
+    if not command:
+        return jsonify({"error": "command is required"}), 400
+    try:
+        timeout = float(data.get('timeout', DEFAULT_JOB_TIMEOUT))
+    except (TypeError, ValueError):
+        return jsonify({"error": "timeout must be a number"}), 400
+    job = job_manager.submit(id, command, timeout=timeout)
+    return jsonify(job.to_dict()), 202
+
+@app.route('/api/jobs')
+def list_jobs():
+    return jsonify([job.to_dict(include_output=False) for job in job_manager.list()])
+
+@app.route('/api/jobs/<job_id>')
+def get_job(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/api/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    job = job_manager.cancel(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.to_dict(include_output=False))
+
+@app.route('/api/admin/profile')
+def get_profiling():
+    if request_profiler is None:
+        return jsonify({"error": "Profiling is disabled (start with MONITOREO_PROFILING=1)"}), 404
+    return jsonify({
+        "slow_threshold": request_profiler.slow_threshold,
+        "slow_requests": list(request_profiler.slow),
+        "captures": [c.to_dict() for c in request_profiler.list()],
+    })
+
+@app.route('/api/admin/profile', methods=['POST'])
+def start_profile_capture():
+    # {"route": "/api/server/<id>/stats", "count": 5, "mode": "cprofile" | "sample", "timeout": 600}
+    if request_profiler is None:
+        return jsonify({"error": "Profiling is disabled (start with MONITOREO_PROFILING=1)"}), 404
+    data = request.json or {}
+    route = data.get('route')
+    if not route or not any(rule.rule == route for rule in app.url_map.iter_rules()):
+        return jsonify({"error": "route must be a route template such as /api/servers"}), 400
+    mode = data.get('mode', 'cprofile')
+    if mode not in ("cprofile", "sample"):
+        return jsonify({"error": "mode must be cprofile or sample"}), 400
+    try:
+        count = max(1, min(int(data.get('count', 1)), 1000))
+    except (TypeError, ValueError):
+        return jsonify({"error": "count must be an integer"}), 400
+    try:
+        timeout = max(1, min(float(data.get('timeout', CAPTURE_TIMEOUT)), 24 * 3600))
+    except (TypeError, ValueError):
+        return jsonify({"error": "timeout must be a number of seconds"}), 400
+    capture = request_profiler.arm(route, count, mode, timeout)
+    return jsonify(capture.to_dict()), 202
+
+@app.route('/api/admin/profile/<capture_id>', methods=['DELETE'])
+def cancel_profile_capture(capture_id):
+    # Stops waiting for requests; what was captured so far stays downloadable
+    capture = request_profiler.cancel(capture_id) if request_profiler is not None else None
+    if capture is None:
+        return jsonify({"error": "Capture not found"}), 404
+    return jsonify(capture.to_dict())
+
+@app.route('/api/admin/profile/<capture_id>')
+def download_profile(capture_id):
+    capture = request_profiler.get(capture_id) if request_profiler is not None else None
+    if capture is None:
+        return jsonify({"error": "Capture not found"}), 404
+    if capture.finished is None:
+        return jsonify(dict(capture.to_dict(), error="Capture still running")), 409
+    data, mimetype, filename = capture.export(request.args.get('format'))
+    return send_file(BytesIO(data), mimetype=mimetype, as_attachment=True, download_name=filename)
 
 if __name__ == '__main__':
+    # The debug reloader imports this module twice; only the serving child samples
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        stats_collector.start()
+        vm_manager.start_config_watcher()
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,113 @@
+import json
+import os
+import threading
+from collections import namedtuple
+
+# Seconds between checks of config.json for changes
+CONFIG_RELOAD_INTERVAL = 2.0
+
+# Runtime fields added to entries by the server, not part of the configuration
+RUNTIME_FIELDS = ("status",)
+
+# One loaded config: the server list and its indexes, replaced as a whole
+_Snapshot = namedtuple("_Snapshot", ["servers", "by_id", "by_name", "by_uuid"])
+
+class ServerRegistry:
+    """Servers from config.json indexed by id, name and vbox_uuid.
+
+    reload() re-reads the file only when its mtime or size changed and swaps
+    in the list and its indexes with one assignment of an immutable
+    snapshot; readers take one reference to it, so they never see a
+    half-applied config.
+    Entries whose configuration didn't change are kept as the same objects;
+    the ids that were added, changed or removed are returned so callers can
+    drop connections and caches of exactly those servers.
+    """
+
+    def __init__(self, config_path):
+        self.config_path = config_path
+        self.lock = threading.Lock() # Serializes reloads
+        self.signature = None # (mtime, size) of the loaded file
+        self.snapshot = _Snapshot([], {}, {}, {})
+        self.reload()
+
+    @property
+    def servers(self):
+        return self.snapshot.servers
+
+    def get(self, server_id):
+        return self.snapshot.by_id.get(server_id)
+
+    def find(self, key):
+        """Server by id, VirtualBox name or vbox_uuid."""
+        snapshot = self.snapshot
+        return snapshot.by_id.get(key) or snapshot.by_name.get(key) or snapshot.by_uuid.get(key)
+
+    def _signature(self):
+        try:
+            st = os.stat(self.config_path)
+            return (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
+
+    def _load(self):
+        try:
+            with open(self.config_path, 'r') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"Error loading config: {e}")
+            return None
+
+    @staticmethod
+    def _config_of(server):
+        return {k: v for k, v in server.items() if k not in RUNTIME_FIELDS}
+
+    def reload(self, force=False):
+        """Apply config.json if it changed.
+
+        Returns (added ids, changed ids, removed ids, {id: previous entry})
+        where the last item holds the replaced entries of changed and removed
+        servers (their old name is needed to drop per-VM caches).
+        """
+        with self.lock:
+            signature = self._signature()
+            if not force and signature == self.signature:
+                return [], [], [], {}
+            self.signature = signature
+            loaded = self._load()
+            if loaded is not None and not isinstance(loaded, list):
+                print("Error loading config: expected a list of servers")
+                loaded = None
+            if loaded is None:
+                # Keep serving the last good config until the file is fixed
+                return [], [], [], {}
+
+            previous = self.snapshot.by_id
+            servers, added, changed = [], [], []
+            for entry in loaded:
+                if not isinstance(entry, dict):
+                    print(f"Ignoring config entry that is not an object: {entry!r}")
+                    continue
+                if 'id' not in entry:
+                    print(f"Ignoring config entry without id: {entry.get('name')}")
+                    continue
+                old = previous.get(entry['id'])
+                if old is not None and self._config_of(old) == entry:
+                    servers.append(old)
+                    continue
+                if old is None:
+                    added.append(entry['id'])
+                else:
+                    changed.append(entry['id'])
+                    if 'status' in old:
+                        entry['status'] = old['status']
+                servers.append(entry)
+
+            by_id = {s['id']: s for s in servers}
+            removed = [server_id for server_id in previous if server_id not in by_id]
+            old_entries = {server_id: previous[server_id] for server_id in changed + removed}
+
+            self.snapshot = _Snapshot(servers, by_id,
+                                      {s['name']: s for s in servers if s.get('name')},
+                                      {s['vbox_uuid']: s for s in servers if s.get('vbox_uuid')})
+            return added, changed, removed, old_entries
@@ -1,88 +1,305 @@
-import paramiko
+import codecs
+import re
 import threading
 import time
 import socket
+from console_buffer import ConsoleBuffer
+from terminal import Screen, TERM_COLS, TERM_ROWS
+from metrics import SHELL_SESSIONS_OPENED, SHELL_SESSIONS_CLOSED
+
+# Strip ANSI escape codes (colors, cursor moves, bracketed paste)
+ANSI_ESCAPE = re.compile(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])')
+
+# Session limits: least recently used sessions are closed to make room
+MAX_SESSIONS = 32
+MAX_SESSIONS_PER_SERVER = 4
+# Sessions nobody wrote to or read from for this long are closed by the reaper
+SESSION_IDLE_TIMEOUT = 600
+REAPER_INTERVAL = 30
+
+DEFAULT_SESSION = "default"
 
 class ShellSession:
-    def __init__(self, ip, port, user, password):
-        self.ip = ip
-        self.port = port
-        self.user = user
-        self.password = password
-        self.client = paramiko.SSHClient()
-        self.client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+    def __init__(self, ssh_pool, server_config, on_output=None, on_screen=None):
+        # The shell is a channel on the server's pooled transport (see SSHPool)
+        self.ssh_pool = ssh_pool
+        self.server_config = server_config
+        self.on_output = on_output # Called with each decoded chunk from the reader thread
+        self.on_screen = on_screen # Called with the row diff produced by each chunk
         self.shell = None
-        self.output_buffer = ""
+        self.buffer = ConsoleBuffer()
+        self.screen = Screen(TERM_COLS, TERM_ROWS)
+        self.read_offset = 0 # Cursor of the legacy read_output() caller
         self.lock = threading.Lock()
-        self.last_activity = time.time()
+        self.created = self.last_activity = time.time()
+        self.reader = None
+        self.watchers = set() # Callables run after each chunk and on close (async long-polls)
 
     def connect(self):
         try:
-            self.client.connect(self.ip, port=self.port, username=self.user, password=self.password)
-            self.shell = self.client.invoke_shell()
-            self.shell.setblocking(0)
+            self.shell = self.ssh_pool.invoke_shell(self.server_config, term='xterm',
+                                                    width=TERM_COLS, height=TERM_ROWS)
+            self.shell.settimeout(1.0)
+            self.reader = threading.Thread(target=self._read_loop, daemon=True,
+                                           name=f"shell-{self.server_config['id']}")
+            self.reader.start()
             return True, "Connected"
         except Exception as e:
             return False, str(e)
 
+    def _read_loop(self):
+        # Drain the channel continuously so no output is lost between polls.
+        # The incremental decoder holds back a UTF-8 sequence split across
+        # chunks, so the buffer only ever contains whole characters.
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        while True:
+            try:
+                chunk = self.shell.recv(4096)
+            except socket.timeout:
+                continue
+            except Exception:
+                break
+            if not chunk:
+                break # Channel closed
+            text = decoder.decode(chunk)
+            if text:
+                self.buffer.write(text.encode('utf-8'))
+                version = self.screen.feed(text)
+                if self.on_output:
+                    self.on_output(text)
+                if self.on_screen:
+                    self.on_screen(self.screen.changes(version - 1))
+                self._wake_watchers()
+        self.buffer.close()
+        self._wake_watchers()
+
+    def add_watcher(self, wake):
+        with self.lock:
+            self.watchers.add(wake)
+
+    def remove_watcher(self, wake):
+        with self.lock:
+            self.watchers.discard(wake)
+
+    def _wake_watchers(self):
+        with self.lock:
+            watchers = list(self.watchers)
+        for wake in watchers:
+            try:
+                wake()
+            except Exception:
+                pass # e.g. the waiting event loop is gone
+
     def send_command(self, cmd):
         if not self.shell:
             return False
-        self.shell.send(cmd + "\n")
-        self.last_activity = time.time()
+        self.shell.sendall(cmd + "\n")
+        self.touch()
         return True
 
+    def touch(self):
+        # Written to or viewed: not idle
+        self.last_activity = time.time()
+
+    def is_alive(self):
+        return (self.shell is not None and not self.shell.closed
+                and self.reader is not None and self.reader.is_alive())
+
+    def close(self):
+        # Only the channel: the pooled transport stays up for other users
+        if self.shell is not None:
+            try:
+                self.shell.close()
+            except Exception:
+                pass
+        self.buffer.close()
+
+    def stats(self):
+        now = time.time()
+        return {
+            "alive": self.is_alive(),
+            "age": round(now - self.created, 1),
+            "idle": round(now - self.last_activity, 1),
+            "output_bytes": self.buffer.end,
+            # Fixed ring plus one list slot per screen cell (approximate)
+            "memory_bytes": self.buffer.capacity + self.screen.cols * self.screen.rows * 8,
+        }
+
+    def read(self, since=0, wait=0):
+        """Output after offset `since` (waiting up to `wait` s for some) and the next offset."""
+        self.touch()
+        data, offset = self.buffer.read(since, wait)
+        # The oldest buffered byte may fall inside a character: ignore the fragment
+        return ANSI_ESCAPE.sub('', data.decode('utf-8', errors='ignore')), offset
+
     def read_output(self):
-        if not self.shell:
-            return ""
-        
-        data = ""
-        try:
-            while True:
-                chunk = self.shell.recv(1024).decode('utf-8')
-                if not chunk:
-                    break
-                data += chunk
-        except:
-            pass
-        
-        # Strip ANSI escape codes (colors, cursor moves, bracketed paste)
-        import re
-        ansi_escape = re.compile(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])')
-        clean_data = ansi_escape.sub('', data)
-        return clean_data
+        # Everything since this method was last called (single-cursor legacy API)
+        with self.lock:
+            output, self.read_offset = self.read(self.read_offset)
+        return output
 
 class ShellManager:
-    def __init__(self, vm_manager):
+    def __init__(self, vm_manager, events=None):
         self.vm_manager = vm_manager
-        self.sessions = {} # {server_id: ShellSession}
-
-    def get_session(self, server_id):
-        # Create if not exists (or reconnect)
-        if server_id not in self.sessions:
-            # Get creds from existing vm_manager config
-            server = next((s for s in self.vm_manager.servers if s['id'] == server_id), None)
-            if not server:
-                return None
-            
-            session = ShellSession(server['ip'], server['ssh_port'], server['ssh_user'], server['ssh_password'])
-            success, msg = session.connect()
-            if success:
-                self.sessions[server_id] = session
+        self.events = events # Optional EventHub receiving "console" output deltas
+        self.sessions = {} # {(server_id, session name): ShellSession}
+        self.lock = threading.Lock()
+        self.reaper = None
+        vm_manager.reload_listeners.append(self._on_config_change)
+
+    def get_session(self, server_id, name=DEFAULT_SESSION):
+        # Create if not exists (or reconnect if the channel died)
+        server = self.vm_manager.find_server(server_id)
+        if not server:
+            return None
+        server_id = server['id'] # Sessions are keyed by id even when looked up by name
+        key = (server_id, name)
+        with self.lock:
+            session = self.sessions.get(key)
+            if session is not None and session.is_alive():
+                return session
+            if session is not None:
+                del self.sessions[key]
+        if session is not None:
+            SHELL_SESSIONS_CLOSED.inc(reason="dead")
+            session.close()
+
+        session = ShellSession(self.vm_manager.ssh_pool, server,
+                               on_output=lambda text: self._publish(server_id, name, text),
+                               on_screen=lambda diff: self._publish_screen(server_id, name, diff))
+        success, msg = session.connect()
+        if not success:
+            return None # Or raise error
+        SHELL_SESSIONS_OPENED.inc()
+
+        with self.lock:
+            existing = self.sessions.get(key)
+            if existing is not None and existing.is_alive():
+                # Lost a creation race: keep the other one
+                evicted = [session]
+                session = existing
             else:
-                return None # Or raise error
-        
-        return self.sessions[server_id]
+                evicted = self._make_room(server_id)
+                self.sessions[key] = session
+            self._start_reaper()
+        for old in evicted:
+            SHELL_SESSIONS_CLOSED.inc(reason="evicted")
+            old.close()
+        return session
+
+    def _make_room(self, server_id):
+        # Called with self.lock held: pick LRU sessions to close so one more fits
+        evicted = []
+        def evict_lru(keys):
+            key = min(keys, key=lambda k: self.sessions[k].last_activity)
+            evicted.append(self.sessions.pop(key))
+
+        server_keys = [k for k in self.sessions if k[0] == server_id]
+        while len(server_keys) >= MAX_SESSIONS_PER_SERVER:
+            evict_lru(server_keys)
+            server_keys = [k for k in self.sessions if k[0] == server_id]
+        while len(self.sessions) >= MAX_SESSIONS:
+            evict_lru(list(self.sessions))
+        return evicted
+
+    def _start_reaper(self):
+        if self.reaper is None or not self.reaper.is_alive():
+            self.reaper = threading.Thread(target=self._reap_loop, name="shell-reaper", daemon=True)
+            self.reaper.start()
+
+    def _reap_loop(self):
+        while True:
+            time.sleep(REAPER_INTERVAL)
+            self.reap()
+
+    def reap(self):
+        """Close sessions that are dead or idle for longer than SESSION_IDLE_TIMEOUT.
+
+        While an SSE subscriber is attached the dashboard is showing the
+        sessions' output, so they count as in use.
+        """
+        if self.events is not None and self.events.subscribers:
+            self.touch_all()
+        now = time.time()
+        with self.lock:
+            stale = [k for k, s in self.sessions.items()
+                     if not s.is_alive() or now - s.last_activity > SESSION_IDLE_TIMEOUT]
+            closed = [self.sessions.pop(k) for k in stale]
+        for session in closed:
+            SHELL_SESSIONS_CLOSED.inc(reason="idle" if session.is_alive() else "dead")
+            session.close()
+        return len(closed)
 
-    def send_input(self, server_id, text):
-        session = self.get_session(server_id)
+    def touch_all(self):
+        """Mark every session as in use (e.g. an SSE client just subscribed)."""
+        with self.lock:
+            sessions = list(self.sessions.values())
+        for session in sessions:
+            session.touch()
+
+    def close_server(self, server_id):
+        """Close every session of a server (e.g. its config changed)."""
+        with self.lock:
+            keys = [k for k in self.sessions if k[0] == server_id]
+            closed = [self.sessions.pop(k) for k in keys]
+        for session in closed:
+            SHELL_SESSIONS_CLOSED.inc(reason="server")
+            session.close()
+
+    def _on_config_change(self, server_ids, old_entries):
+        # Sessions hold the old credentials/address: reopen on next use
+        for server_id in server_ids:
+            self.close_server(server_id)
+
+    def stats(self):
+        with self.lock:
+            items = list(self.sessions.items())
+        sessions = [dict(session.stats(), server_id=server_id, session=name)
+                    for (server_id, name), session in items]
+        return {
+            "count": len(sessions),
+            "max_sessions": MAX_SESSIONS,
+            "max_sessions_per_server": MAX_SESSIONS_PER_SERVER,
+            "idle_timeout": SESSION_IDLE_TIMEOUT,
+            "memory_bytes": sum(s["memory_bytes"] for s in sessions),
+            "sessions": sessions,
+        }
+
+    def _publish(self, server_id, name, text):
+        if self.events is not None:
+            output = ANSI_ESCAPE.sub('', text)
+            if output:
+                self.events.publish("console", {"id": server_id, "session": name, "output": output})
+
+    def _publish_screen(self, server_id, name, diff):
+        if self.events is not None and diff["lines"]:
+            self.events.publish("screen", dict(diff, id=server_id, session=name))
+
+    def send_input(self, server_id, text, name=DEFAULT_SESSION):
+        session = self.get_session(server_id, name)
         if session:
             session.send_command(text)
             return True
         return False
 
-    def get_output(self, server_id):
-        session = self.get_session(server_id)
-        if session:
-            return session.read_output()
-        return ""
+    def get_output(self, server_id, since=None, wait=0, name=DEFAULT_SESSION):
+        """New console output for a client.
+
+        With `since` (a byte offset from a previous reply) returns
+        (output, next_offset), blocking up to `wait` seconds until output
+        arrives; without it, returns what arrived since the last such call.
+        """
+        session = self.get_session(server_id, name)
+        if since is None:
+            return session.read_output() if session else ""
+        if not session:
+            return "", 0
+        return session.read(since, wait)
+
+    def get_screen(self, server_id, since=0, wait=0, name=DEFAULT_SESSION):
+        """Terminal screen rows changed after version `since` (see terminal.Screen)."""
+        session = self.get_session(server_id, name)
+        if not session:
+            return None
+        session.touch()
+        return session.screen.changes(since, wait)
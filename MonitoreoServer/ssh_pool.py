@@ -0,0 +1,142 @@
+import paramiko
+import socket
+import threading
+import time
+import profiler
+from metrics import SSH_SECONDS, SSH_ERRORS
+
+# Seconds between SSH keepalive packets on pooled transports
+KEEPALIVE_INTERVAL = 15
+# A transport idle for longer than this is probed before being handed out again
+HEALTH_CHECK_INTERVAL = 30
+
+class SSHPool:
+    """One authenticated SSH transport per server, shared by every caller.
+
+    Callers only open new channels (exec/shell) on the pooled transport, so the
+    TCP handshake, key exchange and authentication happen once per server
+    instead of once per request. Dead transports are dropped and reconnected
+    transparently on the next call.
+    """
+
+    def __init__(self, connect_timeout=3, keepalive=KEEPALIVE_INTERVAL):
+        self.connect_timeout = connect_timeout
+        self.keepalive = keepalive
+        self.clients = {}    # {server_id: paramiko.SSHClient}
+        self.last_used = {}  # {server_id: timestamp}
+        self.locks = {}      # {server_id: Lock} serializes (re)connects per server
+        self.lock = threading.Lock()
+
+    def _server_lock(self, server_id):
+        with self.lock:
+            if server_id not in self.locks:
+                self.locks[server_id] = threading.Lock()
+            return self.locks[server_id]
+
+    def _connect(self, server_config):
+        server_id = server_config['id']
+        address = (server_config['ip'], server_config.get('ssh_port', 22))
+        # TCP connect first, on its own, so its time is measured apart from the SSH handshake
+        started = time.perf_counter()
+        try:
+            sock = socket.create_connection(address, timeout=self.connect_timeout)
+        except OSError:
+            SSH_ERRORS.inc(server=server_id, phase="connect")
+            raise
+        connected = time.perf_counter()
+        SSH_SECONDS.observe(connected - started, server=server_id, phase="connect")
+
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        try:
+            # Prioritize key auth if path provided
+            if server_config.get('ssh_key_path'):
+                client.connect(address[0], port=address[1], sock=sock,
+                               username=server_config['ssh_user'],
+                               key_filename=server_config['ssh_key_path'],
+                               timeout=self.connect_timeout)
+            else:
+                client.connect(address[0], port=address[1], sock=sock,
+                               username=server_config['ssh_user'],
+                               password=server_config['ssh_password'],
+                               timeout=self.connect_timeout)
+        except Exception:
+            SSH_ERRORS.inc(server=server_id, phase="auth")
+            client.close()
+            sock.close()
+            raise
+        SSH_SECONDS.observe(time.perf_counter() - connected, server=server_id, phase="auth")
+        client.get_transport().set_keepalive(self.keepalive)
+        return client
+
+    def _is_healthy(self, server_id, client):
+        transport = client.get_transport()
+        if transport is None or not transport.is_active() or not transport.is_authenticated():
+            return False
+        # Idle transports may have been dropped by NAT / the guest without us noticing
+        if time.time() - self.last_used.get(server_id, 0) > HEALTH_CHECK_INTERVAL:
+            try:
+                transport.send_ignore()
+            except Exception:
+                return False
+        return True
+
+    def get_client(self, server_config):
+        """Return a connected SSHClient for the server, reconnecting if needed.
+
+        Raises the underlying paramiko/socket error if the server is unreachable.
+        """
+        server_id = server_config['id']
+        lock = self._server_lock(server_id)
+        with profiler.span("lock_wait"):
+            lock.acquire()
+        try:
+            client = self.clients.get(server_id)
+            if client is not None and not self._is_healthy(server_id, client):
+                client.close()
+                client = None
+            if client is None:
+                with profiler.span("ssh_connect"):
+                    client = self._connect(server_config)
+                self.clients[server_id] = client
+            self.last_used[server_id] = time.time()
+            return client
+        finally:
+            lock.release()
+
+    def _with_retry(self, server_config, action):
+        # A pooled transport can die between the health check and the channel
+        # open; in that case reconnect once and try again.
+        client = self.get_client(server_config)
+        try:
+            return action(client)
+        except (paramiko.SSHException, EOFError, OSError):
+            self.invalidate(server_config['id'])
+            return action(self.get_client(server_config))
+
+    def exec_command(self, server_config, command, timeout=None):
+        """Run a command on a new channel; returns (stdin, stdout, stderr)."""
+        return self._with_retry(server_config,
+                                lambda client: client.exec_command(command, timeout=timeout))
+
+    def invoke_shell(self, server_config, term='vt100', width=80, height=24):
+        """Open an interactive shell channel on the pooled transport."""
+        return self._with_retry(server_config,
+                                lambda client: client.invoke_shell(term=term, width=width, height=height))
+
+    def open_session(self, server_config):
+        """Open a raw session channel (caller runs exec_command on it)."""
+        return self._with_retry(server_config,
+                                lambda client: client.get_transport().open_session())
+
+    def invalidate(self, server_id):
+        """Drop the pooled transport for a server; the next call reconnects."""
+        with self._server_lock(server_id):
+            client = self.clients.pop(server_id, None)
+            self.last_used.pop(server_id, None)
+        if client is not None:
+            client.close()
+
+    def close_all(self):
+        for server_id in list(self.clients):
+            self.invalidate(server_id)
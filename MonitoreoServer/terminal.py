@@ -0,0 +1,319 @@
+import threading
+
+# Size of the pty requested for shell sessions
+TERM_COLS = 80
+TERM_ROWS = 24
+
+NORMAL, ESCAPE, CSI, OSC, OSC_ESCAPE, CHARSET = range(6)
+
+class Screen:
+    """Minimal VT100/xterm screen model fed with shell output.
+
+    Keeps a cols x rows character grid (text only, attributes are dropped),
+    the cursor, scroll region and alternate screen, which is enough for
+    prompts, `top`, `htop` and editors to render correctly. Every row carries
+    the version of the last feed that changed it, so clients can fetch only
+    the rows that changed since the version they already have.
+    """
+
+    def __init__(self, cols=TERM_COLS, rows=TERM_ROWS):
+        self.cols = cols
+        self.rows = rows
+        self.version = 0
+        self.versions = [0] * rows
+        self.cond = threading.Condition()
+        self._reset()
+
+    def _reset(self):
+        self.lines = [[' '] * self.cols for _ in range(self.rows)]
+        self.x = self.y = 0
+        self.saved = (0, 0)
+        self.top, self.bottom = 0, self.rows - 1
+        self.wrap_pending = False
+        self.autowrap = True
+        self.cursor_visible = True
+        self.alt_saved = None # Main screen (lines, cursor) while the alternate one is shown
+        self.state = NORMAL
+        self.params = ""
+        self._touch(0, self.rows)
+
+    # -- Public API ---------------------------------------------------------
+
+    def feed(self, text):
+        with self.cond:
+            self.version += 1
+            for ch in text:
+                self._consume(ch)
+            self.cond.notify_all()
+            return self.version
+
+    def changes(self, since=0, wait=0):
+        """Rows changed after version `since` (all rows for since=0).
+
+        Blocks up to `wait` seconds when nothing changed yet.
+        """
+        with self.cond:
+            if since > self.version:
+                since = 0 # Version from an older session: full redraw, no need to wait
+            elif wait and self.version <= since:
+                self.cond.wait_for(lambda: self.version > since, timeout=wait)
+            full = since == 0
+            rows = {i: ''.join(self.lines[i]).rstrip()
+                    for i in range(self.rows) if full or self.versions[i] > since}
+            return {
+                "version": self.version,
+                "full": full,
+                "cols": self.cols,
+                "rows": self.rows,
+                "cursor": [self.y, self.x],
+                "cursor_visible": self.cursor_visible,
+                "lines": rows,
+            }
+
+    def text(self):
+        with self.cond:
+            return '\n'.join(''.join(line).rstrip() for line in self.lines)
+
+    # -- Parser -------------------------------------------------------------
+
+    def _consume(self, ch):
+        state = self.state
+        if state == NORMAL:
+            if ch == '\x1b':
+                self.state = ESCAPE
+            elif ch >= ' ' and ch != '\x7f':
+                self._put(ch)
+            else:
+                self._control(ch)
+        elif state == ESCAPE:
+            self._escape(ch)
+        elif state == CSI:
+            if '\x30' <= ch <= '\x3f' or '\x20' <= ch <= '\x2f':
+                self.params += ch
+            elif '\x40' <= ch <= '\x7e':
+                self.state = NORMAL
+                self._csi(self.params, ch)
+            elif ch == '\x1b':
+                self.state = ESCAPE # Aborted sequence
+            else:
+                self._control(ch)
+        elif state == OSC:
+            # Window titles etc.: ignored up to BEL or ST
+            if ch == '\x07':
+                self.state = NORMAL
+            elif ch == '\x1b':
+                self.state = OSC_ESCAPE
+        elif state == OSC_ESCAPE:
+            self.state = NORMAL
+        elif state == CHARSET:
+            self.state = NORMAL
+
+    def _control(self, ch):
+        if ch == '\r':
+            self.x = 0
+            self.wrap_pending = False
+        elif ch in '\n\x0b\x0c':
+            self._linefeed()
+        elif ch == '\b':
+            self.x = max(0, self.x - 1)
+            self.wrap_pending = False
+        elif ch == '\t':
+            self.x = min(self.cols - 1, (self.x // 8 + 1) * 8)
+        # BEL, SO/SI and other controls have no effect on the text
+
+    def _escape(self, ch):
+        self.state = NORMAL
+        if ch == '[':
+            self.state, self.params = CSI, ""
+        elif ch == ']':
+            self.state = OSC
+        elif ch in '()*+':
+            self.state = CHARSET
+        elif ch == '7':
+            self.saved = (self.x, self.y)
+        elif ch == '8':
+            self.x, self.y = self.saved
+            self.wrap_pending = False
+        elif ch == 'D':
+            self._linefeed()
+        elif ch == 'E':
+            self.x = 0
+            self._linefeed()
+        elif ch == 'M':
+            self._reverse_index()
+        elif ch == 'c':
+            self._reset()
+
+    def _csi(self, params, final):
+        private = params[:1] in ('?', '>', '=')
+        if private:
+            params = params[1:]
+        args = [int(p) if p.isdigit() else 0 for p in params.rstrip(' !"$\'').split(';')] if params else []
+
+        def arg(i, default=1):
+            return args[i] if len(args) > i and args[i] else default
+
+        if private:
+            if final in 'hl':
+                for mode in args:
+                    self._set_private_mode(mode, final == 'h')
+            return
+
+        self.wrap_pending = False
+        if final == 'A':
+            self.y = max(self.top if self.y >= self.top else 0, self.y - arg(0))
+        elif final == 'B':
+            self.y = min(self.bottom if self.y <= self.bottom else self.rows - 1, self.y + arg(0))
+        elif final == 'C':
+            self.x = min(self.cols - 1, self.x + arg(0))
+        elif final == 'D':
+            self.x = max(0, self.x - arg(0))
+        elif final == 'E':
+            self.x, self.y = 0, min(self.rows - 1, self.y + arg(0))
+        elif final == 'F':
+            self.x, self.y = 0, max(0, self.y - arg(0))
+        elif final == 'G' or final == '`':
+            self.x = min(self.cols - 1, arg(0) - 1)
+        elif final == 'd':
+            self.y = min(self.rows - 1, arg(0) - 1)
+        elif final in 'Hf':
+            self.y = min(self.rows - 1, arg(0) - 1)
+            self.x = min(self.cols - 1, arg(1) - 1)
+        elif final == 'J':
+            self._erase_display(arg(0, 0))
+        elif final == 'K':
+            self._erase_line(arg(0, 0))
+        elif final == 'L':
+            self._insert_lines(arg(0))
+        elif final == 'M':
+            self._delete_lines(arg(0))
+        elif final == '@':
+            line = self.lines[self.y]
+            n = min(arg(0), self.cols - self.x)
+            line[self.x:] = [' '] * n + line[self.x:self.cols - n]
+            self._touch(self.y)
+        elif final == 'P':
+            line = self.lines[self.y]
+            n = min(arg(0), self.cols - self.x)
+            line[self.x:] = line[self.x + n:] + [' '] * n
+            self._touch(self.y)
+        elif final == 'X':
+            line = self.lines[self.y]
+            end = min(self.cols, self.x + arg(0))
+            line[self.x:end] = [' '] * (end - self.x)
+            self._touch(self.y)
+        elif final == 'S':
+            self._scroll_up(arg(0))
+        elif final == 'T':
+            self._scroll_down(arg(0))
+        elif final == 'r':
+            top, bottom = arg(0) - 1, arg(1, self.rows) - 1
+            if 0 <= top < bottom < self.rows:
+                self.top, self.bottom = top, bottom
+                self.x = self.y = 0
+        elif final == 's':
+            self.saved = (self.x, self.y)
+        elif final == 'u':
+            self.x, self.y = self.saved
+        # SGR (m), device queries and the rest don't change the text
+
+    def _set_private_mode(self, mode, enable):
+        if mode == 25:
+            self.cursor_visible = enable
+        elif mode == 7:
+            self.autowrap = enable
+        elif mode in (47, 1047, 1049):
+            # Alternate screen (full-screen programs); 1049 also saves the cursor
+            if enable and self.alt_saved is None:
+                self.alt_saved = ([line[:] for line in self.lines], (self.x, self.y))
+                self.lines = [[' '] * self.cols for _ in range(self.rows)]
+                self._touch(0, self.rows)
+            elif not enable and self.alt_saved is not None:
+                self.lines, cursor = self.alt_saved
+                self.alt_saved = None
+                if mode == 1049:
+                    self.x, self.y = cursor
+                self._touch(0, self.rows)
+
+    # -- Screen operations --------------------------------------------------
+
+    def _touch(self, start, end=None):
+        for i in range(start, (start + 1) if end is None else end):
+            self.versions[i] = self.version
+
+    def _put(self, ch):
+        if self.wrap_pending:
+            self.x = 0
+            self._linefeed()
+        self.lines[self.y][self.x] = ch
+        self._touch(self.y)
+        if self.x == self.cols - 1:
+            self.wrap_pending = self.autowrap
+        else:
+            self.x += 1
+
+    def _linefeed(self):
+        self.wrap_pending = False
+        if self.y == self.bottom:
+            self._scroll_up(1)
+        elif self.y < self.rows - 1:
+            self.y += 1
+
+    def _reverse_index(self):
+        self.wrap_pending = False
+        if self.y == self.top:
+            self._scroll_down(1)
+        elif self.y > 0:
+            self.y -= 1
+
+    def _blank(self):
+        return [' '] * self.cols
+
+    def _scroll_up(self, n, top=None):
+        top = self.top if top is None else top
+        n = min(n, self.bottom - top + 1)
+        region = self.lines[top:self.bottom + 1]
+        self.lines[top:self.bottom + 1] = region[n:] + [self._blank() for _ in range(n)]
+        self._touch(top, self.bottom + 1)
+
+    def _scroll_down(self, n, top=None):
+        top = self.top if top is None else top
+        n = min(n, self.bottom - top + 1)
+        region = self.lines[top:self.bottom + 1]
+        self.lines[top:self.bottom + 1] = [self._blank() for _ in range(n)] + region[:len(region) - n]
+        self._touch(top, self.bottom + 1)
+
+    def _insert_lines(self, n):
+        if self.top <= self.y <= self.bottom:
+            self._scroll_down(n, top=self.y)
+            self.x = 0
+
+    def _delete_lines(self, n):
+        if self.top <= self.y <= self.bottom:
+            self._scroll_up(n, top=self.y)
+            self.x = 0
+
+    def _erase_line(self, mode):
+        line = self.lines[self.y]
+        if mode == 0:
+            line[self.x:] = [' '] * (self.cols - self.x)
+        elif mode == 1:
+            line[:self.x + 1] = [' '] * (self.x + 1)
+        else:
+            line[:] = self._blank()
+        self._touch(self.y)
+
+    def _erase_display(self, mode):
+        if mode == 0:
+            self._erase_line(0)
+            for i in range(self.y + 1, self.rows):
+                self.lines[i] = self._blank()
+            self._touch(self.y, self.rows)
+        elif mode == 1:
+            self._erase_line(1)
+            for i in range(0, self.y):
+                self.lines[i] = self._blank()
+            self._touch(0, self.y + 1)
+        else:
+            self.lines = [self._blank() for _ in range(self.rows)]
+            self._touch(0, self.rows)
@@ -0,0 +1,80 @@
+import asyncio
+import socket
+import sys
+
+import pytest
+
+asyncssh = pytest.importorskip("asyncssh")
+pytest.importorskip("aiohttp")
+
+import async_server
+import vm_manager as vm_module
+from metrics import VBOX_COMMAND_SECONDS, VBOX_COMMAND_ERRORS, SSH_SECONDS, SSH_ERRORS
+
+
+def observed(histogram, *key):
+    data = histogram.values.get(tuple(key))
+    return data[1] if data else 0
+
+def errors(counter, *key):
+    return counter.values.get(tuple(key), 0)
+
+class AcceptAll(asyncssh.SSHServer):
+    def begin_auth(self, username):
+        return True
+
+    def password_auth_supported(self):
+        return True
+
+    def validate_password(self, username, password):
+        return True
+
+def echo(process):
+    process.stdout.write("hello\n")
+    process.exit(0)
+
+def test_async_vbox_records_command_metrics(monkeypatch):
+    # A stand-in VBoxManage: exits with the status given as its last argument
+    script = "import sys; sys.exit(int(sys.argv[-1]))"
+    monkeypatch.setattr(vm_module, "VBOX_MANAGE_CMD", sys.executable)
+    vbox = async_server.AsyncVBox()
+    before = observed(VBOX_COMMAND_SECONDS, "-c"), errors(VBOX_COMMAND_ERRORS, "-c")
+    assert asyncio.run(vbox.run(["-c", script, "0"]))[0] == 0
+    assert asyncio.run(vbox.run(["-c", script, "3"]))[0] == 3
+    assert observed(VBOX_COMMAND_SECONDS, "-c") == before[0] + 2
+    assert errors(VBOX_COMMAND_ERRORS, "-c") == before[1] + 1
+
+def test_async_ssh_records_connect_auth_and_exec_metrics():
+    async def scenario():
+        key = asyncssh.generate_private_key("ssh-ed25519")
+        acceptor = await asyncssh.create_server(AcceptAll, "127.0.0.1", 0, server_host_keys=[key],
+                                                process_factory=echo)
+        port = acceptor.sockets[0].getsockname()[1]
+        server = {"id": "metrics_test", "ip": "127.0.0.1", "ssh_port": port,
+                  "ssh_user": "user", "ssh_password": "secret"}
+        pool = async_server.AsyncSSHPool()
+        try:
+            return await pool.run(server, "echo hello", timeout=10)
+        finally:
+            pool.close_all()
+            acceptor.close()
+
+    before = [observed(SSH_SECONDS, "metrics_test", phase) for phase in ("connect", "auth", "exec")]
+    result = asyncio.run(scenario())
+    assert result["error"] is None and result["stdout"] == "hello\n"
+    after = [observed(SSH_SECONDS, "metrics_test", phase) for phase in ("connect", "auth", "exec")]
+    assert after == [n + 1 for n in before]
+
+@pytest.fixture
+def unused_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def test_async_ssh_counts_connect_errors(unused_port):
+    server = {"id": "metrics_down", "ip": "127.0.0.1", "ssh_port": unused_port,
+              "ssh_user": "user", "ssh_password": "secret"}
+    before = errors(SSH_ERRORS, "metrics_down", "connect")
+    result = asyncio.run(async_server.AsyncSSHPool().run(server, "true", timeout=5))
+    assert result["error"].startswith("Could not connect")
+    assert errors(SSH_ERRORS, "metrics_down", "connect") == before + 1
@@ -0,0 +1,41 @@
+import threading
+
+from collector import StatsCollector
+
+
+class FakeVMManager:
+    def __init__(self, hung):
+        self.hung = hung # Server ids whose get_stats blocks until released
+        self.release = threading.Event()
+        self.calls = []
+        self.reload_listeners = []
+
+    def get_servers(self):
+        return [{"id": "fast", "status": "running"}, {"id": "hung", "status": "running"}]
+
+    def get_stats(self, server_id):
+        self.calls.append(server_id)
+        if server_id in self.hung:
+            self.release.wait(5)
+        return {"cpu": 1, "ram": 2, "disk": 3}
+
+def test_hung_server_gets_an_error_sample_and_is_not_resubmitted():
+    manager = FakeVMManager(hung={"hung"})
+    collector = StatsCollector(manager, interval=0.2)
+    try:
+        collector.collect_once()
+        assert collector.get_latest("fast")["cpu"] == 1
+        assert "error" in collector.get_latest("hung")
+
+        collector.collect_once() # Still hung: no second call piling up behind the first
+        assert manager.calls.count("hung") == 1
+        assert manager.calls.count("fast") == 2
+
+        manager.release.set()
+        collector.pending["hung"].result(timeout=5)
+        collector.collect_once()
+        assert manager.calls.count("hung") == 2
+        assert collector.get_latest("hung")["cpu"] == 1
+    finally:
+        manager.release.set()
+        collector.executor.shutdown()
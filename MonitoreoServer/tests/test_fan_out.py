@@ -0,0 +1,31 @@
+import threading
+import time
+
+from jobs import fan_out
+
+
+class SlowVMManager:
+    """run_command that blocks until cancelled (or 5 s), recording every start."""
+
+    def __init__(self):
+        self.started = []
+        self.lock = threading.Lock()
+
+    def run_command(self, server_id, command, timeout=None, cancel_event=None, max_output=None):
+        with self.lock:
+            self.started.append(server_id)
+        if server_id == "fast":
+            return {"exit_code": 0, "error": None}
+        cancelled = cancel_event.wait(5)
+        return {"exit_code": None, "error": "cancelled" if cancelled else None}
+
+def test_closing_the_generator_cancels_queued_and_running_commands():
+    manager = SlowVMManager()
+    servers = ["fast"] + [f"slow{n}" for n in range(10)]
+    results = fan_out(manager, servers, "sleep 100", parallelism=2)
+    assert next(results)["server_id"] == "fast"
+    started = time.time()
+    results.close()
+    assert time.time() - started < 1 # Didn't wait for the queued commands
+    time.sleep(0.2)
+    assert len(manager.started) <= 3 # fast + the two slots running when closed
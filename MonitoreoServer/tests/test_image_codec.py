@@ -0,0 +1,38 @@
+from io import BytesIO
+
+import pytest
+
+from frame_store import Frame
+from image_codec import DEFAULT_QUALITY, image_params
+
+Image = pytest.importorskip("PIL.Image")
+
+
+def png(width, height):
+    out = BytesIO()
+    Image.new("RGB", (width, height), "navy").save(out, "PNG")
+    return out.getvalue()
+
+def test_image_params_defaults_and_clamps():
+    assert image_params({}, "jpeg") == ("jpeg", None, DEFAULT_QUALITY)
+    assert image_params({"format": "webp", "width": "320", "quality": "500"}) == ("webp", 320, 95)
+
+@pytest.mark.parametrize("args", [
+    {"format": "gif"},
+    {"width": "wide"},
+    {"quality": "high"},
+    {"width": "0"},
+    {"width": "-5"},
+])
+def test_image_params_rejects_bad_values(args):
+    with pytest.raises(ValueError):
+        image_params(args)
+
+def test_variant_scales_down_but_never_to_nothing_or_up():
+    frame = Frame(png(64, 32), 0)
+    data, mimetype, _ = frame.variant("webp", 16)
+    assert mimetype == "image/webp"
+    assert Image.open(BytesIO(data)).size == (16, 8)
+    for width in (-5, 0, 64, 100):
+        data, _, _ = frame.variant("png", width)
+        assert data == frame.data
@@ -0,0 +1,39 @@
+from metric_history import RingBuffer, lttb
+
+
+def series(n):
+    times = [float(i) for i in range(n)]
+    values = [float((i * 7) % 13) for i in range(n)]
+    return times, values
+
+def test_lttb_keeps_short_series():
+    times, values = series(10)
+    assert lttb(times, values, 50) == [[t, v] for t, v in zip(times, values)]
+
+def test_lttb_downsamples_to_threshold_keeping_ends():
+    times, values = series(1000)
+    sampled = lttb(times, values, 100)
+    assert len(sampled) == 100
+    assert sampled[0] == [0.0, values[0]]
+    assert sampled[-1] == [999.0, values[-1]]
+    assert [p[0] for p in sampled] == sorted(p[0] for p in sampled)
+
+def test_lttb_tiny_thresholds_return_the_smallest_series():
+    times, values = series(1000)
+    for threshold in (0, 1, 2, 3):
+        assert len(lttb(times, values, threshold)) == 3
+
+def test_lttb_picks_the_spike():
+    times = [float(i) for i in range(101)]
+    values = [0.0] * 101
+    values[50] = 100.0
+    assert [50.0, 100.0] in lttb(times, values, 10)
+
+def test_ring_buffer_overwrites_oldest():
+    ring = RingBuffer(3)
+    for t in range(5):
+        ring.append(float(t), {"cpu": t * 10})
+    times, values = ring.range(0, 10)
+    assert list(times) == [2.0, 3.0, 4.0]
+    assert list(values["cpu"]) == [20.0, 30.0, 40.0]
+    assert list(ring.range(3, 3)[0]) == [3.0]
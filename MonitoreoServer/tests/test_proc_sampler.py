@@ -0,0 +1,39 @@
+from proc_sampler import ProcSampler
+
+
+def output(user, idle, mem_total=1000, mem_available=250, disk=(4096, 1000, 400, 300)):
+    return (f"cpu  {user} 0 0 {idle} 0 0 0 0 0 0\n"
+            f"MemTotal: {mem_total}\n"
+            f"MemAvailable: {mem_available}\n"
+            f"{' '.join(str(d) for d in disk)}\n")
+
+def test_first_sample_uses_since_boot_average():
+    stats = ProcSampler().parse("s1", output(user=300, idle=700))
+    assert stats == {"cpu": 30.0, "ram": 75.0, "disk": 66.67}
+
+def test_cpu_from_counter_deltas():
+    sampler = ProcSampler()
+    sampler.parse("s1", output(user=300, idle=700))
+    # 100 busy of 200 jiffies since the previous sample
+    assert sampler.parse("s1", output(user=400, idle=800))["cpu"] == 50.0
+
+def test_servers_are_tracked_separately():
+    sampler = ProcSampler()
+    sampler.parse("s1", output(user=300, idle=700))
+    assert sampler.parse("s2", output(user=900, idle=100))["cpu"] == 90.0
+    assert sampler.parse("s1", output(user=310, idle=790))["cpu"] == 10.0
+
+def test_counter_reset_falls_back_to_since_boot():
+    sampler = ProcSampler()
+    sampler.parse("s1", output(user=3000, idle=7000))
+    # Rebooted: counters went down
+    assert sampler.parse("s1", output(user=20, idle=80))["cpu"] == 20.0
+
+def test_forget_drops_previous_counters():
+    sampler = ProcSampler()
+    sampler.parse("s1", output(user=300, idle=700))
+    sampler.forget("s1")
+    assert sampler.parse("s1", output(user=400, idle=800))["cpu"] == round(400 * 100 / 1200, 2)
+
+def test_empty_output():
+    assert ProcSampler().parse("s1", "") == {"cpu": 0.0, "ram": 0.0, "disk": 0.0}
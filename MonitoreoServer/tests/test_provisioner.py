@@ -0,0 +1,100 @@
+import subprocess
+
+import pytest
+
+from provisioner import (PROVISION_WORKERS, ProvisionState, Provisioner, Step, VMProvision,
+                         assign_ports, expand_spec, ordered)
+
+
+def spec(*groups, **extra):
+    return dict({"defaults": {"iso": "/isos/ubuntu.iso"}, "vms": list(groups)}, **extra)
+
+class FakeManager:
+    """Just enough of VMManager: config.json servers and a scripted showvminfo."""
+
+    def __init__(self, servers=(), info=None):
+        self.servers = list(servers)
+        self.info = info # showvminfo output, or None for an unregistered VM
+        self.calls = []
+
+    def _run_vbox(self, args):
+        self.calls.append(args)
+        if args[0] == "showvminfo":
+            if self.info is None:
+                return subprocess.CompletedProcess(args, 1, "", "not found")
+            return subprocess.CompletedProcess(args, 0, self.info, "")
+        return subprocess.CompletedProcess(args, 0, "", "")
+
+def test_expand_spec_names_ports_and_defaults():
+    vms = expand_spec(spec({"name": "Web{n}", "count": 2, "ssh_port": "2230-2239", "cpus": 4},
+                           {"name": "Worker{n:02d}", "first": 9, "count": 2, "ssh_port": 2250,
+                            "iso": None, "template": "Base", "display_name": "Worker #{n}"}))
+    assert [vm["name"] for vm in vms] == ["Web1", "Web2", "Worker09", "Worker10"]
+    assert vms[0]["ports"] == list(range(2230, 2240))
+    assert vms[0]["cpus"] == 4 and vms[2]["cpus"] == 2 # Group settings over DEFAULTS
+    assert vms[2]["ports"] == [2250, 2251] # A single port means `count` ports from there
+    assert vms[3]["display_name"] == "Worker #10"
+    assert "count" not in vms[0] and "ssh_port" not in vms[0]
+
+@pytest.mark.parametrize("group", [
+    {"ssh_port": 2230}, # No name
+    {"name": "Web"}, # No ssh_port
+    {"name": "Web", "ssh_port": 2230, "template": "Base"}, # Both iso and template
+])
+def test_expand_spec_rejects_bad_groups(group):
+    with pytest.raises(ValueError):
+        expand_spec(spec(group))
+
+def test_expand_spec_rejects_duplicate_names():
+    with pytest.raises(ValueError):
+        expand_spec(spec({"name": "Web", "ssh_port": 2230}, {"name": "Web", "ssh_port": 2231}))
+
+def test_assign_ports_is_stable_and_skips_used_ports(tmp_path):
+    state = ProvisionState(str(tmp_path / "state.json"))
+    state.vm("Web2")["ssh_port"] = 2233
+    vms = expand_spec(spec({"name": "Web{n}", "count": 3, "ssh_port": "2230-2235"}))
+    servers = [{"name": "Web3", "ssh_port": 2231}, # Existing entry of a spec VM: kept
+               {"name": "Other", "ssh_port": 2230}] # Not in the spec: never reused
+    assign_ports(vms, servers, state)
+    assert [vm["ssh_port"] for vm in vms] == [2232, 2233, 2231]
+
+def test_assign_ports_fails_when_the_range_is_full(tmp_path):
+    state = ProvisionState(str(tmp_path / "state.json"))
+    vms = expand_spec(spec({"name": "Web{n}", "count": 3, "ssh_port": "2230-2231"}))
+    with pytest.raises(ValueError):
+        assign_ports(vms, [], state)
+
+def test_ordered_follows_requirements_and_keeps_spec_order():
+    noop = lambda: None
+    steps = [Step("start", ("unattended", "network"), noop, []),
+             Step("network", ("create",), noop, []),
+             Step("unattended", ("storage",), noop, []),
+             Step("create", (), noop, []),
+             Step("storage", ("create",), noop, [])]
+    assert [s.name for s in ordered(steps)] == ["create", "network", "storage", "unattended", "start"]
+    with pytest.raises(ValueError):
+        ordered([Step("a", ("b",), noop, []), Step("b", ("a",), noop, [])])
+
+def test_workers_prefer_command_line_then_spec(tmp_path):
+    group = {"name": "Web", "ssh_port": 2230}
+    state = str(tmp_path / "state.json")
+    assert Provisioner(spec(group), state_path=state, manager=FakeManager()).workers == PROVISION_WORKERS
+    with_budget = spec(group, budget={"workers": 2})
+    assert Provisioner(with_budget, state_path=state, manager=FakeManager()).workers == 2
+    assert Provisioner(with_budget, state_path=state, workers=6, manager=FakeManager()).workers == 6
+
+def test_unattended_skips_installed_vms(tmp_path):
+    vm = expand_spec(spec({"name": "Web", "ssh_port": 2230}))[0]
+    cfg = tmp_path / "Web" / "Web.vbox"
+    (tmp_path / "Web" / "Logs").mkdir(parents=True)
+    attached = f'CfgFile="{cfg}"\nVMState="poweroff"\n"SATA-0-0"="{tmp_path}/Web/Web.vdi"\n'
+
+    manager = FakeManager(info=attached)
+    VMProvision(manager, vm).unattended()
+    assert manager.calls[-1][:2] == ["unattended", "install"] # Never booted yet
+
+    (tmp_path / "Web" / "Logs" / "VBox.log").write_text("")
+    for info in (attached, f'CfgFile="{cfg}"\nVMState="running"\n'):
+        manager = FakeManager(info=info)
+        VMProvision(manager, vm).unattended()
+        assert all(call[0] != "unattended" for call in manager.calls)
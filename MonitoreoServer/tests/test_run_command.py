@@ -0,0 +1,80 @@
+import json
+import threading
+
+import pytest
+
+from vm_manager import VMManager
+
+
+class FakeChannel:
+    """Scripted paramiko channel: `chatty` always has stdout ready."""
+
+    def __init__(self, stdout=b"", stderr=b"", exit_code=0, chatty=False):
+        self.stdout, self.stderr = bytearray(stdout), bytearray(stderr)
+        self.exit_code = exit_code
+        self.chatty = chatty
+        self.closed = False
+
+    def exec_command(self, command):
+        self.command = command
+
+    def recv_ready(self):
+        return self.chatty or bool(self.stdout)
+
+    def recv(self, size):
+        if self.chatty:
+            return b"y\n"
+        data = bytes(self.stdout[:size])
+        del self.stdout[:size]
+        return data
+
+    def recv_stderr_ready(self):
+        return bool(self.stderr)
+
+    def recv_stderr(self, size):
+        data = bytes(self.stderr[:size])
+        del self.stderr[:size]
+        return data
+
+    def exit_status_ready(self):
+        return not self.chatty
+
+    def recv_exit_status(self):
+        return self.exit_code
+
+    def close(self):
+        self.closed = True
+
+class FakePool:
+    def __init__(self, channel):
+        self.channel = channel
+
+    def open_session(self, server):
+        return self.channel
+
+@pytest.fixture
+def manager(tmp_path):
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps([{"id": "web", "name": "Web", "ip": "127.0.0.1", "ssh_port": 22}]))
+    return VMManager(str(path))
+
+def test_collects_both_streams_and_exit_code(manager):
+    manager.ssh_pool = FakePool(FakeChannel(b"out" * 20000, b"err", exit_code=3))
+    result = manager.run_command("web", "true")
+    assert (result["exit_code"], result["error"]) == (3, None)
+    assert result["stdout"] == "out" * 20000 and result["stderr"] == "err"
+
+def test_output_that_never_stops_still_times_out(manager):
+    channel = FakeChannel(stderr=b"warning", chatty=True)
+    manager.ssh_pool = FakePool(channel)
+    result = manager.run_command("web", "yes", timeout=0.3, max_output=100)
+    assert result["error"] == "timeout" and result["duration"] < 2
+    assert result["stderr"] == "warning" # Read while stdout kept streaming
+    assert result["truncated"] and channel.closed
+
+def test_output_that_never_stops_can_be_cancelled(manager):
+    manager.ssh_pool = FakePool(FakeChannel(chatty=True))
+    cancel = threading.Event()
+    threading.Timer(0.2, cancel.set).start()
+    result = manager.run_command("web", "yes", cancel_event=cancel, max_output=100)
+    assert result["error"] == "cancelled" and result["duration"] < 2
@@ -0,0 +1,88 @@
+import itertools
+import json
+import os
+
+from server_registry import ServerRegistry
+
+
+def entry(server_id, **fields):
+    return dict({"id": server_id, "name": server_id.upper(), "ip": "127.0.0.1", "ssh_port": 22,
+                 "vbox_uuid": f"uuid-{server_id}"}, **fields)
+
+# Distinct mtimes for successive writes, even on coarse filesystem clocks
+_mtimes = itertools.count(1)
+
+def write(path, servers):
+    with open(path, 'w') as f:
+        json.dump(servers, f)
+    mtime = next(_mtimes) * 10**9
+    os.utime(path, ns=(mtime, mtime))
+
+def test_lookup_by_id_name_and_uuid(tmp_path):
+    path = tmp_path / "config.json"
+    write(path, [entry("a"), entry("b")])
+    registry = ServerRegistry(str(path))
+    assert registry.get("a")["name"] == "A"
+    assert registry.find("B")["id"] == "b"
+    assert registry.find("uuid-a")["id"] == "a"
+    assert registry.find("A") is registry.get("a")
+    assert registry.find("nope") is None
+
+def test_reload_reports_added_changed_removed(tmp_path):
+    path = tmp_path / "config.json"
+    write(path, [entry("a"), entry("b"), entry("c")])
+    registry = ServerRegistry(str(path))
+    kept = registry.get("a")
+    kept["status"] = "running" # Runtime field, not configuration
+    old_b = registry.get("b")
+
+    write(path, [entry("a"), entry("b", ssh_port=2222), entry("d")])
+    added, changed, removed, old_entries = registry.reload()
+    assert (added, changed, removed) == (["d"], ["b"], ["c"])
+    assert set(old_entries) == {"b", "c"}
+    assert old_entries["b"] is old_b
+    assert registry.get("a") is kept # Unchanged entries keep their identity and status
+    assert registry.get("b")["ssh_port"] == 2222
+    assert registry.find("C") is None
+
+def test_reload_without_changes_is_a_no_op(tmp_path):
+    path = tmp_path / "config.json"
+    write(path, [entry("a")])
+    registry = ServerRegistry(str(path))
+    assert registry.reload() == ([], [], [], {})
+    # Rewritten with the same content: nothing reported
+    write(path, [entry("a")])
+    assert registry.reload() == ([], [], [], {})
+
+def test_broken_or_non_list_config_keeps_last_good(tmp_path):
+    path = tmp_path / "config.json"
+    write(path, [entry("a")])
+    registry = ServerRegistry(str(path))
+    for content in ("[{not json", json.dumps({"id": "a"}), json.dumps("servers")):
+        with open(path, 'w') as f:
+            f.write(content)
+        os.utime(path, ns=(10**12, 10**12))
+        assert registry.reload(force=True) == ([], [], [], {})
+        assert [s["id"] for s in registry.servers] == ["a"]
+
+def test_entries_without_id_are_ignored(tmp_path):
+    path = tmp_path / "config.json"
+    write(path, [entry("a"), {"name": "no-id"}, "junk"])
+    registry = ServerRegistry(str(path))
+    assert [s["id"] for s in registry.servers] == ["a"]
+
+def test_reload_swaps_list_and_indexes_together(tmp_path):
+    path = tmp_path / "config.json"
+    write(path, [entry("a")])
+    registry = ServerRegistry(str(path))
+    before = registry.snapshot
+
+    write(path, [entry("b")])
+    registry.reload()
+    # A reader holding the old snapshot keeps a consistent view of the old config
+    assert [s["id"] for s in before.servers] == list(before.by_id) == ["a"]
+    assert set(before.by_name) == {"A"}
+    after = registry.snapshot
+    assert after is not before
+    assert [s["id"] for s in after.servers] == list(after.by_id) == ["b"]
+    assert registry.find("B") is after.by_id["b"] and registry.find("A") is None
@@ -0,0 +1,68 @@
+import time
+
+from terminal import Screen
+
+
+def test_text_and_wrapping():
+    screen = Screen(cols=10, rows=3)
+    screen.feed("hello\r\nworld 1234567")
+    assert screen.text().split("\n") == ["hello", "world 1234", "567"]
+    assert (screen.y, screen.x) == (2, 3)
+
+def test_scrolls_at_the_bottom():
+    screen = Screen(cols=10, rows=3)
+    screen.feed("a\r\nb\r\nc\r\nd")
+    assert screen.text().split("\n") == ["b", "c", "d"]
+
+def test_cursor_movement_and_erase():
+    screen = Screen(cols=10, rows=3)
+    screen.feed("abcdef\x1b[1;3H\x1b[K")
+    assert screen.text().split("\n")[0] == "ab"
+    screen.feed("\x1b[2J\x1b[2;4HX")
+    assert screen.text().split("\n") == ["", "   X", ""]
+
+def test_sgr_and_osc_do_not_print():
+    screen = Screen(cols=20, rows=2)
+    screen.feed("\x1b]0;title\x07\x1b[1;32mgreen\x1b[0m")
+    assert screen.text().split("\n")[0] == "green"
+
+def test_alternate_screen_restores_main():
+    screen = Screen(cols=10, rows=2)
+    screen.feed("prompt$ ")
+    screen.feed("\x1b[?1049h\x1b[Htop")
+    assert screen.text().split("\n")[0] == "top"
+    screen.feed("\x1b[?1049l")
+    assert screen.text().split("\n")[0] == "prompt$"
+    assert (screen.y, screen.x) == (0, 8)
+
+def test_changes_returns_only_changed_rows():
+    screen = Screen(cols=10, rows=4)
+    v1 = screen.feed("one\r\ntwo")
+    screen.feed("\x1b[4;1Hfour")
+    delta = screen.changes(v1)
+    assert not delta["full"]
+    assert delta["lines"] == {3: "four"}
+
+def test_full_changes_include_every_row():
+    screen = Screen(cols=10, rows=4)
+    screen.feed("one")
+    delta = screen.changes(0)
+    assert delta["full"]
+    assert delta["lines"] == {0: "one", 1: "", 2: "", 3: ""}
+
+def test_stale_version_resets_without_waiting():
+    screen = Screen(cols=10, rows=2)
+    screen.feed("x")
+    started = time.time()
+    delta = screen.changes(since=1000, wait=2)
+    assert time.time() - started < 0.5
+    assert delta["full"]
+    assert delta["lines"] == {0: "x", 1: ""}
+
+def test_changes_waits_for_new_output():
+    screen = Screen(cols=10, rows=2)
+    version = screen.feed("x")
+    started = time.time()
+    delta = screen.changes(since=version, wait=0.1)
+    assert time.time() - started >= 0.1
+    assert delta["lines"] == {}
@@ -0,0 +1,41 @@
+from io import BytesIO
+
+import pytest
+
+from frame_store import Frame
+from tile_codec import KEYFRAME_DELTAS, TileEncoder
+
+Image = pytest.importorskip("PIL.Image")
+
+
+def frame(frame_id, dot=None):
+    image = Image.new("RGB", (128, 128), "black")
+    if dot is not None:
+        image.putpixel(dot, (255, 255, 255))
+    out = BytesIO()
+    image.save(out, "PNG")
+    # Timestamps far apart: an idle console's frames are old by the time it changes
+    return Frame(out.getvalue(), frame_id * 3600.0, frame_id)
+
+def test_only_changed_tiles_are_sent():
+    encoder = TileEncoder()
+    first = encoder.delta("vm", frame(1))
+    assert first["keyframe"] and len(first["tiles"]) == 4
+    second = encoder.delta("vm", frame(2, dot=(70, 5)), since=1)
+    assert not second["keyframe"]
+    assert [(t["x"], t["y"]) for t in second["tiles"]] == [(64, 0)]
+
+def test_keyframe_every_keyframe_deltas_updates():
+    encoder = TileEncoder()
+    encoder.delta("vm", frame(0))
+    keyframes = [encoder.delta("vm", frame(n, dot=(n % 128, 0)), since=n - 1)["keyframe"]
+                 for n in range(1, 2 * KEYFRAME_DELTAS + 3)]
+    assert [n for n, key in enumerate(keyframes, 1) if key] == [KEYFRAME_DELTAS + 1, 2 * KEYFRAME_DELTAS + 2]
+
+def test_unknown_or_resized_base_gets_a_keyframe():
+    encoder = TileEncoder()
+    encoder.delta("vm", frame(1))
+    assert encoder.delta("vm", frame(2), since=99)["keyframe"]
+    small = BytesIO()
+    Image.new("RGB", (64, 64)).save(small, "PNG")
+    assert encoder.delta("vm", Frame(small.getvalue(), 0, 3), since=2)["keyframe"]
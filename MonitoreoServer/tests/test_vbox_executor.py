@@ -0,0 +1,58 @@
+import threading
+import time
+
+import pytest
+
+from vbox_executor import VBoxExecutor
+
+
+def test_calls_for_one_vm_run_in_order_one_at_a_time():
+    executor = VBoxExecutor(max_workers=4)
+    order, running, overlap = [], [0], []
+    lock = threading.Lock()
+
+    def call(i):
+        with lock:
+            running[0] += 1
+            overlap.append(running[0])
+        time.sleep(0.005)
+        with lock:
+            order.append(i)
+            running[0] -= 1
+        return i
+
+    futures = [executor.submit("vm1", call, i) for i in range(20)]
+    assert [f.result(timeout=5) for f in futures] == list(range(20))
+    assert order == list(range(20))
+    assert max(overlap) == 1
+
+def test_different_vms_run_in_parallel_up_to_the_cap():
+    executor = VBoxExecutor(max_workers=2)
+    running, peak = [0], [0]
+    lock = threading.Lock()
+
+    def call():
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.05)
+        with lock:
+            running[0] -= 1
+
+    futures = [executor.submit(f"vm{i}", call) for i in range(6)]
+    for f in futures:
+        f.result(timeout=5)
+    assert peak[0] == 2
+    assert executor.waiting == 0
+    assert executor.queues == {}
+
+def test_exceptions_reach_the_caller():
+    executor = VBoxExecutor(max_workers=1)
+
+    def fail():
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError, match="boom"):
+        executor.run("vm1", fail)
+    # The VM's queue is released after a failure
+    assert executor.run("vm1", lambda: 42) == 42
@@ -0,0 +1,109 @@
+import base64
+import hashlib
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+import image_codec
+
+TILE_SIZE = 64
+# Deltas on a client's chain before it gets a full keyframe again; counted in
+# updates, not seconds, so an idle console keeps its chain
+KEYFRAME_DELTAS = 150
+# Tile hash grids remembered per VM, to diff against a client's base frame
+HISTORY_FRAMES = 60
+
+class _VMTiles:
+    def __init__(self):
+        self.hashes = OrderedDict() # {frame_id: ((width, height), [tile hashes])}
+        self.chain = {}             # {frame_id: deltas sent since the keyframe its chain started from}
+        self.image = None           # Decoded latest frame
+        self.frame_id = None
+        self.encoded = {}           # {(fmt, quality, index): base64 tile} for the latest frame
+        self.lock = threading.Lock()
+
+
+class TileEncoder:
+    """Splits console frames into TILE_SIZE tiles and sends only the tiles
+    that changed since the frame a client already has.
+
+    Unknown or resized base frames get a keyframe (every tile), and so does
+    a chain of deltas every KEYFRAME_DELTAS updates.
+    Requires Pillow.
+    """
+
+    def __init__(self, tile_size=TILE_SIZE):
+        self.tile_size = tile_size
+        self.vms = {} # {vm_name: _VMTiles}
+        self.lock = threading.Lock()
+
+    def _boxes(self, width, height):
+        ts = self.tile_size
+        return [(x, y, min(x + ts, width), min(y + ts, height))
+                for y in range(0, height, ts) for x in range(0, width, ts)]
+
+    def _ingest(self, vm, frame):
+        # Decode and hash the tiles of a frame once, however many clients ask
+        if vm.frame_id == frame.frame_id:
+            return
+        image = image_codec.Image.open(BytesIO(frame.data)).convert("RGB")
+        size = image.size
+        hashes = [hashlib.blake2b(image.crop(box).tobytes(), digest_size=8).digest()
+                  for box in self._boxes(*size)]
+        vm.hashes[frame.frame_id] = (size, hashes)
+        while len(vm.hashes) > HISTORY_FRAMES:
+            old_id, _ = vm.hashes.popitem(last=False)
+            vm.chain.pop(old_id, None)
+        vm.image, vm.frame_id, vm.encoded = image, frame.frame_id, {}
+
+    def delta(self, vm_name, frame, since=None, fmt="png", quality=image_codec.DEFAULT_QUALITY):
+        """Changed tiles of frame relative to the client's frame `since`."""
+        with self.lock:
+            vm = self.vms.setdefault(vm_name, _VMTiles())
+
+        with vm.lock:
+            self._ingest(vm, frame)
+            size, hashes = vm.hashes[frame.frame_id]
+            base = vm.hashes.get(since)
+            deltas = vm.chain.get(since)
+            keyframe = (base is None or base[0] != size or deltas is None
+                        or deltas >= KEYFRAME_DELTAS)
+            deltas = 0 if keyframe else deltas + 1
+            # Clients reaching this frame from different chains share the shortest one
+            vm.chain[frame.frame_id] = min(deltas, vm.chain.get(frame.frame_id, deltas))
+
+            boxes = self._boxes(*size)
+            tiles = []
+            for index, box in enumerate(boxes):
+                if not keyframe and base[1][index] == hashes[index]:
+                    continue
+                key = (fmt, quality, index)
+                data = vm.encoded.get(key)
+                if data is None:
+                    data = self._encode(vm.image.crop(box), fmt, quality)
+                    vm.encoded[key] = data
+                tiles.append({"x": box[0], "y": box[1], "data": data})
+
+        return {
+            "frame_id": frame.frame_id,
+            "width": size[0],
+            "height": size[1],
+            "tile_size": self.tile_size,
+            "keyframe": keyframe,
+            "mimetype": image_codec.FORMATS[fmt][1],
+            "tiles": tiles,
+        }
+
+    @staticmethod
+    def _encode(tile, fmt, quality):
+        out = BytesIO()
+        pil_format = image_codec.FORMATS[fmt][0]
+        if pil_format == "PNG":
+            tile.save(out, "PNG")
+        else:
+            tile.save(out, pil_format, quality=quality)
+        return base64.b64encode(out.getvalue()).decode('ascii')
+
+    def forget(self, vm_name):
+        with self.lock:
+            self.vms.pop(vm_name, None)
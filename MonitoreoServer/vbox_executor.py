@@ -0,0 +1,68 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+import profiler
+
+class VBoxExecutor:
+    """Bounded worker pool for VBoxManage calls with per-VM ordering.
+
+    Calls for the same VM run one at a time, in submission order. Calls for
+    different VMs run in parallel, at most max_workers at once. Calls without
+    a VM (global listings) only count against the global cap.
+    """
+
+    def __init__(self, max_workers=4):
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="vbox")
+        self.queues = {} # {vm: deque of pending calls}; present while the VM is busy
+        self.waiting = 0 # Calls submitted but not started yet (queue depth)
+        self.lock = threading.Lock()
+
+    def submit(self, vm, fn, *args, **kwargs):
+        future = Future()
+        # The submitting request's trace follows the call onto the worker
+        call = (fn, args, kwargs, future, profiler.current(), time.perf_counter())
+        with self.lock:
+            self.waiting += 1
+        if vm is None:
+            self.pool.submit(self._call, call)
+            return future
+
+        with self.lock:
+            queue = self.queues.get(vm)
+            idle = queue is None
+            if idle:
+                queue = self.queues[vm] = deque()
+            queue.append(call)
+        if idle:
+            self.pool.submit(self._drain, vm)
+        return future
+
+    def run(self, vm, fn, *args, **kwargs):
+        """Submit and wait; exceptions from fn are re-raised in the caller."""
+        return self.submit(vm, fn, *args, **kwargs).result()
+
+    def _drain(self, vm):
+        with self.lock:
+            call = self.queues[vm].popleft()
+        self._call(call)
+        # Hand the VM's next call back to the pool instead of looping here,
+        # so one busy VM can't monopolize a worker
+        with self.lock:
+            if self.queues[vm]:
+                self.pool.submit(self._drain, vm)
+            else:
+                del self.queues[vm]
+
+    def _call(self, call):
+        fn, args, kwargs, future, trace, submitted = call
+        with self.lock:
+            self.waiting -= 1
+        if not future.set_running_or_notify_cancel():
+            return
+        with profiler.activate(trace):
+            profiler.record("lock_wait", time.perf_counter() - submitted)
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
@@ -0,0 +1,64 @@
+import threading
+import time
+from collections import deque
+
+# VBoxManage calls remembered for /api/vbox/trace
+TRACE_CAPACITY = 1000
+# stderr kept per call (characters)
+MAX_TRACE_STDERR = 500
+
+class VBoxTrace:
+    """Ring buffer of recent VBoxManage calls as structured events.
+
+    Each event records the arguments, the VM, how long the call waited for a
+    worker (per-VM ordering and the global cap), the process runtime, exit
+    code and stderr, so contention shows up as queue wait rather than as
+    mysteriously slow VirtualBox commands.
+    """
+
+    def __init__(self, capacity=TRACE_CAPACITY):
+        self.events = deque(maxlen=capacity)
+        self.seq = 0
+        self.lock = threading.Lock()
+
+    def record(self, args, vm, subcommand, queue_wait, runtime, exit_code=None, stderr="", error=None):
+        with self.lock:
+            self.seq += 1
+            event = {
+                "seq": self.seq,
+                "time": time.time(),
+                "args": list(args),
+                "vm": vm,
+                "subcommand": subcommand,
+                "queue_wait_ms": round(queue_wait * 1000, 1),
+                "runtime_ms": round(runtime * 1000, 1),
+                "exit_code": exit_code,
+                "stderr": (stderr or "")[-MAX_TRACE_STDERR:],
+                "error": error,
+            }
+            self.events.append(event)
+        return event
+
+    def recent(self, limit=100, vm=None, since=0):
+        """Newest-last events after sequence number `since`, optionally for one VM."""
+        with self.lock:
+            events = [e for e in self.events if e["seq"] > since and (vm is None or e["vm"] == vm)]
+        return events[-limit:] if limit else events
+
+    def summary(self, events=None):
+        """Per-subcommand count, failures and mean/max queue wait and runtime."""
+        if events is None:
+            events = self.recent(limit=0)
+        groups = {}
+        for e in events:
+            g = groups.setdefault(e["subcommand"], {"calls": 0, "failed": 0, "queue_wait_ms": [], "runtime_ms": []})
+            g["calls"] += 1
+            if e["error"] or e["exit_code"] not in (0, None):
+                g["failed"] += 1
+            g["queue_wait_ms"].append(e["queue_wait_ms"])
+            g["runtime_ms"].append(e["runtime_ms"])
+        for g in groups.values():
+            for key in ("queue_wait_ms", "runtime_ms"):
+                values = g.pop(key)
+                g[key] = {"mean": round(sum(values) / len(values), 1), "max": max(values)}
+        return groups
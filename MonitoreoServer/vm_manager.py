@@ -1,75 +1,253 @@
 import subprocess
 import paramiko
-import json
+import os
+import socket
+import tempfile
 import time
-from threading import Lock
+from threading import Lock, Thread
+from ssh_pool import SSHPool
+from proc_sampler import ProcSampler, STATS_COMMAND
+from agent_stream import AgentManager
+from vbox_executor import VBoxExecutor
+from server_registry import ServerRegistry, CONFIG_RELOAD_INTERVAL
+from vbox_trace import VBoxTrace
+import profiler
+from metrics import VBOX_COMMAND_SECONDS, VBOX_COMMAND_ERRORS, SSH_SECONDS, SSH_ERRORS, CACHE_REQUESTS
 
 # You might need to adjust this path if VBoxManage is not in system PATH
-VBOX_MANAGE_CMD = r"C:\Program Files\Oracle\VirtualBox\VBoxManage.exe"
+# (or set the VBOX_MANAGE_CMD environment variable, as bench/run_bench.py does)
+VBOX_MANAGE_CMD = os.environ.get("VBOX_MANAGE_CMD", r"C:\Program Files\Oracle\VirtualBox\VBoxManage.exe")
+
+# Scratch location for VBoxManage screenshots (tmpfs when available); files
+# only live for the duration of one capture
+SCREENSHOT_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+
+# Seconds a bulk VM state listing is reused by all callers
+STATUS_TTL = 2.0
+
+# Seconds a stats exec may take before the sample counts as failed
+STATS_TIMEOUT = 10
+
+# Maximum number of VBoxManage processes running at once (across all VMs)
+VBOX_MAX_WORKERS = 4
+
+# Subcommands whose first argument is the target VM (serialized per VM)
+VM_SUBCOMMANDS = ("startvm", "controlvm", "showvminfo", "modifyvm", "unregistervm",
+                  "snapshot", "storagectl", "storageattach", "unattended")
+
+# `list --long vms` state text -> dashboard status
+VBOX_STATES = {
+    "running": "running",
+    "powered off": "stopped",
+    "saved": "saved",
+    "paused": "paused",
+}
 
 class VMManager:
-    def __init__(self, config_path="config.json"):
+    def __init__(self, config_path="config.json", stats_mode="exec", agent_interval=1.0):
         self.config_path = config_path
-        self.servers = self._load_config()
-        self.vbox_lock = Lock() # Serialize VBoxManage calls
+        self.registry = ServerRegistry(config_path) # O(1) lookups, reloaded when config.json changes
+        self.reload_listeners = [] # Called with (server ids, {id: previous entry}) on config changes
+        self.watcher = None
+        self.vbox = VBoxExecutor(max_workers=VBOX_MAX_WORKERS) # Per-VM ordered, globally capped
+        self.vbox_trace = VBoxTrace() # Recent VBoxManage calls with queue wait and runtime
+        self.status_lock = Lock() # Single refresh of the bulk state cache at a time
+        self.status_cache = None # {vm name or uuid: status}
+        self.status_cache_time = 0
+        self.ssh_pool = SSHPool() # Shared keep-alive SSH transports
+        self.proc_sampler = ProcSampler() # Keeps previous CPU counters per server
+        # "agent" streams samples from a collector pushed to each guest; "exec" samples per call
+        self.stats_mode = stats_mode
+        self.agents = AgentManager(self.ssh_pool, interval=agent_interval) if stats_mode == "agent" else None
+
+    @staticmethod
+    def _vbox_target(args):
+        # VM a command acts on, e.g. ["controlvm", "<vm>", ...]; None for global commands
+        if args and args[0] == "unattended" and len(args) > 2:
+            return args[2]
+        if len(args) > 1 and args[0] in VM_SUBCOMMANDS:
+            return args[1]
+        return None
+
+    @staticmethod
+    def _vbox_subcommand(args):
+        # Metric label: "list", "showvminfo", "controlvm screenshotpng", ...
+        if args and args[0] == "controlvm" and len(args) > 2:
+            return f"controlvm {args[2]}"
+        return args[0] if args else ""
+
+    @staticmethod
+    def _traced_args(args):
+        # Typed text may be a password: keep only its length in the trace
+        if len(args) > 3 and args[0] == "controlvm" and args[2] == "keyboardputstring":
+            return args[:3] + [f"<{len(args[3])} chars>"]
+        # Unattended installs (provisioner.py) pass the guest password inline
+        return ["--password=<redacted>" if a.startswith("--password=") else a for a in args]
+
+    def _vbox_call(self, args, submitted, check=False):
+        """Run one VBoxManage process on a VBoxExecutor worker and trace it.
+
+        Every VBoxManage invocation goes through here, so each one shows up in
+        vbox_trace with its queue wait (submitted -> started) and in /metrics.
+        """
+        vm = self._vbox_target(args)
+        subcommand = self._vbox_subcommand(args)
+        started = time.perf_counter()
+        result = None
+        try:
+            with profiler.span("subprocess"):
+                result = subprocess.run([VBOX_MANAGE_CMD] + args, capture_output=True, text=True)
+        except Exception as e:
+            VBOX_COMMAND_ERRORS.inc(subcommand=subcommand)
+            self.vbox_trace.record(self._traced_args(args), vm, subcommand, started - submitted,
+                                   time.perf_counter() - started, error=str(e))
+            raise
+        finally:
+            VBOX_COMMAND_SECONDS.observe(time.perf_counter() - started, subcommand=subcommand)
+        self.vbox_trace.record(self._traced_args(args), vm, subcommand, started - submitted,
+                               time.perf_counter() - started, result.returncode, result.stderr)
+        if result.returncode != 0:
+            VBOX_COMMAND_ERRORS.inc(subcommand=subcommand)
+            if check:
+                raise subprocess.CalledProcessError(result.returncode, [VBOX_MANAGE_CMD] + args,
+                                                    result.stdout, result.stderr)
+        return result
 
     def _run_vbox(self, args):
-        """Helper to run VBoxManage with locking"""
-        with self.vbox_lock:
-            return subprocess.run([VBOX_MANAGE_CMD] + args, capture_output=True, text=True)
+        """Helper to run VBoxManage, serialized per VM on the bounded executor"""
+        return self.vbox.run(self._vbox_target(args), self._vbox_call, args, time.perf_counter())
 
     def _run_vbox_check(self, args):
-        """Helper to run VBoxManage with locking and check=True behavior"""
-        with self.vbox_lock:
-            subprocess.run([VBOX_MANAGE_CMD] + args, check=True)
+        """Helper to run VBoxManage per VM on the bounded executor, with check=True behavior"""
+        self.vbox.run(self._vbox_target(args), self._vbox_call, args, time.perf_counter(), check=True)
+
+    @property
+    def servers(self):
+        return self.registry.servers
+
+    def find_server(self, key):
+        """Server entry by id, VirtualBox name or vbox_uuid."""
+        return self.registry.find(key)
+
+    def reload_config(self, force=False):
+        """Apply config.json changes; returns {"added", "changed", "removed"} server ids.
+
+        Only servers whose entry changed or disappeared lose their pooled SSH
+        connection, CPU counters, agent and (through reload_listeners) shell
+        sessions and cached frames; everything else keeps running untouched.
+        """
+        added, changed, removed, old_entries = self.registry.reload(force)
+        if not (added or changed or removed):
+            return {"added": [], "changed": [], "removed": []}
+        affected = changed + removed
+        for server_id in affected:
+            self.ssh_pool.invalidate(server_id)
+            self.proc_sampler.forget(server_id)
+            if self.agents is not None:
+                self.agents.stop(server_id)
+        # Names or uuids may have changed: re-list VM states on the next call
+        self._invalidate_status()
+        for listener in self.reload_listeners:
+            try:
+                listener(affected, old_entries)
+            except Exception as e:
+                print(f"Error applying config change: {e}")
+        print(f"Config reloaded: {len(added)} added, {len(changed)} changed, {len(removed)} removed")
+        return {"added": added, "changed": changed, "removed": removed}
 
-    def _load_config(self):
+    def start_config_watcher(self, interval=CONFIG_RELOAD_INTERVAL):
+        """Poll config.json in the background and apply changes without a restart."""
+        if self.watcher is not None and self.watcher.is_alive():
+            return
+        def watch():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.reload_config()
+                except Exception as e:
+                    print(f"Error reloading config: {e}")
+        self.watcher = Thread(target=watch, name="config-watcher", daemon=True)
+        self.watcher.start()
+
+    def get_servers(self):
+        # Update status for each server from a single bulk listing
         try:
-            with open(self.config_path, 'r') as f:
-                return json.load(f)
+            states = self._get_vbox_states()
+        except FileNotFoundError:
+            states = None
+            fallback = "error_vbox_missing"
         except Exception as e:
-            print(f"Error loading config: {e}")
-            return []
+            print(f"Error listing VM states: {e}")
+            states = None
+            fallback = "error"
 
-    def get_servers(self):
-        # Update status for each server
         for server in self.servers:
-            server['status'] = self._get_vbox_status(server.get('name'))
+            if states is None:
+                server['status'] = fallback
+            else:
+                # Unregistered VMs are "unknown", as when showvminfo fails for them
+                server['status'] = states.get(server.get('name')) or states.get(server.get('vbox_uuid')) or "unknown"
         return self.servers
 
-    def get_server_config(self):
-        # Return servers without checking status (instant)
-        return self.servers
+    def _get_vbox_states(self):
+        """Status of every registered VM from one `list --long vms` call.
 
-    def _get_vbox_status(self, vm_name):
+        The result is shared by all callers for STATUS_TTL seconds; concurrent
+        callers wait for the in-flight refresh instead of spawning their own.
+        """
+        with profiler.span("lock_wait"):
+            self.status_lock.acquire()
         try:
-            # list running vms to check if it's running
-            result = self._run_vbox(["showvminfo", vm_name, "--machinereadable"])
-            
+            if self.status_cache is not None and time.time() - self.status_cache_time < STATUS_TTL:
+                CACHE_REQUESTS.inc(cache="status", result="hit")
+                return self.status_cache
+            CACHE_REQUESTS.inc(cache="status", result="miss")
+
+            result = self._run_vbox(["list", "--long", "vms"])
             if result.returncode != 0:
-                print(f"Error checking VM info for {vm_name}: {result.stderr}")
-                return "unknown"
-            
-            # Simple check in output
-            if 'VMState="running"' in result.stdout:
-                return "running"
-            elif 'VMState="poweredoff"' in result.stdout:
-                return "stopped"
-            elif 'VMState="saved"' in result.stdout:
-                return "saved"
-            elif 'VMState="paused"' in result.stdout:
-                return "paused"
-            else:
-                return "stopped" # Default fallback
-        except FileNotFoundError:
-            return "error_vbox_missing"
-        except Exception as e:
-            print(f"Error checking status for {vm_name}: {e}")
-            return "error"
+                raise RuntimeError(result.stderr.strip())
+
+            self.status_cache = self._parse_vm_states(result.stdout)
+            self.status_cache_time = time.time()
+            return self.status_cache
+        finally:
+            self.status_lock.release()
+
+    @staticmethod
+    def _parse_vm_states(output):
+        states = {}
+        name = uuid = None
+        for line in output.splitlines():
+            # Top-level keys only: snapshot and NIC details are indented, and
+            # shared folders use "Name: '<share>', ..."
+            if line.startswith("Name:"):
+                value = line[len("Name:"):].strip()
+                if not value.startswith("'"):
+                    name, uuid = value, None
+            elif line.startswith("UUID:") and name and uuid is None:
+                uuid = line[len("UUID:"):].strip()
+            elif line.startswith("State:") and name:
+                state = line[len("State:"):].split("(")[0].strip()
+                status = VBOX_STATES.get(state, "stopped") # Default fallback
+                states[name] = status
+                if uuid:
+                    states[uuid] = status
+                name = None
+        return states
+
+    def _invalidate_status(self):
+        # Force the next get_servers() to see the effect of a power operation
+        with self.status_lock:
+            self.status_cache = None
+
+    def get_server_config(self):
+        # Return servers without checking status (instant)
+        return self.servers
 
     def start_vm(self, vm_name):
         try:
             self._run_vbox_check(["startvm", vm_name, "--type", "headless"])
+            self._invalidate_status()
             return True, "VM started"
         except Exception as e:
             return False, str(e)
@@ -78,137 +256,157 @@ class VMManager:
         try:
             # Try ACPI shutdown first for graceful exit
             self._run_vbox_check(["controlvm", vm_name, "acpipowerbutton"])
+            self._invalidate_status()
             return True, "ACPI Shutdown signal sent"
         except Exception as e:
             try:
                 # Force poweroff if needed
                 self._run_vbox_check(["controlvm", vm_name, "poweroff"]) 
+                self._invalidate_status()
                 return True, "VM Forced Poweroff"
             except Exception as e2:
                 return False, str(e2)
 
     def restart_vm(self, vm_name):
         try:
+            # Usage: VBoxManage controlvm <uuid|vmname> reset
             self._run_vbox_check(["controlvm", vm_name, "reset"])
+            self._invalidate_status()
             return True, "VM Restarted (Reset)"
         except Exception as e:
             return False, str(e)
 
-    def take_screenshot(self, vm_name):
-        try:
-            # Save to current directory as <vm_name>.png
-            filename = f"{vm_name}.png"
-            # VBoxManage controlvm <uuid|vmname> screenshotpng <filename>
-            subprocess.run([VBOX_MANAGE_CMD, "controlvm", vm_name, "screenshotpng", filename], check=True)
-            return filename
-        except Exception as e:
-            print(f"Error taking screenshot for {vm_name}: {e}")
-            return None
-
-    def get_ssh_client(self, server_config):
-        client = paramiko.SSHClient()
-        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        try:
-            # Prioritize key auth if path provided
-            if server_config.get('ssh_key_path'):
-                 client.connect(server_config['ip'], port=server_config.get('ssh_port', 22), 
-                                username=server_config['ssh_user'], 
-                                key_filename=server_config['ssh_key_path'], timeout=3)
-            else:
-                client.connect(server_config['ip'], port=server_config.get('ssh_port', 22),
-                               username=server_config['ssh_user'], 
-                               password=server_config['ssh_password'], timeout=3)
-            return client
-        except Exception as e:
-            print(f"SSH Connect Error to {server_config['ip']}: {e}")
-            return None
-
     def get_stats(self, server_id):
-        server = next((s for s in self.servers if s['id'] == server_id), None)
+        server = self.find_server(server_id)
         if not server:
             return None
+        server_id = server['id']
         
+        if self.agents is not None:
+            stats = self.agents.get_stats(server)
+            if stats is not None:
+                return stats
+            # No fresh streamed sample (agent starting, redeploying or unsupported): exec path
+
         # Only try SSH if VM is running (check vbox status first or assume from caller)
         # But for valid stats, we need SSH
-        client = self.get_ssh_client(server)
-        if not client:
+        try:
+            # Pooled client: exec_command below opens a channel on it
+            self.ssh_pool.get_client(server)
+        except Exception as e:
+            print(f"SSH Connect Error to {server['ip']}: {e}")
             return {"cpu": 0, "ram": 0, "disk": 0, "error": "SSH Connection Failed"}
 
         try:
-            # Multi-command to get stats
-            # 1. CPU: usage from top (batch mode, 1 iteration) or parsing /proc/stat (harder). 
-            # Simple approach: top -bn1 | grep "Cpu(s)" | sed "s/.*, *\([0-9.]*\)%* id.*/\1/" | awk '{print 100 - $1}'
-            # 2. Memory: free -m | awk 'NR==2{printf "%.2f", $3*100/$2 }'
-            # 3. Disk: df -h / | awk 'NR==2 {print $5}' | sed 's/%//'
-            
-            cmd_cpu = "top -bn1 | grep 'Cpu(s)' | awk '{print $2 + $4}'" # us + sy
-            cmd_mem = "free -m | awk 'NR==2{printf \"%.2f\", $3*100/$2 }'"
-            cmd_disk = "df -h / | awk 'NR==2 {print $5}' | sed 's/%//'"
-
-            stdin, stdout, stderr = client.exec_command(f"{cmd_cpu}; {cmd_mem}; {cmd_disk}")
-            output = stdout.read().decode().strip().split('\n')
-            
-            cpu = float(output[0]) if len(output) > 0 and output[0] else 0
-            ram = float(output[1]) if len(output) > 1 and output[1] else 0
-            disk = float(output[2]) if len(output) > 2 and output[2] else 0
-
-            return {"cpu": cpu, "ram": ram, "disk": disk}
+            # One lightweight exec reading /proc/stat, /proc/meminfo and statfs(/);
+            # ProcSampler turns it into percentages (CPU from counter deltas)
+            started = time.perf_counter()
+            stdout = None
+            with profiler.span("ssh_exec"):
+                # The channel timeout bounds every read: a hung guest can't block the caller
+                stdin, stdout, stderr = self.ssh_pool.exec_command(server, STATS_COMMAND, timeout=STATS_TIMEOUT)
+                stdout.channel.settimeout(STATS_TIMEOUT)
+                output = stdout.read().decode()
+            SSH_SECONDS.observe(time.perf_counter() - started, server=server_id, phase="exec")
+        except socket.timeout:
+            # The guest is slow, not the transport: keep it for the shells sharing it
+            SSH_ERRORS.inc(server=server_id, phase="exec")
+            if stdout is not None:
+                stdout.channel.close()
+            return {"cpu": 0, "ram": 0, "disk": 0, "error": f"Stats timed out after {STATS_TIMEOUT}s"}
+        except (paramiko.SSHException, EOFError, OSError) as e:
+            # Only a broken transport is dropped; shells share it
+            SSH_ERRORS.inc(server=server_id, phase="exec")
+            self.ssh_pool.invalidate(server_id)
+            return {"cpu": 0, "ram": 0, "disk": 0, "error": str(e)}
 
+        try:
+            return self.proc_sampler.parse(server_id, output)
         except Exception as e:
-            return {"cpu": 0, "ram": 0, "disk": 0, "error": str(e)}
-        finally:
-            client.close()
+            return {"cpu": 0, "ram": 0, "disk": 0, "error": f"Unexpected stats output: {e}"}
+
+    def run_command(self, server_id, command, timeout=None, cancel_event=None, max_output=None):
+        """Run a command on a new channel with an optional timeout and cancellation.
 
-    def execute_command(self, server_id, command):
-        server = next((s for s in self.servers if s['id'] == server_id), None)
+        Returns {"exit_code", "stdout", "stderr", "duration", "error", "truncated"};
+        error is None on normal completion. When max_output is given only the
+        last max_output bytes of each stream are kept.
+        """
+        result = {"exit_code": None, "stdout": "", "stderr": "", "duration": 0, "error": None, "truncated": False}
+        server = self.find_server(server_id)
         if not server:
-            return "Server not found"
-        
-        client = self.get_ssh_client(server)
-        if not client:
-            return "Could not connect via SSH"
+            result["error"] = "Server not found"
+            return result
 
+        started = time.time()
         try:
-            stdin, stdout, stderr = client.exec_command(command)
-            out = stdout.read().decode()
-            err = stderr.read().decode()
-            client.close()
-            return out + err
+            channel = self.ssh_pool.open_session(server)
         except Exception as e:
-            client.close()
-            return f"Error executing command: {e}"
+            result["error"] = f"Could not connect via SSH: {e}"
+            return result
 
-    def restart_vm(self, vm_name):
+        out, err = bytearray(), bytearray()
         try:
-            # Usage: VBoxManage controlvm <uuid|vmname> reset
-            subprocess.run([VBOX_MANAGE_CMD, "controlvm", vm_name, "reset"], check=True)
-            return True, "VM Restarted (Reset)"
+            channel.exec_command(command)
+            while True:
+                # Drain both streams every pass, then check for the end: a
+                # command that never stops printing still times out / cancels
+                received = False
+                if channel.recv_ready():
+                    out += channel.recv(32768)
+                    received = True
+                if channel.recv_stderr_ready():
+                    err += channel.recv_stderr(32768)
+                    received = True
+                if not received and channel.exit_status_ready():
+                    result["exit_code"] = channel.recv_exit_status()
+                    break
+                if cancel_event is not None and cancel_event.is_set():
+                    result["error"] = "cancelled"
+                    break
+                if timeout and time.time() - started > timeout:
+                    result["error"] = "timeout"
+                    break
+                if not received:
+                    time.sleep(0.05)
+                if max_output:
+                    for buf in (out, err):
+                        if len(buf) > max_output:
+                            del buf[:len(buf) - max_output]
+                            result["truncated"] = True
         except Exception as e:
-            return False, str(e)
+            result["error"] = f"Error executing command: {e}"
+        finally:
+            # Closing the channel also stops a timed out / cancelled command's I/O
+            channel.close()
+
+        result["stdout"] = out.decode('utf-8', errors='replace')
+        result["stderr"] = err.decode('utf-8', errors='replace')
+        result["duration"] = round(time.time() - started, 3)
+        profiler.record("ssh_exec", time.time() - started)
+        if result["error"] is None:
+            SSH_SECONDS.observe(time.time() - started, server=server_id, phase="exec")
+        elif result["error"] != "cancelled":
+            SSH_ERRORS.inc(server=server_id, phase="exec")
+        return result
 
     def get_screenshot(self, vm_name):
+        """Capture the VM screen and return the PNG bytes (None if not possible)"""
+        fd, path = tempfile.mkstemp(prefix=f"screenshot_{vm_name}_", suffix=".png", dir=SCREENSHOT_DIR)
+        os.close(fd)
         try:
-            import os
-            import time
-            # Save to current directory temporarily with unique name
-            # Format: screenshot_<vm_name>_<timestamp>.png
-            timestamp = int(time.time() * 1000)
-            filename = f"screenshot_{vm_name}_{timestamp}.png"
-            path = os.path.abspath(filename)
-            
-            # Remove old screenshots for this VM first to avoid bloat
-            # (In a real app, maybe use a temp dir or cleaner)
-            # For now, we rely on server.py to delete after send, 
-            # OR we just let them accumulate and clean up periodically?
-            # Better: clean up old ones here? No, expensive.
-            # Best: server.py handles cleanup after sending.
-            
             # VBoxManage controlvm <uuid|vmname> screenshotpng <filename>
             self._run_vbox_check(["controlvm", vm_name, "screenshotpng", path])
-            return path
+            with open(path, 'rb') as f:
+                return f.read()
         except Exception as e:
             # It might fail if VM is not running
             return None
+        finally:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
 
     def type_text(self, vm_name, text):
         try: